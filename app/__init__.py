@@ -4,22 +4,57 @@ from config import config
 from flask_cors import CORS
 from flask_bcrypt import Bcrypt
 from flask_jwt_extended import JWTManager
+from werkzeug.middleware.proxy_fix import ProxyFix
+from app.json_provider import (
+    orjson,
+    ORJSONProvider
+)
+from commands import (
+    init_db,
+    seed_admin,
+    purge_tokens,
+    sweep_uploads,
+    reindex_search
+)
+from metrics import Metrics
+from compression import Compressor
+from uploads import stat_cache
+from cleanup import file_reaper
+from portfolio import portfolio
+from passwords import PasswordHasher
 
 bcrypt = Bcrypt()
 jwt = JWTManager()
+hasher = PasswordHasher()
+metrics = Metrics()
+compressor = Compressor()
 
 
 def create_app(app_env: str) -> Flask:
     app = Flask(__name__)
     app.url_map.strict_slashes = False
     app.config.from_object(config[app_env])
+    if app.config['JSON_PROVIDER'] == 'orjson' and orjson:
+        app.json = ORJSONProvider(app)
+
+    hops = app.config['PROXY_TRUSTED_HOPS']
+    if hops:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=hops, x_proto=hops, x_host=hops)
 
     db.init_app(app)
     jwt.init_app(app)
     bcrypt.init_app(app)
+    hasher.init_app(app)
+    metrics.init_app(app)
+    compressor.init_app(app)
+    portfolio.init_app(app)
+    file_reaper.init_app(app)
+    stat_cache.configure(app.config['IMAGE_STAT_CACHE_SIZE'], app.config['IMAGE_STAT_TTL'])
     CORS(app, supports_credentials=True)
-
-    with app.app_context():
-        db.create_all()
+    app.cli.add_command(init_db)
+    app.cli.add_command(seed_admin)
+    app.cli.add_command(purge_tokens)
+    app.cli.add_command(sweep_uploads)
+    app.cli.add_command(reindex_search)
 
     return app
@@ -3,31 +3,35 @@ load_dotenv()
 
 from os import getenv
 from storage import db
-from app import create_app
+from app import (
+    metrics,
+    create_app
+)
 from exc import AbortException
+from conditional import (
+    content_etag,
+    conditional_response
+)
 from flask.typing import ResponseReturnValue
 from flask import (
     abort,
     jsonify,
-    request
+    request,
+    Response,
+    stream_with_context
 )
 
 from validations import (
+    bind,
+    bind_fields,
     LoginSchema,
     ProjectSchema,
     CompanySchema,
     PasswordSchema,
-    validate_input
+    validate_items
 )
 
 app = create_app(getenv('CONFIG') or 'default')
-with app.app_context():
-    from models import User
-
-    db.create_all()
-    admin = db.get(User, email=getenv('ADMIN_EMAIL'))
-    if not admin:
-        admin = db.save_new(User)
 
 
 # HTTP Error Handlers
@@ -61,6 +65,16 @@ def method_not_allowed(_: Exception) -> ResponseReturnValue:
     }), 405
 
 
+@app.errorhandler(413)
+def payload_too_large(_: Exception) -> ResponseReturnValue:
+    return jsonify({
+        'status': 'fail',
+        'data': {
+            'error': 'request is too large'
+        }
+    }), 413
+
+
 @app.errorhandler(401)
 def unathorized(_: Exception) -> ResponseReturnValue:
     return jsonify({
@@ -84,24 +98,70 @@ def abort_error(err: Exception) -> ResponseReturnValue:
 @app.route('/status', methods=['GET'])
 def app_status() -> ResponseReturnValue:
     """
-    Get the status of the application
+    Get the status of the application, with database and pool checks
+    when deep=true is passed
     """
+    data = {
+        'app_status': 'your app is active',
+        'cache': db.cache.stats()
+    }
+    if db.shared_cache:
+        data['shared_cache'] = db.shared_cache.stats()
+    if request.args.get('deep') != 'true':
+        return jsonify({
+            'status': 'success',
+            'data': data
+        }), 200
+
+    data['database'] = db.health()
+    if 'error' in data['database']:
+        return jsonify({
+            'status': 'fail',
+            'data': data
+        }), 503
+
     return jsonify({
         'status': 'success',
-        'data': {
-            'app_status': 'your app is active'
-        }
+        'data': data
     }), 200
 
 
+@app.route('/metrics', methods=['GET'])
+def get_metrics() -> ResponseReturnValue:
+    """
+    Expose request, database and cache metrics in Prometheus text format
+    """
+    gauges = {f'cache_{name}': value for name, value in db.cache.stats().items()}
+    if db.shared_cache:
+        gauges.update({f'shared_cache_{name}': value for name, value in db.shared_cache.stats().items()})
+    return metrics.render(gauges), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+
 #app views
-import os
+from search import search
+from changes import changes_since
+from portfolio import portfolio
+from datetime import datetime
+from typing import (
+    Dict,
+    Tuple,
+    Optional
+)
+from uploads import (
+    serve_upload,
+    store_upload
+)
 from models import (
+    User,
     Company,
     Project,
     InvalidToken
 )
 
+from auth import (
+    Auth,
+    blocklist
+)
 from flask_jwt_extended import (
     get_jwt,
     jwt_required,
@@ -111,14 +171,13 @@ from flask_jwt_extended import (
 
 @app.route('/login', methods=['POST'])
 def login() -> ResponseReturnValue:
-    from auth import Auth
-
-    form_data = request.form.to_dict()
-    if not validate_input(LoginSchema, **form_data):
-        abort(422)
-
+    credentials = bind(LoginSchema)
     auth = Auth()
-    user = auth.authenticate_user(form_data['email'], form_data['password'])
+    user = auth.authenticate_user(
+        credentials.email,
+        credentials.password,
+        request.remote_addr
+    )
     access_token = create_access_token(identity=user.id)
     return jsonify({
         'status': 'success',
@@ -132,8 +191,10 @@ def logout() -> ResponseReturnValue:
     """
     Log out user
     """
-    jti = get_jwt()['jti']
-    db.save_new(InvalidToken, jti=jti)
+    token = get_jwt()
+    expires_at = datetime.fromtimestamp(token['exp']) if 'exp' in token else None
+    db.save_new(InvalidToken, jti=token['jti'], expires_at=expires_at)
+    blocklist.add(token['jti'], expires_at)
 
     return jsonify({
         'status': 'success',
@@ -144,17 +205,15 @@ def logout() -> ResponseReturnValue:
 @app.route('/change-password', methods=['POST'])
 @jwt_required()
 def change_password() -> ResponseReturnValue:
-    from auth import Auth
     from flask_jwt_extended import get_jwt_identity
 
-    form_data = request.form.to_dict()
-    if not validate_input(PasswordSchema, **form_data):
-        abort(422)
-
+    passwords = bind(PasswordSchema)
     auth = Auth()
-    user = db.get(User, id=get_jwt_identity())
-    user = auth.authenticate_user(user.email, form_data['current_password'])
-    user = db.update(User, id=user.id, password=form_data['new_password'])
+    with db.unit_of_work():
+        user = db.get(User, id=get_jwt_identity())
+        user = auth.authenticate_user(user.email, passwords.current_password)
+        user = db.update(User, id=user.id, password=passwords.new_password)
+
     return jsonify({
         'status': 'success',
         'data': {
@@ -163,46 +222,192 @@ def change_password() -> ResponseReturnValue:
     }), 200
 
 
-@app.route('/companies/<string:id>', methods=['GET'])
-def get_a_company(id: str) -> ResponseReturnValue:
-    company = db.get(Company, id=id)
-    if not company:
+def get_fields(model_type: type) -> Optional[Tuple[str, ...]]:
+    """
+    Read the sparse fieldset requested with ?fields=a,b, in column order
+    so that every ordering of the same fields shares one serializer and
+    one cache entry
+    """
+    fields = request.args.get('fields')
+    if fields is None:
+        return None
+
+    requested = {name.strip() for name in fields.split(',') if name.strip()}
+    serializable = model_type.serializable_fields()
+    if not requested or not requested <= set(serializable):
+        abort(422)
+
+    return tuple(name for name in serializable if name in requested)
+
+
+def get_one(model_type: type, id: str) -> ResponseReturnValue:
+    """
+    Return a single model, served from the read cache when possible
+    """
+    fields = get_fields(model_type)
+
+    def load():
+        columns = fields and {*fields, 'updated_at'}
+        model = db.get(model_type, columns=columns, id=id)
+        if not model:
+            return None
+
+        data = model.to_dict(fields)
+        return data, model.updated_at, content_etag(data)
+
+    model = db.cached(model_type, ('get', id, fields), load)
+    if model is None:
         abort(404)
 
-    return jsonify({
-        'status': 'success',
-        'data': company.to_dict()
-    }), 200
+    data, updated_at, etag = model
+    return conditional_response(
+        etag,
+        updated_at,
+        lambda: jsonify({
+            'status': 'success',
+            'data': data
+        })
+    )
+
+
+@app.route('/companies/<string:id>', methods=['GET'])
+def get_a_company(id: str) -> ResponseReturnValue:
+    return get_one(Company, id)
 
 
 @app.route('/projects/<string:id>', methods=['GET'])
 def get_a_project(id: str) -> ResponseReturnValue:
-    project = db.get(Project, id=id)
-    if not project:
-        abort(404)
+    return get_one(Project, id)
 
-    return jsonify({
+
+def get_page_size() -> int:
+    """
+    Read the requested page size from the query string
+    """
+    limit = request.args.get('limit')
+    if limit is None:
+        return app.config['PAGE_SIZE']
+
+    if not limit.isdigit() or not 0 < int(limit) <= app.config['MAX_PAGE_SIZE']:
+        abort(422)
+
+    return int(limit)
+
+
+def stream_all(model_type: type) -> ResponseReturnValue:
+    """
+    Stream every model as one JSON document without building the list
+    """
+    fields = get_fields(model_type)
+    models = db.iter_all(model_type, app.config['STREAM_BATCH_SIZE'], fields)
+
+    def generate():
+        yield '{"status":"success","data":['
+        separator = ''
+        for model in models:
+            yield separator + app.json.dumps(model.to_dict(fields), separators=(',', ':'))
+            separator = ','
+
+        yield ']}'
+
+    return Response(stream_with_context(generate()), 200, mimetype='application/json')
+
+
+def list_models(model_type: type) -> Tuple[Dict, str]:
+    """
+    Return a page of models, or all of them when no page is requested,
+    with the entity tag of that content
+    """
+    fields = get_fields(model_type)
+    if 'limit' not in request.args and 'cursor' not in request.args:
+        def load_all():
+            data = [model.to_dict(fields) for model in db.get_all(model_type, fields)]
+            return data, content_etag(data)
+
+        data, etag = db.cached(model_type, ('get_all', fields), load_all)
+        return {
+            'status': 'success',
+            'data': data
+        }, etag
+
+    limit = get_page_size()
+    cursor = request.args.get('cursor')
+
+    def load():
+        models, next_cursor = db.get_page(model_type, limit, cursor, fields)
+        data = [model.to_dict(fields) for model in models]
+        return data, next_cursor, content_etag([data, next_cursor])
+
+    data, next_cursor, etag = db.cached(model_type, ('get_page', limit, cursor, fields), load)
+    return {
         'status': 'success',
-        'data': project.to_dict()
-    }), 200
+        'data': data,
+        'next_cursor': next_cursor
+    }, etag
+
+
+def get_paginated(model_type: type) -> ResponseReturnValue:
+    """
+    Return the list of models, or 304 when the client copy is current.
+
+    Lists carry no Last-Modified, since deleting a row does not move the
+    latest updated_at; their entity tag is derived from the content.
+    """
+    if request.args.get('stream') == 'true':
+        return stream_all(model_type)
+
+    body, etag = list_models(model_type)
+    return conditional_response(etag, None, lambda: jsonify(body))
 
 
 @app.route('/companies', methods=['GET'])
 def get_companies() -> ResponseReturnValue:
-    companies = [company.to_dict() for company in db.get_all(Company)]
+    return get_paginated(Company)
+
+
+@app.route('/projects', methods=['GET'])
+def get_projects() -> ResponseReturnValue:
+    return get_paginated(Project)
+
+
+@app.route('/portfolio', methods=['GET'])
+def get_portfolio() -> ResponseReturnValue:
+    """
+    Return every company and project in one precomputed document
+    """
+    return portfolio.response()
+
 
+@app.route('/search', methods=['GET'])
+def search_portfolio() -> ResponseReturnValue:
+    """
+    Rank projects and companies matching the q query
+    """
+    query = request.args.get('q', '').strip()
+    if not query:
+        abort(422)
+
+    limit = get_page_size() if 'limit' in request.args else app.config['SEARCH_MAX_RESULTS']
     return jsonify({
         'status': 'success',
-        'data': companies
+        'data': search(query, limit)
     }), 200
 
 
-@app.route('/projects', methods=['GET'])
-def get_projects() -> ResponseReturnValue:
-    projects = [project.to_dict() for project in db.get_all(Project)]
+@app.route('/changes', methods=['GET'])
+def get_changes() -> ResponseReturnValue:
+    """
+    List the writes made to projects and companies after the since seq
+    """
+    since = request.args.get('since', '0')
+    if not since.isdigit():
+        abort(422)
+
+    changes, next_since = changes_since(int(since), get_page_size())
     return jsonify({
         'status': 'success',
-        'data': projects
+        'data': changes,
+        'next_since': next_since
     }), 200
 
 
@@ -229,11 +434,7 @@ def delete_a_project(id: str) -> ResponseReturnValue:
 @app.route('/companies', methods=['POST'])
 @jwt_required()
 def create_a_company() -> ResponseReturnValue:
-    form_data = request.form.to_dict()
-    if not validate_input(CompanySchema, **form_data):
-        abort(422)
-
-    company = db.save_new(Company, **form_data)
+    company = db.save_new(Company, **bind_fields(CompanySchema))
     return jsonify({
         'status': 'success',
         'data': company.to_dict()
@@ -243,18 +444,13 @@ def create_a_company() -> ResponseReturnValue:
 @app.route('/projects', methods=['POST'])
 @jwt_required()
 def create_a_project() -> ResponseReturnValue:
-    form_data = request.form.to_dict()
-    if not validate_input(ProjectSchema, **form_data):
-        abort(422)
+    form_data = bind_fields(ProjectSchema)
+    with db.unit_of_work():
+        image = request.files.get('image')
+        if image and image.filename:
+            form_data['image'] = store_upload(image)
 
-    project = db.save_new(Project, **form_data)
-    image = request.files.get('image')
-    if image:
-        os.makedirs(os.path.join(app.root_path, os.getenv('UPLOAD_DIR')), exist_ok=True)
-        filename = project.id + os.path.splitext(image.filename)[1]
-        file_path = os.path.join(app.root_path, os.getenv('UPLOAD_DIR'), filename)
-        image.save(file_path)
-        db.update(Project, id=project.id, image=filename)
+        project = db.save_new(Project, **form_data)
 
     return jsonify({
         'status': 'success',
@@ -262,51 +458,131 @@ def create_a_project() -> ResponseReturnValue:
     }), 201
 
 
-@app.route('/companies/<string:id>', methods=['PATCH'])
-@jwt_required()
-def update_a_company(id: str) -> ResponseReturnValue:
-    form = request.form.to_dict()
-    if not validate_input(CompanySchema, **form):
+def get_batch() -> list:
+    """
+    Read the JSON array of a batch request
+    """
+    items = request.get_json(silent=True)
+    if not isinstance(items, list) or not items:
         abort(422)
 
-    form_data = {}
-    for key, val in form.items():
-        if val is None:
-            continue
+    if len(items) > app.config['BATCH_MAX_ITEMS']:
+        raise AbortException(
+            {'error': f"a batch can hold at most {app.config['BATCH_MAX_ITEMS']} items"},
+            'Unprocessable Entity',
+            422
+        )
+
+    return items
+
 
-        form_data[key] = val
+def missing_fields(model_type: type, item: dict) -> Optional[str]:
+    """
+    Return which required columns a batch item leaves out, if any
+    """
+    missing = [
+        column.name for column in model_type.__table__.columns
+        if not column.nullable and not column.primary_key
+        and column.default is None and item.get(column.name) is None
+    ]
+    if missing:
+        return f"missing fields: {', '.join(missing)}"
 
-    company = db.update(Company, id, **form_data)
+    return None
+
+
+def create_batch(model_type: type, schema_type: type) -> ResponseReturnValue:
+    """
+    Validate every item of the batch in one pass, then create all of
+    them at once
+    """
+    items = get_batch()
+    schemas, errors = validate_items(schema_type, items)
+    if schemas:
+        items = [schema.model_dump(exclude_unset=True, exclude_none=True) for schema in schemas]
+
+    for index, item in enumerate(items):
+        error = index not in errors and missing_fields(model_type, item)
+        if error:
+            errors[index] = error
+
+    if errors:
+        return jsonify({
+            'status': 'fail',
+            'data': [
+                {'index': index, 'error': errors[index]}
+                for index in sorted(errors)
+            ]
+        }), 422
+
+    models = db.save_many(model_type, [db.new(model_type, **item) for item in items])
     return jsonify({
         'status': 'success',
-        'data': company.to_dict()
+        'data': [model.to_dict() for model in models]
+    }), 201
+
+
+def delete_batch(model_type: type) -> ResponseReturnValue:
+    """
+    Delete every id of the batch at once
+    """
+    ids = get_batch()
+    if not all(isinstance(id, str) for id in ids):
+        abort(422)
+
+    deleted = set(db.delete_many(model_type, ids))
+    return jsonify({
+        'status': 'success',
+        'data': [
+            {'id': id, 'deleted': id in deleted}
+            for id in ids
+        ]
     }), 200
 
 
-@app.route('/projects/<string:id>', methods=['PATCH'])
+@app.route('/companies/batch', methods=['POST'])
 @jwt_required()
-def update_a_project(id: str) -> ResponseReturnValue:
-    form = request.form.to_dict()
-    if not validate_input(ProjectSchema, **form):
-        abort(422)
+def create_companies() -> ResponseReturnValue:
+    return create_batch(Company, CompanySchema)
 
-    form_data = {}
-    for key, val in form.items():
-        if val is None:
-            continue
 
-        form_data[key] = val
+@app.route('/projects/batch', methods=['POST'])
+@jwt_required()
+def create_projects() -> ResponseReturnValue:
+    return create_batch(Project, ProjectSchema)
 
-    print(form_data)
-    project = db.update(Project, id, **form_data)
+
+@app.route('/companies/batch', methods=['DELETE'])
+@jwt_required()
+def delete_companies() -> ResponseReturnValue:
+    return delete_batch(Company)
+
+
+@app.route('/projects/batch', methods=['DELETE'])
+@jwt_required()
+def delete_projects() -> ResponseReturnValue:
+    return delete_batch(Project)
+
+
+@app.route('/companies/<string:id>', methods=['PATCH'])
+@jwt_required()
+def update_a_company(id: str) -> ResponseReturnValue:
+    company = db.update(Company, id, **bind_fields(CompanySchema))
+    return jsonify({
+        'status': 'success',
+        'data': company.to_dict()
+    }), 200
+
+
+@app.route('/projects/<string:id>', methods=['PATCH'])
+@jwt_required()
+def update_a_project(id: str) -> ResponseReturnValue:
+    form_data = bind_fields(ProjectSchema)
     image = request.files.get('image')
-    if image:
-        os.makedirs(os.path.join(app.root_path, os.getenv('UPLOAD_DIR')), exist_ok=True)
-        filename = project.id + os.path.splitext(image.filename)[1]
-        file_path = os.path.join(app.root_path, os.getenv('UPLOAD_DIR'), filename)
-        image.save(file_path)
-        db.update(Project, id=project.id, image=filename)
+    if image and image.filename:
+        form_data['image'] = store_upload(image)
 
+    project = db.update(Project, id, **form_data)
     return jsonify({
         'status': 'success',
         'data': project.to_dict()
@@ -315,9 +591,7 @@ def update_a_project(id: str) -> ResponseReturnValue:
 
 @app.route('/serve-image/<string:filename>', methods=['GET'])
 def serve_image(filename: str) -> ResponseReturnValue:
-    from flask import send_from_directory
-
-    return send_from_directory(getenv('UPLOAD_DIR'), filename, as_attachment=False)
+    return serve_upload(filename)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,216 @@
+"""
+ASGI entry point, served with any ASGI server:
+
+    uvicorn asgi:application --workers 4
+
+The public read routes (project and company lists and details) run on
+the event loop through AsyncDBStorage, so a slow database holds a
+coroutine rather than a thread. Every other request, including logins,
+writes and uploads, is handed to the Flask app in a thread pool.
+"""
+import io
+from flask import (
+    Flask,
+    abort,
+    jsonify,
+    request
+)
+from metrics import instrument
+from asgiref.sync import sync_to_async
+from flask.typing import ResponseReturnValue
+from asgiref.wsgi import (
+    WsgiToAsgi,
+    WsgiToAsgiInstance
+)
+from app_main import (
+    app,
+    get_fields,
+    get_page_size
+)
+from async_storage import (
+    async_db,
+    AsyncDBStorage
+)
+from conditional import (
+    content_etag,
+    conditional_response
+)
+from models import (
+    Company,
+    Project
+)
+from typing import (
+    Any,
+    Dict,
+    Tuple,
+    Callable
+)
+
+
+class ThreadedWsgiInstance(WsgiToAsgiInstance):
+    """
+    Run each WSGI request in the default thread pool instead of the single
+    thread asgiref uses by default, so blocking requests run concurrently
+    """
+    run_wsgi_app = sync_to_async(vars(WsgiToAsgiInstance)['run_wsgi_app'].func, thread_sensitive=False)
+
+
+class ThreadedWsgiToAsgi(WsgiToAsgi):
+    async def __call__(self, scope: Dict, receive: Callable, send: Callable) -> None:
+        await ThreadedWsgiInstance(self.wsgi_application, self.duplicate_header_limit)(scope, receive, send)
+
+
+class AsyncApp:
+    """
+    ASGI application serving the public read routes natively and the rest
+    through the Flask app
+    """
+    def __init__(self, flask_app: Flask, storage: AsyncDBStorage) -> None:
+        self.flask_app = flask_app
+        self.storage = storage
+        self.wsgi = ThreadedWsgiToAsgi(flask_app)
+        self.views = {
+            'get_companies': lambda: self.get_paginated(Company),
+            'get_projects': lambda: self.get_paginated(Project),
+            'get_a_company': lambda id: self.get_one(Company, id),
+            'get_a_project': lambda id: self.get_one(Project, id)
+        }
+
+    async def __call__(self, scope: Dict, receive: Callable, send: Callable) -> None:
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+
+        if scope['type'] != 'http' or scope['method'] not in ('GET', 'HEAD') or not self.storage.enabled:
+            return await self.wsgi(scope, receive, send)
+
+        instance = WsgiToAsgiInstance(self.flask_app)
+        instance.scope = scope
+        context = self.flask_app.request_context(instance.build_environ(scope, io.BytesIO()))
+        context.push()
+        try:
+            view = self.views.get(request.endpoint)
+            if view is None or request.routing_exception or request.args.get('stream') == 'true':
+                context.pop()
+                context = None
+                return await self.wsgi(scope, receive, send)
+
+            response = await self.dispatch(view)
+        finally:
+            if context is not None:
+                context.pop()
+
+        await send({
+            'type': 'http.response.start',
+            'status': response.status_code,
+            'headers': [
+                (name.lower().encode('latin1'), value.encode('latin1'))
+                for name, value in response.headers.to_wsgi_list()
+            ]
+        })
+        await send({
+            'type': 'http.response.body',
+            'body': b'' if scope['method'] == 'HEAD' else response.get_data()
+        })
+
+    async def dispatch(self, view: Callable) -> Any:
+        """
+        Run view with the app's request hooks and error handlers, as
+        Flask.full_dispatch_request does for synchronous views
+        """
+        app = self.flask_app
+        try:
+            response = app.preprocess_request()
+            if response is None:
+                response = await view(**request.view_args)
+        except Exception as err:
+            try:
+                response = app.handle_user_exception(err)
+            except Exception as err:
+                response = app.handle_exception(err)
+
+        return app.process_response(app.make_response(response))
+
+    async def lifespan(self, receive: Callable, send: Callable) -> None:
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.storage.dispose()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def get_one(self, model_type: type, id: str) -> ResponseReturnValue:
+        """
+        Return a single model, as app_main.get_one does
+        """
+        fields = get_fields(model_type)
+
+        async def load():
+            columns = fields and {*fields, 'updated_at'}
+            model = await self.storage.get(model_type, columns=columns, id=id)
+            if not model:
+                return None
+
+            data = model.to_dict(fields)
+            return data, model.updated_at, content_etag(data)
+
+        model = await self.storage.cached(model_type, ('get', id, fields), load)
+        if model is None:
+            abort(404)
+
+        data, updated_at, etag = model
+        return conditional_response(
+            etag,
+            updated_at,
+            lambda: jsonify({
+                'status': 'success',
+                'data': data
+            })
+        )
+
+    async def get_paginated(self, model_type: type) -> ResponseReturnValue:
+        """
+        Return the list of models, as app_main.get_paginated does
+        """
+        body, etag = await self.list_models(model_type)
+        return conditional_response(etag, None, lambda: jsonify(body))
+
+    async def list_models(self, model_type: type) -> Tuple[Dict, str]:
+        fields = get_fields(model_type)
+        if 'limit' not in request.args and 'cursor' not in request.args:
+            async def load_all():
+                data = [model.to_dict(fields) for model in await self.storage.get_all(model_type, fields)]
+                return data, content_etag(data)
+
+            data, etag = await self.storage.cached(model_type, ('get_all', fields), load_all)
+            return {
+                'status': 'success',
+                'data': data
+            }, etag
+
+        limit = get_page_size()
+        cursor = request.args.get('cursor')
+
+        async def load_page():
+            models, next_cursor = await self.storage.get_page(model_type, limit, cursor, fields)
+            data = [model.to_dict(fields) for model in models]
+            return data, next_cursor, content_etag([data, next_cursor])
+
+        data, next_cursor, etag = await self.storage.cached(
+            model_type,
+            ('get_page', limit, cursor, fields),
+            load_page
+        )
+        return {
+            'status': 'success',
+            'data': data,
+            'next_cursor': next_cursor
+        }, etag
+
+
+async_db.init_app(app)
+if async_db.enabled:
+    instrument(async_db.engine.sync_engine)
+
+application = AsyncApp(app, async_db)
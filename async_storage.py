@@ -0,0 +1,191 @@
+"""
+Module for the asyncio twin of DBStorage, used by the ASGI entry point
+"""
+import asyncio
+from flask import Flask
+from storage import (
+    db,
+    DBStorage
+)
+from exc import AbortException
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy import (
+    desc,
+    select
+)
+from typing import (
+    Any,
+    Dict,
+    List,
+    Type,
+    Tuple,
+    TypeVar,
+    Hashable,
+    Optional,
+    Sequence,
+    Callable,
+    Awaitable
+)
+
+try:
+    from sqlalchemy.ext.asyncio import (
+        AsyncEngine,
+        async_sessionmaker,
+        create_async_engine
+    )
+except ImportError:
+    create_async_engine = None
+
+Model = TypeVar('Model')
+
+ASYNC_DRIVERS = {
+    'sqlite': 'sqlite+aiosqlite',
+    'mysql': 'mysql+aiomysql',
+    'postgresql': 'postgresql+asyncpg'
+}
+
+
+def async_database_uri(uri: str) -> Optional[str]:
+    """
+    Return the async driver URI of a database URI, or None when the
+    database cannot be shared with another engine
+    """
+    url = make_url(uri)
+    if url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:'):
+        return None
+
+    return url.set(drivername=ASYNC_DRIVERS[url.get_backend_name()]).render_as_string(hide_password=False)
+
+
+class AsyncDBStorage:
+    """
+    Read and write models through an AsyncSession.
+
+    Reads go through the read caches of the synchronous storage under the
+    same keys and model versions, so a write made on either side
+    invalidates what the other has cached. When the cache is shared, its
+    SQLite file is only touched from the default executor, never from the
+    event loop.
+    """
+    def __init__(self, storage: DBStorage) -> None:
+        self.storage = storage
+        self.engine: Optional[AsyncEngine] = None
+        self.sessionmaker = None
+
+    def init_app(self, app: Flask) -> None:
+        """
+        Create the async engine, unless the app's database is in-memory
+        SQLite or no async driver is installed
+        """
+        uri = app.config['ASYNC_DATABASE_URI']
+        if not uri:
+            with app.app_context():
+                uri = async_database_uri(self.storage.engine.url.render_as_string(hide_password=False))
+
+        if not uri or create_async_engine is None:
+            return
+
+        self.engine = create_async_engine(uri, **app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}))
+        self.sessionmaker = async_sessionmaker(self.engine, expire_on_commit=False)
+
+    @property
+    def enabled(self) -> bool:
+        return self.engine is not None
+
+    async def dispose(self) -> None:
+        if self.engine is not None:
+            await self.engine.dispose()
+
+    async def run_cache(self, func: Callable[..., Any], *args: Any) -> Any:
+        """
+        Call a cache method of the storage, off the event loop when it may
+        query the shared cache
+        """
+        if self.storage.shared_cache is None:
+            return func(*args)
+
+        return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+    async def cached(
+        self,
+        model_type: Type[Model],
+        key: Hashable,
+        loader: Callable[[], Awaitable[Any]]
+    ) -> Any:
+        """
+        Return the cached result of loader for the current version of
+        model_type, awaiting loader only on a miss
+        """
+        cache_key = await self.run_cache(self.storage.cache_key, model_type, key)
+        if cache_key is None:
+            return await loader()
+
+        hit, value = await self.run_cache(self.storage.cache_get, cache_key)
+        if hit:
+            return value
+
+        value = await loader()
+        await self.run_cache(self.storage.cache_set, cache_key, value)
+        return value
+
+    async def save(self, model_type: Type[Model], model: Model) -> Model:
+        async with self.sessionmaker() as session:
+            try:
+                session.add(model)
+                await session.commit()
+            except IntegrityError as err:
+                await session.rollback()
+                raise AbortException({'error': str(err).split('\n')[0]})
+
+        await self.run_cache(self.storage.bump_version, model_type)
+        return model
+
+    async def save_new(self, model_type: Type[Model], **fields: Dict) -> Model:
+        return await self.save(model_type, model_type(**fields))
+
+    async def delete(self, model_type: Type[Model], id: str) -> None:
+        async with self.sessionmaker() as session:
+            model = await session.get(model_type, id)
+            if not model:
+                raise AbortException({'error':'object does not exist' }, 'Not Found', 404)
+
+            await session.delete(model)
+            await session.commit()
+
+        await self.run_cache(self.storage.bump_version, model_type)
+
+    async def get(
+        self,
+        model_type: Type[Model],
+        columns: Optional[Sequence[str]] = None,
+        **fields: Dict
+    ) -> Optional[Model]:
+        statement = self.storage.load_only(select(model_type), model_type, columns).filter_by(**fields)
+        async with self.sessionmaker() as session:
+            return (await session.execute(statement.limit(1))).scalars().first()
+
+    async def get_all(self, model_type: Type[Model], columns: Optional[Sequence[str]] = None) -> List[Model]:
+        statement = self.storage.load_only(select(model_type), model_type, columns)
+        async with self.sessionmaker() as session:
+            return (await session.execute(statement.order_by(desc(model_type.created_at)))).scalars().all()
+
+    async def get_page(
+        self,
+        model_type: Type[Model],
+        limit: int,
+        cursor: Optional[str] = None,
+        columns: Optional[Sequence[str]] = None,
+        **fields: Dict
+    ) -> Tuple[List[Model], Optional[str]]:
+        """
+        Fetch one page of models, as DBStorage.get_page does
+        """
+        statement = self.storage.page_statement(model_type, limit, cursor, columns, **fields)
+        async with self.sessionmaker() as session:
+            models = (await session.execute(statement)).scalars().all()
+
+        return self.storage.split_page(models, limit)
+
+
+async_db = AsyncDBStorage(db)
@@ -1,11 +1,23 @@
 """
 Module for authentication
 """
+import time
+import logging
 import typing as t
+import threading
+from collections import deque
 from app import jwt
 from storage import db
-from flask import jsonify
+from flask import (
+    jsonify,
+    current_app
+)
+from datetime import (
+    datetime,
+    timedelta
+)
 from exc import AbortException
+from sqlalchemy.exc import SQLAlchemyError
 from flask.typing import ResponseReturnValue
 from models import (
     User,
@@ -14,6 +26,90 @@ from models import (
 
 ModelType = t.TypeVar('Model')
 
+logger = logging.getLogger(__name__)
+
+
+class TokenBlocklist:
+    """
+    In-memory copy of the invalid_tokens table.
+
+    Lookups never touch the database; the copy is topped up from the table
+    at most once every JWT_BLOCKLIST_REFRESH seconds so that tokens revoked
+    by other workers are picked up, and expired tokens are dropped from it.
+    """
+    def __init__(self) -> None:
+        self._jtis = {}
+        self._synced_at = None
+        self._checked_at = None
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def add(self, jti: str, expires_at: t.Optional[datetime]) -> None:
+        with self._lock:
+            self._jtis[jti] = expires_at
+
+    def contains(self, jti: str) -> bool:
+        self.refresh()
+        return jti in self._jtis
+
+    def clear(self) -> None:
+        with self._lock:
+            self._jtis.clear()
+            self._synced_at = None
+            self._checked_at = None
+            self._loaded = False
+
+    def refresh(self) -> None:
+        """
+        Load the tokens revoked since the last refresh. When the table
+        cannot be read, answer 503 until it has been loaded once, since an
+        empty copy would accept every revoked token; after that, keep
+        serving the stale copy and try again after the next interval.
+        """
+        interval = current_app.config['JWT_BLOCKLIST_REFRESH']
+        now = time.monotonic()
+        if self._checked_at is not None and now - self._checked_at < interval:
+            return
+
+        with self._lock:
+            if self._checked_at is not None and now - self._checked_at < interval:
+                return
+
+            since = None
+            if self._synced_at:
+                since = self._synced_at - timedelta(seconds=interval)
+
+            try:
+                revoked = InvalidToken.revoked_since(since)
+            except SQLAlchemyError:
+                db.session.rollback()
+                logger.exception('could not refresh the token blocklist')
+                if not self._loaded:
+                    raise AbortException(
+                        {'error': 'token blocklist is unavailable, try again later'},
+                        'Service Unavailable',
+                        503
+                    )
+
+                self._checked_at = now
+                return
+
+            for jti, expires_at, created_at in revoked:
+                self._jtis[jti] = expires_at
+                if not self._synced_at or created_at > self._synced_at:
+                    self._synced_at = created_at
+
+            current = datetime.now()
+            for jti, expires_at in list(self._jtis.items()):
+                if expires_at and expires_at < current:
+                    del self._jtis[jti]
+
+            self._checked_at = now
+            self._loaded = True
+
+
+blocklist = TokenBlocklist()
+
 
 @jwt.token_in_blocklist_loader
 def check_if_token_is_blacklisted(
@@ -24,7 +120,7 @@ def check_if_token_is_blacklisted(
     Check if user has logged out
     """
     jti = jwt_payload['jti']
-    return InvalidToken.verify_jti(jti)
+    return blocklist.contains(jti)
 
 
 @jwt.expired_token_loader
@@ -66,20 +162,99 @@ def unauthorized_callback(_) -> ResponseReturnValue:
     }), 401
 
 
+class LoginThrottle:
+    """
+    Counts failed logins per email and per client address over a sliding
+    window of LOGIN_FAILURE_WINDOW seconds. Every SWEEP_EVERY failures,
+    the keys whose failures all left the window are dropped, so a spray
+    of unknown emails cannot grow the counts without bound.
+    """
+    SWEEP_EVERY = 100
+
+    def __init__(self) -> None:
+        self._failures = {}
+        self._recorded = 0
+        self._lock = threading.Lock()
+
+    def _keys(self, email: str, remote_addr: t.Optional[str]) -> t.List[t.Tuple[str, int]]:
+        keys = [(f'email:{email}', current_app.config['LOGIN_MAX_FAILURES'])]
+        if remote_addr:
+            keys.append((f'ip:{remote_addr}', current_app.config['LOGIN_MAX_FAILURES_PER_IP']))
+
+        return keys
+
+    def _recent(self, key: str, now: float) -> t.Deque[float]:
+        failures = self._failures.get(key, deque())
+        while failures and now - failures[0] > current_app.config['LOGIN_FAILURE_WINDOW']:
+            failures.popleft()
+
+        if not failures:
+            self._failures.pop(key, None)
+
+        return failures
+
+    def check(self, email: str, remote_addr: t.Optional[str] = None) -> None:
+        """
+        Reject the attempt when too many recent attempts have failed
+        """
+        now = time.monotonic()
+        with self._lock:
+            for key, limit in self._keys(email, remote_addr):
+                if len(self._recent(key, now)) >= limit:
+                    raise AbortException(
+                        {'error': 'too many failed login attempts, try again later'},
+                        'Too Many Requests',
+                        429
+                    )
+
+    def record_failure(self, email: str, remote_addr: t.Optional[str] = None) -> None:
+        now = time.monotonic()
+        with self._lock:
+            for key, _ in self._keys(email, remote_addr):
+                self._failures[key] = self._recent(key, now)
+                self._failures[key].append(now)
+
+            self._recorded += 1
+            if self._recorded % self.SWEEP_EVERY == 0:
+                for key in list(self._failures):
+                    self._recent(key, now)
+
+    def reset(self, email: str) -> None:
+        with self._lock:
+            self._failures.pop(f'email:{email}', None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._failures.clear()
+
+
+throttle = LoginThrottle()
+
+
 class Auth:
     """
     Class for user authentication
     """
-    def authenticate_user(self, email: str, password: str) -> User:
+    def authenticate_user(
+        self,
+        email: str,
+        password: str,
+        remote_addr: t.Optional[str] = None
+    ) -> User:
         """
         Validate user login details
         """
-        from app import bcrypt
+        from app import hasher
 
+        throttle.check(email, remote_addr)
         user = db.get(User, email=email)
         if user:
-            if bcrypt.check_password_hash(user.password, password):
+            if hasher.check_password_hash(user.password, password):
+                throttle.reset(email)
                 return user
 
+            throttle.record_failure(email, remote_addr)
             raise AbortException({'error': 'invalid password'})
+
+        throttle.record_failure(email, remote_addr)
         raise AbortException({'error': 'email not registerd'})
@@ -0,0 +1,533 @@
+"""
+Benchmark every route of the API.
+
+Seeds a database with projects, companies and revoked tokens, drives each
+route through the Flask test client and through a real WSGI server, and
+reports throughput, latency percentiles and SQL statements per request as
+JSON:
+
+    python -m benchmarks.routes --iterations 200 --save baseline.json
+    python -m benchmarks.routes --baseline baseline.json --threshold 0.2
+
+The routes are registered on the app built by app_main, so the database
+is chosen through CONFIG: 'benchmark' (the default) uses a SQLite file in
+a temporary directory and 'testing' an in-memory one.
+"""
+import io
+import os
+import sys
+import json
+import time
+import uuid
+import hashlib
+import argparse
+import tempfile
+import threading
+import statistics
+import http.client
+from urllib.parse import urlencode
+from datetime import (
+    datetime,
+    timedelta
+)
+from typing import (
+    Any,
+    Dict,
+    List,
+    Callable,
+    NamedTuple
+)
+from werkzeug.serving import (
+    make_server,
+    WSGIRequestHandler
+)
+
+IMAGE = b'\x89PNG\r\n\x1a\n' + bytes(range(256)) * 16
+BATCH_SIZE = 10
+
+
+class Request(NamedTuple):
+    method: str
+    path: str
+    form: Dict[str, str] = None
+    files: Dict[str, tuple] = None
+    json: Any = None
+    auth: bool = False
+    token: str = None
+
+
+class Scenario(NamedTuple):
+    name: str
+    endpoint: str
+    build: Callable[[dict, int], Request]
+    consumes: Callable[[int], Dict[str, int]] = None
+
+
+def load_app(config: str):
+    """
+    Import app_main with the given config and benchmark defaults for the
+    settings it reads from the environment
+    """
+    workdir = tempfile.mkdtemp(prefix='benchmark-')
+    os.environ['CONFIG'] = config
+    os.environ.setdefault('BENCHMARK_DATABASE_URI', f"sqlite:///{os.path.join(workdir, 'benchmark.sqlite')}")
+    os.environ.setdefault('UPLOAD_DIR', os.path.join(workdir, 'uploads'))
+    os.environ.setdefault('PORTFOLIO_PATH', os.path.join(workdir, 'portfolio.json.gz'))
+    os.environ.setdefault('CACHE_SHARED_PATH', os.path.join(workdir, 'cache.sqlite'))
+    os.environ.setdefault('SECRET_KEY', 'benchmark')
+    os.environ.setdefault('JWT_SECRET_KEY', 'benchmark')
+    os.environ.setdefault('ADMIN_EMAIL', 'admin@example.com')
+    os.environ.setdefault('ADMIN_PWD', 'benchmark')
+
+    from app_main import app
+    return app
+
+
+def seed(app, projects: int, companies: int, tokens: int) -> dict:
+    """
+    Fill the database and return the ids the scenarios pick from
+    """
+    from storage import db
+    from uploads import upload_dir
+    from models import (
+        User,
+        Company,
+        Project,
+        InvalidToken
+    )
+
+    with app.app_context():
+        db.create_all()
+        admin = db.get(User, email=os.environ['ADMIN_EMAIL']) or db.save_new(User)
+
+        image = f'{hashlib.sha256(IMAGE).hexdigest()}.png'
+        with open(os.path.join(upload_dir(), image), 'wb') as image_file:
+            image_file.write(IMAGE)
+
+        expires_at = datetime.now() + timedelta(days=1)
+        db.save_many(InvalidToken, [
+            db.new(InvalidToken, jti=str(uuid.uuid4()), expires_at=expires_at)
+            for _ in range(tokens)
+        ])
+        company_ids = [company.id for company in db.save_many(Company, [
+            db.new(Company, name=f'company {index}', description=f'company {index} builds python services')
+            for index in range(companies)
+        ])]
+        project_ids = [project.id for project in db.save_many(Project, [
+            db.new(
+                Project,
+                name=f'project {index}',
+                description=f'project {index} is a flask api',
+                url=f'https://example.com/{index}',
+                image=image
+            )
+            for index in range(projects)
+        ])]
+
+    return {
+        'admin_id': admin.id,
+        'image': image,
+        'company_ids': company_ids,
+        'project_ids': project_ids
+    }
+
+
+def prepare(app, state: dict, consumes: Dict[str, int]) -> None:
+    """
+    Create the rows and tokens that a destructive scenario uses up
+    """
+    from storage import db
+    from models import (
+        Company,
+        Project
+    )
+    from flask_jwt_extended import create_access_token
+
+    with app.app_context():
+        for name, count in consumes.items():
+            if name == 'tokens':
+                state[name] = [create_access_token(identity=state['admin_id']) for _ in range(count)]
+                continue
+
+            model_type = Project if name == 'spare_projects' else Company
+            state[name] = [model.id for model in db.save_many(model_type, [
+                db.new(model_type, name='spare', description='spare row to delete')
+                for _ in range(count)
+            ])]
+
+
+def pick(ids: List[str], index: int) -> str:
+    return ids[index % len(ids)]
+
+
+SCENARIOS = [
+    Scenario('status', 'app_status', lambda state, i: Request('GET', '/status')),
+    Scenario('metrics', 'get_metrics', lambda state, i: Request('GET', '/metrics')),
+    Scenario('list_projects', 'get_projects', lambda state, i: Request('GET', '/projects')),
+    Scenario('list_projects_page', 'get_projects', lambda state, i: Request('GET', '/projects?limit=20')),
+    Scenario('stream_projects', 'get_projects', lambda state, i: Request('GET', '/projects?stream=true')),
+    Scenario('list_companies', 'get_companies', lambda state, i: Request('GET', '/companies')),
+    Scenario('portfolio', 'get_portfolio', lambda state, i: Request('GET', '/portfolio')),
+    Scenario(
+        'get_project',
+        'get_a_project',
+        lambda state, i: Request('GET', f"/projects/{pick(state['project_ids'], i)}")
+    ),
+    Scenario(
+        'get_company',
+        'get_a_company',
+        lambda state, i: Request('GET', f"/companies/{pick(state['company_ids'], i)}")
+    ),
+    Scenario('search', 'search_portfolio', lambda state, i: Request('GET', f'/search?q=flask+project+{i}')),
+    Scenario('changes', 'get_changes', lambda state, i: Request('GET', f'/changes?since={i}&limit=20')),
+    Scenario('serve_image', 'serve_image', lambda state, i: Request('GET', f"/serve-image/{state['image']}")),
+    Scenario(
+        'login',
+        'login',
+        lambda state, i: Request(
+            'POST',
+            '/login',
+            form={'email': os.environ['ADMIN_EMAIL'], 'password': os.environ['ADMIN_PWD']}
+        )
+    ),
+    Scenario(
+        'change_password',
+        'change_password',
+        lambda state, i: Request(
+            'POST',
+            '/change-password',
+            form={'current_password': os.environ['ADMIN_PWD'], 'new_password': os.environ['ADMIN_PWD']},
+            auth=True
+        )
+    ),
+    Scenario(
+        'create_company',
+        'create_a_company',
+        lambda state, i: Request('POST', '/companies', form={'name': f'new {i}', 'description': 'created'}, auth=True)
+    ),
+    Scenario(
+        'create_project',
+        'create_a_project',
+        lambda state, i: Request(
+            'POST',
+            '/projects',
+            form={'name': f'new {i}', 'description': 'created'},
+            files={'image': ('image.png', IMAGE)},
+            auth=True
+        )
+    ),
+    Scenario(
+        'create_companies_batch',
+        'create_companies',
+        lambda state, i: Request(
+            'POST',
+            '/companies/batch',
+            json=[{'name': f'batch {i}-{n}', 'description': 'created'} for n in range(BATCH_SIZE)],
+            auth=True
+        )
+    ),
+    Scenario(
+        'update_company',
+        'update_a_company',
+        lambda state, i: Request(
+            'PATCH',
+            f"/companies/{pick(state['company_ids'], i)}",
+            form={'description': f'updated {i}'},
+            auth=True
+        )
+    ),
+    Scenario(
+        'update_project',
+        'update_a_project',
+        lambda state, i: Request(
+            'PATCH',
+            f"/projects/{pick(state['project_ids'], i)}",
+            form={'description': f'updated {i}'},
+            auth=True
+        )
+    ),
+    Scenario(
+        'delete_company',
+        'delete_a_company',
+        lambda state, i: Request('DELETE', f"/companies/{state['spare_companies'][i]}", auth=True),
+        lambda count: {'spare_companies': count}
+    ),
+    Scenario(
+        'delete_project',
+        'delete_a_project',
+        lambda state, i: Request('DELETE', f"/projects/{state['spare_projects'][i]}", auth=True),
+        lambda count: {'spare_projects': count}
+    ),
+    Scenario(
+        'delete_projects_batch',
+        'delete_projects',
+        lambda state, i: Request(
+            'DELETE',
+            '/projects/batch',
+            json=state['spare_projects'][i * BATCH_SIZE:(i + 1) * BATCH_SIZE],
+            auth=True
+        ),
+        lambda count: {'spare_projects': count * BATCH_SIZE}
+    ),
+    Scenario(
+        'logout',
+        'logout',
+        lambda state, i: Request('GET', '/logout', auth=True, token=state['tokens'][i]),
+        lambda count: {'tokens': count}
+    )
+]
+
+
+def encode(request: Request) -> tuple:
+    """
+    Return the body and content type of request as sent over the wire
+    """
+    if request.json is not None:
+        return json.dumps(request.json).encode(), 'application/json'
+
+    if request.files:
+        boundary = uuid.uuid4().hex
+        body = io.BytesIO()
+        for name, value in (request.form or {}).items():
+            body.write(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+        for name, (filename, content) in request.files.items():
+            body.write((
+                f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+                'Content-Type: application/octet-stream\r\n\r\n'
+            ).encode())
+            body.write(content + b'\r\n')
+        body.write(f'--{boundary}--\r\n'.encode())
+        return body.getvalue(), f'multipart/form-data; boundary={boundary}'
+
+    if request.form:
+        return urlencode(request.form).encode(), 'application/x-www-form-urlencoded'
+
+    return None, None
+
+
+class TestClientDriver:
+    """
+    Send requests in process through the Flask test client
+    """
+    name = 'test_client'
+
+    def __init__(self, app) -> None:
+        self.client = app.test_client()
+
+    def send(self, request: Request, headers: Dict[str, str]) -> int:
+        data = dict(request.form or {})
+        for name, (filename, content) in (request.files or {}).items():
+            data[name] = (io.BytesIO(content), filename)
+
+        response = self.client.open(
+            request.path,
+            method=request.method,
+            data=data or None,
+            json=request.json,
+            headers=headers
+        )
+        response.get_data()
+        return response.status_code
+
+    def close(self) -> None:
+        pass
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    def log(self, type: str, message: str, *args) -> None:
+        pass
+
+
+class ServerDriver:
+    """
+    Send requests over HTTP to the app served by a threaded WSGI server
+    """
+    name = 'wsgi_server'
+
+    def __init__(self, app) -> None:
+        self.server = make_server('127.0.0.1', 0, app, threaded=True, request_handler=QuietRequestHandler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def send(self, request: Request, headers: Dict[str, str]) -> int:
+        body, content_type = encode(request)
+        if content_type:
+            headers = {**headers, 'Content-Type': content_type}
+
+        connection = http.client.HTTPConnection('127.0.0.1', self.server.server_port)
+        try:
+            connection.request(request.method, request.path, body, headers)
+            response = connection.getresponse()
+            response.read()
+            return response.status
+        finally:
+            connection.close()
+
+    def close(self) -> None:
+        self.server.shutdown()
+        self.thread.join()
+
+
+def summarize(samples: List[float], elapsed: float, errors: int, queries: int) -> dict:
+    cuts = statistics.quantiles(samples, n=100, method='inclusive') if len(samples) > 1 else samples * 99
+    return {
+        'requests': len(samples),
+        'errors': errors,
+        'throughput_rps': round(len(samples) / elapsed, 1),
+        'p50_ms': round(cuts[49] * 1000, 3),
+        'p95_ms': round(cuts[94] * 1000, 3),
+        'p99_ms': round(cuts[98] * 1000, 3),
+        'queries_per_request': round(queries / len(samples), 2)
+    }
+
+
+def run_scenario(app, driver, scenario: Scenario, state: dict, iterations: int, warmup: int) -> dict:
+    """
+    Send warmup requests, then time iterations more
+    """
+    from app import metrics
+
+    total = warmup + iterations
+    if scenario.consumes:
+        prepare(app, state, scenario.consumes(total))
+
+    def headers(request: Request) -> Dict[str, str]:
+        if not request.auth:
+            return {}
+        return {'Authorization': f"Bearer {request.token or state['token']}"}
+
+    for index in range(warmup):
+        request = scenario.build(state, index)
+        driver.send(request, headers(request))
+
+    metrics.reset()
+    samples = []
+    errors = 0
+    started_at = time.perf_counter()
+    for index in range(warmup, total):
+        request = scenario.build(state, index)
+        request_headers = headers(request)
+        sent_at = time.perf_counter()
+        status = driver.send(request, request_headers)
+        samples.append(time.perf_counter() - sent_at)
+        errors += status >= 400
+
+    elapsed = time.perf_counter() - started_at
+    queries = metrics.queries.get((scenario.endpoint,), [0])[0]
+    return summarize(samples, elapsed, errors, queries)
+
+
+def run(
+    config: str = 'benchmark',
+    projects: int = 200,
+    companies: int = 50,
+    tokens: int = 1000,
+    iterations: int = 100,
+    warmup: int = 5,
+    drivers: List[str] = None,
+    scenarios: List[str] = None
+) -> dict:
+    """
+    Seed the database and benchmark the selected scenarios with each driver
+    """
+    from flask_jwt_extended import create_access_token
+
+    app = load_app(config)
+    state = seed(app, projects, companies, tokens)
+    with app.app_context():
+        state['token'] = create_access_token(identity=state['admin_id'])
+
+    driver_types = [TestClientDriver, ServerDriver]
+    results = {}
+    for driver_type in driver_types:
+        if drivers and driver_type.name not in drivers:
+            continue
+
+        driver = driver_type(app)
+        try:
+            results[driver.name] = {
+                scenario.name: run_scenario(app, driver, scenario, state, iterations, warmup)
+                for scenario in SCENARIOS
+                if not scenarios or scenario.name in scenarios
+            }
+        finally:
+            driver.close()
+
+    return {
+        'config': config,
+        'seed': {'projects': projects, 'companies': companies, 'tokens': tokens},
+        'iterations': iterations,
+        'results': results
+    }
+
+
+def compare(report: dict, baseline: dict, threshold: float) -> List[str]:
+    """
+    Return the scenarios whose p95 latency grew by more than threshold, or
+    that run at least one more SQL statement per request than in the
+    baseline
+    """
+    regressions = []
+    for driver, scenarios in report['results'].items():
+        for name, result in scenarios.items():
+            previous = baseline.get('results', {}).get(driver, {}).get(name)
+            if not previous:
+                continue
+
+            if result['p95_ms'] > previous['p95_ms'] * (1 + threshold):
+                regressions.append(
+                    f"{driver}/{name}: p95 {previous['p95_ms']}ms -> {result['p95_ms']}ms"
+                )
+            if result['queries_per_request'] >= previous['queries_per_request'] + 1:
+                regressions.append(
+                    f"{driver}/{name}: queries per request "
+                    f"{previous['queries_per_request']} -> {result['queries_per_request']}"
+                )
+
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--config', default='benchmark')
+    parser.add_argument('--projects', type=int, default=200)
+    parser.add_argument('--companies', type=int, default=50)
+    parser.add_argument('--tokens', type=int, default=1000)
+    parser.add_argument('--iterations', type=int, default=100)
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--drivers', help='comma separated, test_client and/or wsgi_server')
+    parser.add_argument('--scenarios', help='comma separated scenario names')
+    parser.add_argument('--save', metavar='PATH', help='store the report as a baseline')
+    parser.add_argument('--baseline', metavar='PATH', help='fail on regressions against this baseline')
+    parser.add_argument('--threshold', type=float, default=0.2)
+    args = parser.parse_args()
+
+    report = run(
+        args.config,
+        args.projects,
+        args.companies,
+        args.tokens,
+        args.iterations,
+        args.warmup,
+        args.drivers.split(',') if args.drivers else None,
+        args.scenarios.split(',') if args.scenarios else None
+    )
+    print(json.dumps(report, indent=2))
+
+    if args.save:
+        with open(args.save, 'w') as baseline_file:
+            json.dump(report, baseline_file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = compare(report, json.load(baseline_file), args.threshold)
+
+        for regression in regressions:
+            print(f'regression: {regression}', file=sys.stderr)
+
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""
+Measure the cold start of the application.
+
+Every run imports app_main in a fresh interpreter and reports how long
+the import took and how many SQL statements and bcrypt hashes it caused:
+
+    python -m benchmarks.startup --runs 10
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+PROBE = """
+import time
+import json
+start = time.perf_counter()
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+statements = []
+event.listen(Engine, 'before_cursor_execute', lambda *args: statements.append(args[2]))
+
+import bcrypt
+hashes = []
+hashpw = bcrypt.hashpw
+bcrypt.hashpw = lambda *args: hashes.append(1) or hashpw(*args)
+
+import app_main
+print(json.dumps({
+    'seconds': time.perf_counter() - start,
+    'statements': len(statements),
+    'hashes': len(hashes)
+}))
+"""
+
+
+def measure(runs: int, config: str) -> dict:
+    """
+    Import the app runs times and summarize the timings
+    """
+    samples = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, '-c', PROBE],
+            env={**os.environ, 'CONFIG': config},
+            capture_output=True,
+            text=True,
+            check=True
+        ).stdout
+        samples.append(json.loads(output.strip().splitlines()[-1]))
+
+    seconds = sorted(sample['seconds'] for sample in samples)
+    return {
+        'runs': runs,
+        'config': config,
+        'median_ms': round(statistics.median(seconds) * 1000, 2),
+        'min_ms': round(seconds[0] * 1000, 2),
+        'max_ms': round(seconds[-1] * 1000, 2),
+        'statements': max(sample['statements'] for sample in samples),
+        'hashes': max(sample['hashes'] for sample in samples)
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--config', default='testing')
+    args = parser.parse_args()
+
+    print(json.dumps(measure(args.runs, args.config), indent=2))
+
+
+if __name__ == '__main__':
+    main()
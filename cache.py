@@ -0,0 +1,251 @@
+"""
+Module for the in-process and shared read caches
+"""
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from datetime import datetime
+from collections import OrderedDict
+from typing import (
+    Any,
+    Dict,
+    Tuple,
+    Hashable,
+    Optional
+)
+
+MISSING = object()
+PRUNE_EVERY = 256
+DATETIME_KEY = '__datetime__'
+
+logger = logging.getLogger(__name__)
+
+
+class LRUCache:
+    """
+    Thread-safe least recently used cache with a time to live per entry
+    """
+    def __init__(self, max_size: int = 1024, ttl: float = 300) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def configure(self, max_size: int, ttl: float) -> None:
+        with self._lock:
+            self.max_size = max_size
+            self.ttl = ttl
+            self._entries.clear()
+
+    def get(self, key: Hashable) -> Tuple[bool, Any]:
+        """
+        Return (True, value) on a hit and (False, MISSING) otherwise
+        """
+        with self._lock:
+            entry = self._entries.get(key, MISSING)
+            if entry is not MISSING:
+                expires_at, value = entry
+                if expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return True, value
+
+                del self._entries[key]
+
+            self.misses += 1
+            return False, MISSING
+
+    def set(self, key: Hashable, value: Any) -> None:
+        if self.max_size <= 0:
+            return
+
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key: Hashable) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'size': len(self._entries),
+                'max_size': self.max_size
+            }
+
+
+def encode_value(value: Any) -> str:
+    """
+    Serialize a cached value to JSON, keeping datetimes apart from
+    strings; tuples come back as lists
+    """
+    def default(obj: Any) -> Dict[str, str]:
+        if isinstance(obj, datetime):
+            return {DATETIME_KEY: obj.isoformat()}
+
+        raise TypeError(f'cannot cache {type(obj).__name__}')
+
+    return json.dumps(value, default=default, separators=(',', ':'))
+
+
+def decode_value(text: str) -> Any:
+    def object_hook(obj: Dict) -> Any:
+        if len(obj) == 1 and DATETIME_KEY in obj:
+            return datetime.fromisoformat(obj[DATETIME_KEY])
+
+        return obj
+
+    return json.loads(text, object_hook=object_hook)
+
+
+class SharedCache:
+    """
+    Cache shared by every process of a host through a SQLite file.
+
+    Besides the cached values it keeps a generation counter per name,
+    which any process can bump so that every process stops using what it
+    cached under the previous generation. Errors reading or writing the
+    file are logged and count as misses.
+    """
+    def __init__(self, path: str, max_size: int = 16384, ttl: float = 300) -> None:
+        self.path = path
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+        self._local = threading.local()
+
+    def connect(self) -> sqlite3.Connection:
+        """
+        Return the connection of the current thread, opening a new one
+        after a fork
+        """
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS generations (name TEXT PRIMARY KEY, value INTEGER NOT NULL)'
+            )
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS entries '
+                '(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)'
+            )
+            connection.execute('CREATE INDEX IF NOT EXISTS ix_entries_expires_at ON entries (expires_at)')
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+
+        return connection
+
+    def generation(self, name: str) -> Optional[int]:
+        """
+        Return the current generation of name, or None when it cannot be
+        read and nothing should be cached
+        """
+        try:
+            row = self.connect().execute('SELECT value FROM generations WHERE name = ?', (name,)).fetchone()
+        except sqlite3.Error:
+            logger.exception('could not read the %s generation', name)
+            return None
+
+        return row[0] if row else 0
+
+    def bump(self, name: str) -> None:
+        """
+        Move every process to the next generation of name
+        """
+        try:
+            self.connect().execute(
+                'INSERT INTO generations (name, value) VALUES (?, 1) '
+                'ON CONFLICT (name) DO UPDATE SET value = value + 1',
+                (name,)
+            )
+        except sqlite3.Error:
+            logger.exception('could not bump the %s generation', name)
+
+    def get(self, key: str) -> Tuple[bool, Any]:
+        """
+        Return (True, value) on a hit and (False, MISSING) otherwise
+        """
+        try:
+            row = self.connect().execute(
+                'SELECT value FROM entries WHERE key = ? AND expires_at > ?',
+                (key, time.time())
+            ).fetchone()
+            value = MISSING if row is None else decode_value(row[0])
+        except (sqlite3.Error, TypeError, ValueError):
+            logger.exception('could not read the shared cache')
+            value = MISSING
+
+        if value is MISSING:
+            self.misses += 1
+            return False, MISSING
+
+        self.hits += 1
+        return True, value
+
+    def set(self, key: str, value: Any) -> None:
+        if self.max_size <= 0:
+            return
+
+        try:
+            connection = self.connect()
+            connection.execute(
+                'INSERT OR REPLACE INTO entries (key, value, expires_at) VALUES (?, ?, ?)',
+                (key, encode_value(value), time.time() + self.ttl)
+            )
+            self._writes += 1
+            if self._writes % PRUNE_EVERY == 0:
+                self.prune(connection)
+        except (sqlite3.Error, TypeError, ValueError):
+            logger.exception('could not write the shared cache')
+
+    def prune(self, connection: sqlite3.Connection) -> None:
+        """
+        Drop the expired entries, then the ones closest to expiring until
+        at most max_size are left
+        """
+        connection.execute('DELETE FROM entries WHERE expires_at <= ?', (time.time(),))
+        excess = connection.execute('SELECT COUNT(*) FROM entries').fetchone()[0] - self.max_size
+        if excess > 0:
+            connection.execute(
+                'DELETE FROM entries WHERE key IN (SELECT key FROM entries ORDER BY expires_at LIMIT ?)',
+                (excess,)
+            )
+
+    def clear(self) -> None:
+        """
+        Drop every entry, keeping the generations so that no process
+        mistakes a new entry for one it cached before
+        """
+        try:
+            self.connect().execute('DELETE FROM entries')
+        except sqlite3.Error:
+            logger.exception('could not clear the shared cache')
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'max_size': self.max_size
+        }
@@ -0,0 +1,155 @@
+"""
+Module for the feed of changes made to the portfolio
+"""
+from storage import (
+    db,
+    now
+)
+from exc import AbortException
+from sqlalchemy.orm import (
+    Session,
+    object_session
+)
+from sqlalchemy import (
+    func,
+    event,
+    inspect,
+    select
+)
+from typing import (
+    Dict,
+    List,
+    Tuple
+)
+
+
+class Change(db.Model):
+    """
+    One row per insert, update or delete of a tracked model, numbered by
+    an increasing seq. A delete is kept as a tombstone without data.
+    """
+    __tablename__ = 'changes'
+    seq = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    doc_type = db.Column(db.String(30), nullable=False)
+    doc_id = db.Column(db.String(60), nullable=False)
+    action = db.Column(db.String(10), nullable=False)
+    data = db.Column(db.JSON)
+    created_at = db.Column(db.DateTime, nullable=False, default=now)
+
+
+class ChangeCounter(db.Model):
+    """
+    Single row holding the last seq handed out, created with its table
+    and caught up with the changes table by init-db
+    """
+    __tablename__ = 'change_counter'
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    value = db.Column(db.Integer, nullable=False)
+
+
+@event.listens_for(ChangeCounter.__table__, 'after_create')
+def create_counter(table, connection, **kwargs) -> None:
+    connection.execute(table.insert(), {'id': 1, 'value': 0})
+
+
+def seed_counter() -> None:
+    """
+    Create the counter row if it is missing, or move it past the highest
+    seq already recorded
+    """
+    counter = ChangeCounter.__table__
+    with db.engine.begin() as connection:
+        last = connection.execute(select(func.coalesce(func.max(Change.seq), 0))).scalar()
+        if not connection.execute(select(counter.c.value).where(counter.c.id == 1)).first():
+            connection.execute(counter.insert(), {'id': 1, 'value': last})
+        else:
+            connection.execute(
+                counter.update().where(counter.c.id == 1, counter.c.value < last).values(value=last)
+            )
+
+
+def reserve_seqs(session: Session, count: int) -> int:
+    """
+    Take count seqs at once and return the first. Updating the counter row
+    locks it until the transaction ends, so a concurrent writer waits for
+    this one to commit and seqs become visible in order: a reader never
+    sees a seq while a lower one can still appear.
+    """
+    counter = ChangeCounter.__table__
+    statement = counter.update().where(counter.c.id == 1).values(value=counter.c.value + count)
+    if not session.execute(statement).rowcount:
+        raise AbortException(
+            {'error': 'the change counter is missing, run flask init-db'},
+            'Service Unavailable',
+            503
+        )
+
+    return session.execute(select(counter.c.value).where(counter.c.id == 1)).scalar() - count + 1
+
+
+def track_changes(model_type: type) -> None:
+    """
+    Record every write to model_type in the change feed, in the
+    transaction of the write
+    """
+    def record(target, action: str, data) -> None:
+        object_session(target).info.setdefault('pending_changes', []).append({
+            'doc_type': model_type.__tablename__,
+            'doc_id': target.id,
+            'action': action,
+            'data': data,
+            'created_at': now()
+        })
+
+    def add_document(mapper, connection, target) -> None:
+        record(target, 'create', target.to_dict())
+
+    def update_document(mapper, connection, target) -> None:
+        state = inspect(target)
+        if any(attr.history.has_changes() for attr in state.attrs):
+            record(target, 'update', target.to_dict())
+
+    def delete_document(mapper, connection, target) -> None:
+        record(target, 'delete', None)
+
+    event.listen(model_type, 'after_insert', add_document)
+    event.listen(model_type, 'after_update', update_document)
+    event.listen(model_type, 'after_delete', delete_document)
+
+
+@event.listens_for(Session, 'after_flush')
+def write_changes(session: Session, flush_context) -> None:
+    """
+    Number the changes recorded during the flush from one block of seqs
+    and insert them in one statement
+    """
+    changes = session.info.pop('pending_changes', None)
+    if not changes:
+        return
+
+    first = reserve_seqs(session, len(changes))
+    for seq, change in enumerate(changes, first):
+        change['seq'] = seq
+
+    session.execute(Change.__table__.insert(), changes)
+
+
+def changes_since(since: int, limit: int) -> Tuple[List[Dict], int]:
+    """
+    Return up to limit changes numbered after since, oldest first, and
+    the seq to ask for the next ones with
+    """
+    statement = select(Change).where(Change.seq > since).order_by(Change.seq).limit(limit)
+    changes = db.session.execute(statement).scalars().all()
+
+    return [
+        {
+            'seq': change.seq,
+            'type': change.doc_type,
+            'id': change.doc_id,
+            'action': change.action,
+            'data': change.data,
+            'created_at': change.created_at.isoformat()
+        }
+        for change in changes
+    ], changes[-1].seq if changes else since
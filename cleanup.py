@@ -0,0 +1,200 @@
+"""
+Module for removing uploaded images once nothing references them
+"""
+import os
+import time
+import queue
+import logging
+import threading
+from sqlalchemy import (
+    func,
+    event,
+    select,
+    inspect
+)
+from sqlalchemy.orm import Session
+from flask import (
+    Flask,
+    current_app
+)
+from typing import (
+    List,
+    Tuple,
+    Iterable,
+    Optional
+)
+
+logger = logging.getLogger(__name__)
+
+
+class FileReaper:
+    """
+    Remove image files on a background thread, after the transaction that
+    dropped their last reference has committed.
+
+    A file is only removed if no project references its name when the
+    worker gets to it and it was not modified in the last
+    UPLOAD_REAP_GRACE seconds, so an identical upload that reused the file
+    keeps it even before its transaction commits. Files skipped that way,
+    and removals still queued when the process exits, are left to the
+    sweep-uploads command.
+    """
+    def __init__(self) -> None:
+        self.app: Optional[Flask] = None
+        self._queue: 'queue.Queue[Tuple[str, str]]' = queue.Queue()
+        self._worker: Optional[threading.Thread] = None
+        self._worker_pid = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app: Flask) -> None:
+        self.app = app
+
+    def enqueue(self, files: Iterable[Tuple[str, str]]) -> None:
+        """
+        Queue (directory, filename) pairs for removal
+        """
+        self.start()
+        for file in files:
+            self._queue.put(file)
+
+    def start(self) -> None:
+        """
+        Start the worker thread, again in a forked worker process
+        """
+        with self._lock:
+            if self._worker_pid == os.getpid() and self._worker.is_alive():
+                return
+
+            self._worker = threading.Thread(target=self.run, name='file-reaper', daemon=True)
+            self._worker_pid = os.getpid()
+            self._worker.start()
+
+    def join(self) -> None:
+        """
+        Wait until every queued file has been handled
+        """
+        self._queue.join()
+
+    def run(self) -> None:
+        while True:
+            directory, filename = self._queue.get()
+            try:
+                with self.app.app_context():
+                    self.remove(directory, filename)
+            except Exception:
+                logger.exception('could not remove %s', filename)
+            finally:
+                self._queue.task_done()
+
+    def remove(self, directory: str, filename: str) -> None:
+        from storage import db
+        from models import Project
+        from uploads import stat_cache
+
+        path = os.path.join(directory, filename)
+        try:
+            modified_at = os.stat(path).st_mtime
+        except FileNotFoundError:
+            return
+
+        if time.time() - modified_at < current_app.config['UPLOAD_REAP_GRACE']:
+            return
+
+        db.use_primary()
+        statement = select(func.count(Project.id)).where(Project.image == filename)
+        if db.session.execute(statement).scalar():
+            return
+
+        stat_cache.delete(path)
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def sweep_uploads(grace: float, batch_size: int) -> int:
+    """
+    Remove the files of the upload directory, including abandoned partial
+    uploads, that no project references and that are older than grace
+    seconds, checking batch_size names per query. Return their count.
+    """
+    from storage import db
+    from models import Project
+    from uploads import (
+        stat_cache,
+        upload_dir
+    )
+
+    directory = upload_dir()
+    cutoff = time.time() - grace
+    db.use_primary()
+
+    def remove_orphans(batch: List[str]) -> int:
+        statement = select(Project.image).where(Project.image.in_(batch))
+        referenced = set(db.session.execute(statement).scalars())
+        removed = 0
+        for filename in batch:
+            if filename in referenced:
+                continue
+
+            path = os.path.join(directory, filename)
+            stat_cache.delete(path)
+            try:
+                os.remove(path)
+                removed += 1
+            except FileNotFoundError:
+                pass
+
+        return removed
+
+    removed = 0
+    batch = []
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.is_file(follow_symlinks=False) and entry.stat().st_mtime < cutoff:
+                batch.append(entry.name)
+                if len(batch) >= batch_size:
+                    removed += remove_orphans(batch)
+                    batch = []
+
+    if batch:
+        removed += remove_orphans(batch)
+
+    return removed
+
+
+file_reaper = FileReaper()
+
+
+@event.listens_for(Session, 'after_flush')
+def record_dropped_images(session: Session, flush_context) -> None:
+    """
+    Remember the images of deleted projects and the images replaced on
+    updated ones, until the transaction ends
+    """
+    dropped = set()
+    for model in session.deleted:
+        if getattr(model, '__tablename__', None) == 'projects' and model.image:
+            dropped.add(model.image)
+
+    for model in session.dirty:
+        if getattr(model, '__tablename__', None) == 'projects':
+            dropped.update(image for image in inspect(model).attrs.image.history.deleted if image)
+
+    if dropped:
+        from uploads import upload_dir
+
+        directory = upload_dir()
+        session.info.setdefault('dropped_images', set()).update((directory, image) for image in dropped)
+
+
+@event.listens_for(Session, 'after_commit')
+def remove_dropped_images(session: Session) -> None:
+    dropped = session.info.pop('dropped_images', None)
+    if dropped:
+        file_reaper.enqueue(dropped)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def keep_dropped_images(session: Session, previous_transaction) -> None:
+    session.info.pop('dropped_images', None)
@@ -0,0 +1,90 @@
+"""
+Module for the flask command line commands
+"""
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+
+@click.command('init-db')
+@with_appcontext
+def init_db() -> None:
+    """
+    Create the database tables that do not exist yet and add the columns
+    and indexes missing from the ones that do, catch the change counter up
+    with the changes table, then drop the published portfolio document so
+    it is rebuilt from the database
+    """
+    import models
+    from storage import db
+    from changes import seed_counter
+    from portfolio import portfolio
+
+    db.create_all()
+    for name in db.upgrade_schema():
+        click.echo(f'added {name}')
+
+    seed_counter()
+    portfolio.reset()
+
+    click.echo('database initialized')
+
+
+@click.command('seed-admin')
+@with_appcontext
+def seed_admin() -> None:
+    """
+    Create the admin user from ADMIN_EMAIL and ADMIN_PWD if it is missing
+    """
+    from os import getenv
+    from storage import db
+    from models import User
+
+    if db.get(User, email=getenv('ADMIN_EMAIL')):
+        click.echo('admin already exists')
+        return
+
+    db.save_new(User)
+    click.echo('admin created')
+
+
+@click.command('purge-tokens')
+@with_appcontext
+def purge_tokens() -> None:
+    """
+    Delete revoked tokens that have already expired
+    """
+    from models import InvalidToken
+
+    count = InvalidToken.purge_expired(current_app.config['JWT_ACCESS_TOKEN_EXPIRES'])
+    click.echo(f'purged {count} expired tokens')
+
+
+@click.command('sweep-uploads')
+@click.option('--grace', type=float, help='Keep files younger than this many seconds')
+@click.option('--batch-size', type=int, help='Number of files checked per query')
+@with_appcontext
+def sweep_uploads(grace: float, batch_size: int) -> None:
+    """
+    Remove uploaded files that no project references any more
+    """
+    from cleanup import sweep_uploads
+
+    if grace is None:
+        grace = current_app.config['UPLOAD_SWEEP_GRACE']
+    if batch_size is None:
+        batch_size = current_app.config['UPLOAD_SWEEP_BATCH']
+
+    click.echo(f'removed {sweep_uploads(grace, batch_size)} orphaned files')
+
+
+@click.command('reindex-search')
+@with_appcontext
+def reindex_search() -> None:
+    """
+    Rebuild the search index from the projects and companies tables
+    """
+    import models
+    from search import rebuild_index
+
+    click.echo(f'indexed {rebuild_index()} documents')
@@ -0,0 +1,96 @@
+"""
+Module for compressing response bodies
+"""
+import gzip
+import zlib
+import hashlib
+from cache import LRUCache
+from flask import (
+    Flask,
+    request,
+    Response
+)
+from typing import (
+    Dict,
+    Callable,
+    Optional
+)
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+ENCODINGS = ('br', 'gzip', 'deflate')
+
+
+class Compressor:
+    """
+    Compress response bodies with the best encoding the client accepts.
+
+    Bodies carrying an ETag are compressed once per content and encoding
+    and served from a cache afterwards; the compressed response gets its
+    own ETag, the original suffixed with the encoding.
+    """
+    def __init__(self) -> None:
+        self.min_size = 500
+        self.level = 6
+        self.mimetypes = frozenset()
+        self.cache = LRUCache()
+        self.encoders: Dict[str, Callable[[bytes], bytes]] = {}
+
+    def init_app(self, app: Flask) -> None:
+        self.min_size = app.config['COMPRESS_MIN_SIZE']
+        self.level = app.config['COMPRESS_LEVEL']
+        self.mimetypes = frozenset(app.config['COMPRESS_MIMETYPES'])
+        self.cache.configure(app.config['COMPRESS_CACHE_SIZE'], app.config['COMPRESS_CACHE_TTL'])
+        self.encoders = {
+            'gzip': lambda data: gzip.compress(data, compresslevel=self.level, mtime=0),
+            'deflate': lambda data: zlib.compress(data, self.level)
+        }
+        if brotli:
+            self.encoders['br'] = lambda data: brotli.compress(data, quality=min(self.level, 11))
+
+        app.after_request(self.compress)
+
+    def choose_encoding(self) -> Optional[str]:
+        """
+        Return the accepted encoding with the highest quality, preferring
+        the smaller output on ties
+        """
+        encoding = request.accept_encodings.best_match([name for name in ENCODINGS if name in self.encoders])
+        return encoding if encoding in self.encoders else None
+
+    def compress(self, response: Response) -> Response:
+        if (
+            response.mimetype not in self.mimetypes
+            or response.status_code < 200
+            or response.status_code in (204, 206, 304)
+            or response.direct_passthrough
+            or response.is_streamed
+            or 'Content-Encoding' in response.headers
+        ):
+            return response
+
+        response.vary.add('Accept-Encoding')
+        encoding = self.choose_encoding()
+        if encoding is None or (response.content_length or 0) < self.min_size:
+            return response
+
+        etag, weak = response.get_etag()
+        if etag:
+            data = response.get_data()
+            key = (hashlib.sha1(data).digest(), encoding)
+            hit, body = self.cache.get(key)
+            if not hit:
+                body = self.encoders[encoding](data)
+                self.cache.set(key, body)
+
+            response.set_etag(f'{etag}-{encoding}', weak)
+        else:
+            body = self.encoders[encoding](response.get_data())
+
+        response.set_data(body)
+        response.headers['Content-Encoding'] = encoding
+
+        return response
@@ -0,0 +1,94 @@
+"""
+Module for conditional GET handling
+"""
+import json
+import hashlib
+from compression import ENCODINGS
+from flask import (
+    request,
+    Response,
+    current_app,
+    make_response
+)
+from typing import (
+    Any,
+    Callable,
+    Optional
+)
+from datetime import (
+    datetime,
+    timezone
+)
+
+
+def make_etag(*parts: Any) -> str:
+    """
+    Build a strong entity tag out of the parts identifying a representation
+    """
+    return hashlib.sha1('\0'.join(map(str, parts)).encode()).hexdigest()
+
+
+def content_etag(content: Any) -> str:
+    """
+    Build a strong entity tag out of the JSON content of a representation,
+    so that it changes whenever the content does
+    """
+    return make_etag(json.dumps(content, sort_keys=True, separators=(',', ':'), default=str))
+
+
+def matching_etag(etag: str) -> Optional[str]:
+    """
+    Return the entity tag of If-None-Match naming the current
+    representation or one of its compressed variants
+    """
+    for candidate in (etag, *(f'{etag}-{encoding}' for encoding in ENCODINGS)):
+        if request.if_none_match.contains(candidate):
+            return candidate
+
+    return None
+
+
+def is_not_modified(etag: str, last_modified: Optional[datetime]) -> bool:
+    """
+    Check the request validators against the current representation,
+    or any of its compressed variants
+    """
+    if request.if_none_match:
+        return matching_etag(etag) is not None
+
+    if request.if_modified_since and last_modified:
+        return last_modified.replace(microsecond=0) <= request.if_modified_since
+
+    return False
+
+
+def conditional_response(
+    etag: str,
+    last_modified: Optional[datetime],
+    build: Callable[[], Any]
+) -> Response:
+    """
+    Answer with 304 when the client copy is current, else with build().
+    A naive last_modified is taken as local time. A 304 carries the entity tag of the variant the client holds, and
+    like the full response varies on Accept-Encoding.
+    """
+    if last_modified:
+        last_modified = last_modified.astimezone(timezone.utc)
+
+    if is_not_modified(etag, last_modified):
+        response = current_app.response_class(status=304)
+        if request.if_none_match:
+            etag = matching_etag(etag)
+    else:
+        response = make_response(build())
+
+    response.set_etag(etag)
+    response.vary.add('Accept-Encoding')
+    if last_modified:
+        response.last_modified = last_modified
+    response.headers['Cache-Control'] = current_app.config['CACHE_CONTROL'].get(
+        request.endpoint,
+        current_app.config['CACHE_CONTROL_DEFAULT']
+    )
+
+    return response
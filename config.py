@@ -1,3 +1,5 @@
+import os
+import tempfile
 from os import getenv
 from datetime import timedelta
 
@@ -8,35 +10,108 @@ class Config:
     JWT_SECRET_KEY = getenv('JWT_SECRET_KEY')
     JWT_BLACKLIST_ENABLED = True
     JWT_BLACKLIST_TOKEN_CHECKS = ['access']
+    JWT_BLOCKLIST_REFRESH = 5
+    REQUEST_THREADS = int(getenv('GUNICORN_THREADS', 4))
+    PASSWORD_HASH_WORKERS = 2
+    PASSWORD_HASH_QUEUE = 0
+    LOGIN_MAX_FAILURES = 5
+    LOGIN_MAX_FAILURES_PER_IP = 20
+    LOGIN_FAILURE_WINDOW = 300
+    PROXY_TRUSTED_HOPS = int(getenv('PROXY_TRUSTED_HOPS', 0))
+    UPLOAD_DIR = getenv('UPLOAD_DIR')
+    UPLOAD_CHUNK_SIZE = 64 * 1024
+    MAX_IMAGE_SIZE = 5 * 1024 * 1024
+    MAX_CONTENT_LENGTH = MAX_IMAGE_SIZE + 1024 * 1024
+    IMAGE_ACCEL_REDIRECT = getenv('IMAGE_ACCEL_REDIRECT')
+    IMAGE_CACHE_CONTROL = 'public, max-age=3600'
+    IMAGE_STAT_CACHE_SIZE = 4096
+    IMAGE_STAT_TTL = 60
+    UPLOAD_SWEEP_GRACE = 3600
+    UPLOAD_REAP_GRACE = 300
+    UPLOAD_SWEEP_BATCH = 500
+    JSON_PROVIDER = 'orjson'
+    PAGE_SIZE = 20
+    MAX_PAGE_SIZE = 100
+    STREAM_BATCH_SIZE = 500
+    DB_POOL_WARMUP = 0
+    ASYNC_DATABASE_URI = getenv('ASYNC_DATABASE_URI')
+    PORTFOLIO_PATH = getenv('PORTFOLIO_PATH')
+    COMPRESS_MIN_SIZE = 500
+    COMPRESS_LEVEL = 6
+    COMPRESS_MIMETYPES = ('application/json', 'text/plain', 'text/html', 'text/css', 'application/javascript')
+    COMPRESS_CACHE_SIZE = 256
+    COMPRESS_CACHE_TTL = 300
+    SQLALCHEMY_REPLICA_URIS = [uri for uri in getenv('DATABASE_REPLICA_URIS', '').split(',') if uri]
+    REPLICA_STRATEGY = getenv('REPLICA_STRATEGY', 'round_robin')
+    REPLICA_EJECT_SECONDS = 30
+    REPLICA_LAG_SECONDS = 5
+    BATCH_MAX_ITEMS = 500
+    SEARCH_MAX_RESULTS = 50
+    METRICS_DIR = getenv('METRICS_DIR')
+    METRICS_FLUSH_INTERVAL = 5
+    CACHE_MAX_SIZE = 1024
+    CACHE_TTL = 300
+    CACHE_BACKEND = getenv('CACHE_BACKEND', 'shared')
+    CACHE_SHARED_PATH = getenv('CACHE_SHARED_PATH')
+    CACHE_SHARED_MAX_SIZE = 16384
+    CACHE_CONTROL_DEFAULT = 'no-cache'
+    CACHE_CONTROL = {}
 
 
 class DevelopmentConfig(Config):
     JWT_ACCESS_TOKEN_EXPIRES = timedelta(days=15)
     DEBUG = True
+    BCRYPT_LOG_ROUNDS = 12
     SQLALCHEMY_DATABASE_URI = "mysql://{}:{}@localhost/{}".format(
         getenv('DATABASE_USERNAME'),
         getenv('DATABASE_PASSWORD'),
         getenv('DATABASE')
     )
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'pool_size': int(getenv('DB_POOL_SIZE', 5)),
+        'max_overflow': int(getenv('DB_MAX_OVERFLOW', 5)),
+        'pool_timeout': 10,
+        'pool_recycle': 280,
+        'pool_pre_ping': True
+    }
+    DB_POOL_WARMUP = 1
 
 
 class TestingConfig(Config):
+    BCRYPT_LOG_ROUNDS = 4
+    CACHE_BACKEND = 'local'
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+    PORTFOLIO_PATH = os.path.join(tempfile.gettempdir(), f'portfolio-{os.getpid()}.json.gz')
+
+
+class BenchmarkConfig(Config):
+    BCRYPT_LOG_ROUNDS = 4
+    SQLALCHEMY_DATABASE_URI = getenv('BENCHMARK_DATABASE_URI', 'sqlite:///benchmark.sqlite')
 
 
 class DeploymentConfig(Config):
     DEBUG = False
     JWT_ACCESS_TOKEN_EXPIRES = timedelta(days=15)
+    BCRYPT_LOG_ROUNDS = 12
     SQLALCHEMY_DATABASE_URI = "mysql://{}:{}@localhost/{}".format(
         getenv('DATABASE_USERNAME'),
         getenv('DATABASE_PASSWORD'),
         getenv('DATABASE')
     )
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'pool_size': int(getenv('DB_POOL_SIZE', 10)),
+        'max_overflow': int(getenv('DB_MAX_OVERFLOW', 10)),
+        'pool_timeout': 10,
+        'pool_recycle': 280,
+        'pool_pre_ping': True
+    }
+    DB_POOL_WARMUP = int(getenv('DB_POOL_WARMUP', 4))
 
 
 config = {
     'default': DevelopmentConfig,
     'development': DevelopmentConfig,
     'testing': TestingConfig,
+    'benchmark': BenchmarkConfig,
     'deployment': DeploymentConfig
 }
@@ -0,0 +1,41 @@
+"""
+Gunicorn settings, picked up automatically by `gunicorn wsgi:app`
+"""
+from os import getenv
+
+bind = f"0.0.0.0:{getenv('PORT', 5000)}"
+workers = int(getenv('WEB_CONCURRENCY', 2))
+threads = int(getenv('GUNICORN_THREADS', 4))
+preload_app = True
+
+
+def post_fork(server, worker):
+    """
+    Give every worker its own connections and open them before it
+    starts taking requests
+    """
+    from storage import db
+    from wsgi import app
+
+    with app.app_context():
+        db.dispose_engines()
+        db.warm_up(app.config['DB_POOL_WARMUP'])
+
+
+def on_starting(server):
+    """
+    Drop metric snapshots and shared cache entries left behind by a
+    previous master
+    """
+    import glob
+    import os
+    from storage import db
+    from wsgi import app
+
+    metrics_dir = getenv('METRICS_DIR')
+    if metrics_dir:
+        for path in glob.glob(os.path.join(metrics_dir, 'metrics-*.json')):
+            os.remove(path)
+
+    if db.shared_cache:
+        db.shared_cache.clear()
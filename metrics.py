@@ -0,0 +1,259 @@
+"""
+Module for request, database and cache metrics in Prometheus text format
+"""
+import os
+import json
+import time
+import glob
+import logging
+import tempfile
+import threading
+from storage import db
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from flask import (
+    g,
+    Flask,
+    request,
+    Response,
+    has_request_context
+)
+from typing import (
+    Any,
+    Dict,
+    List,
+    Tuple
+)
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    conn.info['query_started_at'] = time.perf_counter()
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    started_at = conn.info.pop('query_started_at', None)
+    if started_at is not None and has_request_context():
+        g.db_queries = g.get('db_queries', 0) + 1
+        g.db_seconds = g.get('db_seconds', 0.0) + time.perf_counter() - started_at
+
+
+def handle_error(context: Any) -> None:
+    if context.connection is not None:
+        context.connection.info.pop('query_started_at', None)
+
+
+def instrument(engine: Engine) -> None:
+    """
+    Count the statements and time spent in engine for the current request.
+    A connection runs one statement at a time, so it holds a single start
+    time, dropped when the statement fails.
+    """
+    if not event.contains(engine, 'before_cursor_execute', before_cursor_execute):
+        event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', after_cursor_execute)
+        event.listen(engine, 'handle_error', handle_error)
+
+
+class Metrics:
+    """
+    Collects per-endpoint latency histograms, response sizes, status
+    codes and SQL query counts.
+
+    Each process keeps its own counters. When METRICS_DIR is set, every
+    process also writes a snapshot there at most every
+    METRICS_FLUSH_INTERVAL seconds, and /metrics sums all snapshots so
+    the output covers every gunicorn worker.
+    """
+    def __init__(self) -> None:
+        self.directory = None
+        self.flush_interval = 5
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._flushed_at = 0.0
+        self.reset()
+
+    def init_app(self, app: Flask) -> None:
+        self.directory = app.config['METRICS_DIR']
+        self.flush_interval = app.config['METRICS_FLUSH_INTERVAL']
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+
+        with app.app_context():
+            for engine in db.engines.values():
+                instrument(engine)
+
+        app.before_request(self.start_request)
+        app.after_request(self.end_request)
+
+    def reset(self) -> None:
+        with self._lock:
+            self.requests = {}
+            self.latency = {}
+            self.response_bytes = {}
+            self.queries = {}
+
+    def start_request(self) -> None:
+        g.request_started_at = time.perf_counter()
+
+    def end_request(self, response: Response) -> Response:
+        elapsed = time.perf_counter() - g.get('request_started_at', time.perf_counter())
+        endpoint = request.endpoint or 'unmatched'
+        self.observe(
+            endpoint,
+            request.method,
+            response.status_code,
+            elapsed,
+            response.content_length or 0,
+            g.get('db_queries', 0),
+            g.get('db_seconds', 0.0)
+        )
+
+        return response
+
+    def observe(
+        self,
+        endpoint: str,
+        method: str,
+        status: int,
+        seconds: float,
+        size: int,
+        queries: int,
+        query_seconds: float
+    ) -> None:
+        with self._lock:
+            key = (endpoint, method, str(status))
+            self.requests[key] = self.requests.get(key, 0) + 1
+
+            histogram = self.latency.setdefault((endpoint,), [0] * (len(LATENCY_BUCKETS) + 2))
+            for index, bound in enumerate(LATENCY_BUCKETS):
+                if seconds <= bound:
+                    histogram[index] += 1
+            histogram[-2] += seconds
+            histogram[-1] += 1
+
+            self.response_bytes[(endpoint,)] = self.response_bytes.get((endpoint,), 0) + size
+            totals = self.queries.setdefault((endpoint,), [0, 0.0])
+            totals[0] += queries
+            totals[1] += query_seconds
+
+        if self.directory and time.monotonic() - self._flushed_at > self.flush_interval:
+            self.flush(self.flush_interval)
+
+    def snapshot(self) -> Dict[str, List]:
+        with self._lock:
+            return {
+                name: [[list(key), value] for key, value in getattr(self, name).items()]
+                for name in ('requests', 'latency', 'response_bytes', 'queries')
+            }
+
+    def flush(self, interval: float = 0) -> None:
+        """
+        Write this process's counters where the other workers can read
+        them, unless another thread did less than interval seconds ago.
+        A failed write is logged, never raised, so it cannot fail a request.
+        """
+        with self._flush_lock:
+            if time.monotonic() - self._flushed_at <= interval:
+                return
+
+            self._flushed_at = time.monotonic()
+            path = os.path.join(self.directory, f'metrics-{os.getpid()}.json')
+            temp_path = None
+            try:
+                descriptor, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+                with os.fdopen(descriptor, 'w') as snapshot_file:
+                    json.dump(self.snapshot(), snapshot_file)
+
+                os.replace(temp_path, path)
+            except OSError:
+                logger.exception('could not write metrics to %s', path)
+                if temp_path and os.path.exists(temp_path):
+                    os.remove(temp_path)
+
+    def collect(self) -> Dict[str, Dict[Tuple, Any]]:
+        """
+        Return the counters of every process, summed
+        """
+        if not self.directory:
+            snapshots = [self.snapshot()]
+        else:
+            self.flush()
+            snapshots = []
+            for path in glob.glob(os.path.join(self.directory, 'metrics-*.json')):
+                try:
+                    with open(path) as snapshot_file:
+                        snapshots.append(json.load(snapshot_file))
+                except (OSError, ValueError):
+                    continue
+
+        merged = {name: {} for name in ('requests', 'latency', 'response_bytes', 'queries')}
+        for snapshot in snapshots:
+            for name, entries in snapshot.items():
+                for key, value in entries:
+                    key = tuple(key)
+                    current = merged[name].get(key)
+                    if current is None:
+                        merged[name][key] = value
+                    elif isinstance(value, list):
+                        merged[name][key] = [a + b for a, b in zip(current, value)]
+                    else:
+                        merged[name][key] = current + value
+
+        return merged
+
+    def render(self, gauges: Dict[str, float] = None) -> str:
+        """
+        Render the merged counters, plus this process's gauges, as
+        Prometheus text
+        """
+        merged = self.collect()
+        lines = [
+            '# HELP http_requests_total Requests by endpoint, method and status.',
+            '# TYPE http_requests_total counter'
+        ]
+        for (endpoint, method, status), count in sorted(merged['requests'].items()):
+            lines.append(
+                f'http_requests_total{{endpoint="{endpoint}",method="{method}",status="{status}"}} {count}'
+            )
+
+        lines += [
+            '# HELP http_request_duration_seconds Request latency by endpoint.',
+            '# TYPE http_request_duration_seconds histogram'
+        ]
+        for (endpoint,), histogram in sorted(merged['latency'].items()):
+            for bound, count in zip(LATENCY_BUCKETS, histogram):
+                lines.append(f'http_request_duration_seconds_bucket{{endpoint="{endpoint}",le="{bound}"}} {count}')
+            lines.append(f'http_request_duration_seconds_bucket{{endpoint="{endpoint}",le="+Inf"}} {histogram[-1]}')
+            lines.append(f'http_request_duration_seconds_sum{{endpoint="{endpoint}"}} {histogram[-2]}')
+            lines.append(f'http_request_duration_seconds_count{{endpoint="{endpoint}"}} {histogram[-1]}')
+
+        lines += [
+            '# HELP http_response_bytes_total Response body bytes by endpoint.',
+            '# TYPE http_response_bytes_total counter'
+        ]
+        for (endpoint,), size in sorted(merged['response_bytes'].items()):
+            lines.append(f'http_response_bytes_total{{endpoint="{endpoint}"}} {size}')
+
+        lines += [
+            '# HELP db_queries_total SQL statements executed by endpoint.',
+            '# TYPE db_queries_total counter'
+        ]
+        for (endpoint,), (count, _) in sorted(merged['queries'].items()):
+            lines.append(f'db_queries_total{{endpoint="{endpoint}"}} {count}')
+
+        lines += [
+            '# HELP db_query_seconds_total Time spent in SQL statements by endpoint.',
+            '# TYPE db_query_seconds_total counter'
+        ]
+        for (endpoint,), (_, seconds) in sorted(merged['queries'].items()):
+            lines.append(f'db_query_seconds_total{{endpoint="{endpoint}"}} {seconds}')
+
+        for name, value in (gauges or {}).items():
+            lines.append(f'# TYPE {name} gauge')
+            lines.append(f'{name}{{pid="{os.getpid()}"}} {value}')
+
+        return '\n'.join(lines) + '\n'
@@ -1,49 +1,112 @@
 import uuid
 from os import getenv
-from storage import db
-from sqlalchemy import event
-from typing import Dict
-from app import bcrypt
-from datetime import datetime
+from storage import (
+    db,
+    now
+)
+from app import hasher
+from search import index_model
+from changes import track_changes
+from sqlalchemy import (
+    or_,
+    and_,
+    delete,
+    select
+)
+from operator import attrgetter
+from typing import (
+    Dict,
+    List,
+    Tuple,
+    Callable,
+    Optional
+)
+from datetime import (
+    datetime,
+    timedelta
+)
+
+SERIALIZE_EXCLUDE = frozenset(('password',))
+SERIALIZE_TIMESTAMPS = frozenset(('created_at', 'updated_at'))
 
 
 class BaseModel:
     id = db.Column(db.String(60), primary_key=True, nullable=False)
-    created_at = db.Column(db.DateTime, default=datetime.now)
-    updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
+    created_at = db.Column(db.DateTime, default=now)
+    updated_at = db.Column(db.DateTime, default=now, onupdate=now)
 
     def __init__(self, **kwargs) -> None:
         super().__init__(**kwargs)
         self.id = str(uuid.uuid4())
 
-    def to_dict(self) -> Dict:
-        model_dict = {}
-        model = {column.name: getattr(self, column.name) for column in self.__table__.columns}
-        for key, value in model.items():
-            if key == 'created_at':
-                model_dict['created_at'] = self.created_at.isoformat()
-            elif key == 'updated_at':
-                model_dict['updated_at'] = self.updated_at.isoformat()
-            elif key == '_sa_instance_state' or key == 'password':
-                continue
+    @classmethod
+    def serializable_fields(cls) -> Tuple[str, ...]:
+        """
+        Return the names of the columns that to_dict may include
+        """
+        return tuple(
+            column.name for column in cls.__table__.columns
+            if column.name not in SERIALIZE_EXCLUDE
+        )
+
+    @classmethod
+    def serializer(cls, fields: Optional[Tuple[str, ...]] = None) -> Callable[['BaseModel'], Dict]:
+        """
+        Return the to_dict function of the model for the given fields,
+        built once per class and field set
+        """
+        serializers = cls.__dict__.get('_serializers')
+        if serializers is None:
+            serializers = {}
+            cls._serializers = serializers
+
+        serialize = serializers.get(fields)
+        if serialize:
+            return serialize
+
+        names = fields or cls.serializable_fields()
+        timestamps = tuple(name for name in names if name in SERIALIZE_TIMESTAMPS)
+        getter = attrgetter(*names) if len(names) > 1 else lambda model: (getattr(model, names[0]),)
+
+        def serialize(model: 'BaseModel') -> Dict:
+            loaded = model.__dict__
+            if all(name in loaded for name in names):
+                model_dict = {name: loaded[name] for name in names}
             else:
-                model_dict[key] = value
+                model_dict = dict(zip(names, getter(model)))
+
+            for name in timestamps:
+                model_dict[name] = model_dict[name].isoformat()
+
+            return model_dict
+
+        serializers[fields] = serialize
+        return serialize
+
+    def to_dict(self, fields: Optional[Tuple[str, ...]] = None) -> Dict:
+        return self.serializer(fields)(self)
 
-        return model_dict
+
+def admin_email() -> str:
+    return getenv('ADMIN_EMAIL')
+
+
+def admin_password() -> str:
+    """
+    Hash the admin password, only when a user row is actually inserted
+    """
+    return hasher.generate_password_hash(getenv('ADMIN_PWD'))
 
 
 class User(BaseModel, db.Model):
     __tablename__ = 'user'
-    email = db.Column(db.String(60), nullable=False, default=getenv('ADMIN_EMAIL'))
-    password = db.Column(
-        db.String(60),
-        nullable=False,
-        default=bcrypt.generate_password_hash(getenv('ADMIN_PWD')).decode('utf-8')
-    )
+    email = db.Column(db.String(60), nullable=False, default=admin_email)
+    password = db.Column(db.String(60), nullable=False, default=admin_password)
 
 
 class Project(BaseModel, db.Model):
     __tablename__ = 'projects'
+    __table_args__ = (db.Index('ix_projects_created_at_id', 'created_at', 'id'),)
     url = db.Column(db.String(256))
     image = db.Column(db.String(256))
     name = db.Column(db.String(60), nullable=False)
@@ -52,26 +115,51 @@ class Project(BaseModel, db.Model):
 
 class Company(BaseModel, db.Model):
     __tablename__ = 'companies'
+    __table_args__ = (db.Index('ix_companies_created_at_id', 'created_at', 'id'),)
     name = db.Column(db.String(60), nullable=False)
     description = db.Column(db.Text, nullable=False)
 
 
 class InvalidToken(BaseModel, db.Model):
     __tablename__ = 'invalid_tokens'
+    __table_args__ = (db.Index('ix_invalid_tokens_created_at', 'created_at'),)
     jti = db.Column(db.String(36), nullable=False, index=True)
+    expires_at = db.Column(db.DateTime, index=True)
 
     @classmethod
     def verify_jti(cls, jti: str) -> bool:
         return bool(db.get(cls, jti=jti))
 
+    @classmethod
+    def revoked_since(cls, since: Optional[datetime]) -> List[Tuple[str, datetime, datetime]]:
+        """
+        Return (jti, expires_at, created_at) of the tokens revoked since a time
+        """
+        statement = select(cls.jti, cls.expires_at, cls.created_at)
+        if since:
+            statement = statement.where(cls.created_at >= since)
 
-def delete_file(mapper, connection, target):
-    import os
-    from app_main import app
-
-    if target.image:
-        path = os.path.join(app.root_path, os.getenv('UPLOAD_DIR'), target.image)
-        if os.path.exists(path):
-            os.remove(path)
+        return db.session.execute(statement).all()
 
-event.listen(Project, 'after_delete', delete_file)
+    @classmethod
+    def purge_expired(cls, lifetime: Optional[timedelta]) -> int:
+        """
+        Delete the tokens that can no longer be used and return their count
+        """
+        now = datetime.now()
+        condition = cls.expires_at < now
+        if lifetime:
+            condition = or_(
+                condition,
+                and_(cls.expires_at.is_(None), cls.created_at < now - lifetime)
+            )
+
+        count = db.session.execute(delete(cls).where(condition)).rowcount
+        db.session.commit()
+        return count
+
+
+index_model(Project, name=3, description=1)
+index_model(Company, name=3, description=1)
+track_changes(Project)
+track_changes(Company)
@@ -0,0 +1,60 @@
+"""
+Module for password hashing off the request thread
+"""
+import threading
+from flask import Flask
+from exc import AbortException
+from typing import (
+    Any,
+    Callable,
+    Optional
+)
+from concurrent.futures import ThreadPoolExecutor
+
+
+class PasswordHasher:
+    """
+    Runs bcrypt on a bounded pool of worker threads.
+
+    At most PASSWORD_HASH_WORKERS hashes run at once and at most
+    PASSWORD_HASH_QUEUE more may wait for a worker. An accepted call
+    still blocks its request thread until its hash is done, so the calls
+    admitted are also capped at one less than REQUEST_THREADS; any call
+    beyond that is rejected with 503 and at least one request thread is
+    left for the other endpoints.
+    """
+    def __init__(self) -> None:
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._slots: Optional[threading.BoundedSemaphore] = None
+
+    def init_app(self, app: Flask) -> None:
+        workers = app.config['PASSWORD_HASH_WORKERS']
+        if self._executor:
+            self._executor.shutdown(wait=False)
+
+        self._executor = ThreadPoolExecutor(workers, thread_name_prefix='bcrypt')
+        slots = min(workers + app.config['PASSWORD_HASH_QUEUE'], app.config['REQUEST_THREADS'] - 1)
+        self._slots = threading.BoundedSemaphore(max(slots, 1))
+
+    def _run(self, func: Callable[..., Any], *args: Any) -> Any:
+        if not self._slots.acquire(blocking=False):
+            raise AbortException(
+                {'error': 'server is busy, try again later'},
+                'Service Unavailable',
+                503
+            )
+
+        try:
+            return self._executor.submit(func, *args).result()
+        finally:
+            self._slots.release()
+
+    def generate_password_hash(self, password: str) -> str:
+        from app import bcrypt
+
+        return self._run(lambda: bcrypt.generate_password_hash(password).decode('utf-8'))
+
+    def check_password_hash(self, pw_hash: str, password: str) -> bool:
+        from app import bcrypt
+
+        return self._run(bcrypt.check_password_hash, pw_hash, password)
@@ -0,0 +1,262 @@
+"""
+Module for the precomputed /portfolio document
+"""
+import os
+import gzip
+import json
+import fcntl
+import hashlib
+import tempfile
+import threading
+from collections import defaultdict
+from sqlalchemy import (
+    event,
+    select
+)
+from sqlalchemy.orm import Session
+from datetime import (
+    datetime,
+    timezone
+)
+from flask import (
+    Flask,
+    request,
+    Response,
+    current_app
+)
+from typing import (
+    Dict,
+    List,
+    Tuple,
+    Iterable,
+    Optional
+)
+
+PORTFOLIO_TABLES = ('companies', 'projects')
+
+
+class Portfolio:
+    """
+    Every company and project in one JSON document, served from memory.
+
+    Commits that touch companies or projects re-read those rows from the
+    primary under a file lock, so the document follows the database
+    whatever order the commits publish in, and publish it to a gzip file
+    that other worker processes reload when it is replaced. The whole
+    document is only built from the database when no copy exists yet.
+    """
+    def __init__(self) -> None:
+        self.path = None
+        self.items: Optional[Dict[str, Dict[str, Dict]]] = None
+        self.body = None
+        self.gzipped = None
+        self.etag = None
+        self.last_modified = None
+        self.version = None
+        self._lock = threading.RLock()
+
+    def init_app(self, app: Flask) -> None:
+        self.path = app.config['PORTFOLIO_PATH'] or os.path.join(app.instance_path, 'portfolio.json.gz')
+        self.forget()
+
+    def forget(self) -> None:
+        self.items = self.body = self.gzipped = self.etag = self.last_modified = self.version = None
+
+    def reset(self) -> None:
+        """
+        Forget the document, in memory and on disk
+        """
+        with self._lock:
+            self.forget()
+            if self.path and os.path.exists(self.path):
+                os.remove(self.path)
+
+    def file_lock(self) -> 'FileLock':
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        return FileLock(f'{self.path}.lock')
+
+    def load(self) -> None:
+        """
+        Reload the published document when another process replaced it,
+        and drop it when the file was removed
+        """
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            self.forget()
+            return
+
+        if (stat.st_ino, stat.st_mtime_ns) == self.version:
+            return
+
+        with open(self.path, 'rb') as document_file:
+            gzipped = document_file.read()
+
+        self.use(gzip.decompress(gzipped), gzipped, stat)
+        self.items = None
+
+    def use(self, body: bytes, gzipped: bytes, stat: os.stat_result) -> None:
+        """
+        Serve body, identified by the inode and mtime of its published file
+        """
+        self.body = body
+        self.gzipped = gzipped
+        self.etag = hashlib.sha1(body).hexdigest()
+        self.last_modified = datetime.fromtimestamp(stat.st_mtime, timezone.utc)
+        self.version = (stat.st_ino, stat.st_mtime_ns)
+
+    def parse(self) -> Dict[str, Dict[str, Dict]]:
+        data = json.loads(self.body)['data']
+        return {table: {item['id']: item for item in data[table]} for table in PORTFOLIO_TABLES}
+
+    def publish(self) -> None:
+        """
+        Render the items, then write them where every process can load them
+        """
+        def newest_first(items: Dict[str, Dict]) -> List[Dict]:
+            return sorted(items.values(), key=lambda item: (item['created_at'], item['id']), reverse=True)
+
+        body = json.dumps({
+            'status': 'success',
+            'data': {table: newest_first(self.items[table]) for table in PORTFOLIO_TABLES}
+        }, separators=(',', ':')).encode()
+        gzipped = gzip.compress(body, mtime=0)
+
+        descriptor, temp_path = tempfile.mkstemp(dir=os.path.dirname(self.path), suffix='.part')
+        with os.fdopen(descriptor, 'wb') as temp_file:
+            temp_file.write(gzipped)
+
+        os.replace(temp_path, self.path)
+        self.use(body, gzipped, os.stat(self.path))
+
+    def build(self) -> None:
+        """
+        Build the document from the database
+        """
+        from storage import db
+        from models import (
+            Company,
+            Project
+        )
+
+        with self._lock, self.file_lock():
+            self.load()
+            if self.body is not None:
+                return
+
+            db.use_primary()
+            self.items = {
+                model_type.__tablename__: {model.id: model.to_dict() for model in db.get_all(model_type)}
+                for model_type in (Company, Project)
+            }
+            self.publish()
+
+    def apply(self, changes: Iterable[Tuple[str, str]]) -> None:
+        """
+        Update the rows of the committed (table, id) changes to what the
+        primary holds now, dropping the rows that no longer exist
+        """
+        from storage import db
+        from models import (
+            Company,
+            Project
+        )
+
+        if not self.path:
+            return
+
+        touched = defaultdict(set)
+        for table, id in changes:
+            touched[table].add(id)
+
+        with self._lock, self.file_lock():
+            self.load()
+            if self.body is None:
+                return
+
+            if self.items is None:
+                self.items = self.parse()
+
+            with Session(db.engine) as session:
+                for model_type in (Company, Project):
+                    ids = touched.get(model_type.__tablename__)
+                    if not ids:
+                        continue
+
+                    items = self.items[model_type.__tablename__]
+                    for id in ids:
+                        items.pop(id, None)
+
+                    statement = select(model_type).where(model_type.id.in_(ids))
+                    for model in session.execute(statement).scalars():
+                        items[model.id] = model.to_dict()
+
+            self.publish()
+
+    def response(self) -> Response:
+        """
+        Answer with the document, gzipped when the client accepts it
+        """
+        from conditional import conditional_response
+
+        with self._lock:
+            self.load()
+
+        if self.body is None:
+            self.build()
+
+        with self._lock:
+            body, gzipped, etag, last_modified = self.body, self.gzipped, self.etag, self.last_modified
+
+        use_gzip = request.accept_encodings['gzip'] > 0
+        response = conditional_response(
+            f'{etag}-gzip' if use_gzip else etag,
+            last_modified,
+            lambda: current_app.response_class(gzipped if use_gzip else body, mimetype='application/json')
+        )
+        if use_gzip:
+            response.headers['Content-Encoding'] = 'gzip'
+        response.vary.add('Accept-Encoding')
+
+        return response
+
+
+class FileLock:
+    """
+    Exclusive lock across processes, held for the duration of a with block
+    """
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.file = None
+
+    def __enter__(self) -> 'FileLock':
+        self.file = open(self.path, 'a')
+        fcntl.flock(self.file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        fcntl.flock(self.file, fcntl.LOCK_UN)
+        self.file.close()
+
+
+portfolio = Portfolio()
+
+
+@event.listens_for(Session, 'after_flush')
+def record_changes(session: Session, flush_context) -> None:
+    changes = session.info.setdefault('portfolio_changes', set())
+    for model in (*session.new, *session.dirty, *session.deleted):
+        if getattr(model, '__tablename__', None) in PORTFOLIO_TABLES:
+            changes.add((model.__tablename__, model.id))
+
+
+@event.listens_for(Session, 'after_commit')
+def publish_changes(session: Session) -> None:
+    changes = session.info.pop('portfolio_changes', None)
+    if changes:
+        portfolio.apply(changes)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def discard_changes(session: Session, previous_transaction) -> None:
+    session.info.pop('portfolio_changes', None)
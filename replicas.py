@@ -0,0 +1,119 @@
+"""
+Module for routing reads to replica databases
+"""
+import time
+import threading
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import OperationalError
+from flask_sqlalchemy.session import Session
+from typing import (
+    Any,
+    Dict,
+    List,
+    Optional
+)
+
+LATENCY_WEIGHT = 0.2
+
+
+class ReplicaSet:
+    """
+    Hand out the replica engines of an app for reads, skipping the ones
+    that failed recently.
+
+    'round_robin' takes the healthy replicas in turn; 'least_latency'
+    takes the one with the lowest moving average statement time.
+    """
+    def __init__(self, engines: List[Engine], strategy: str = 'round_robin', eject_for: float = 30) -> None:
+        self.engines = engines
+        self.strategy = strategy
+        self.eject_for = eject_for
+        self.latency = {engine: 0.0 for engine in engines}
+        self.ejected_until = {engine: 0.0 for engine in engines}
+        self._turn = 0
+        self._lock = threading.Lock()
+
+        for engine in engines:
+            event.listen(engine, 'before_cursor_execute', self.before_cursor_execute)
+            event.listen(engine, 'after_cursor_execute', self.after_cursor_execute)
+            event.listen(engine, 'handle_error', self.handle_error)
+
+    def choose(self) -> Optional[Engine]:
+        """
+        Return the replica to read from, or None when all are ejected
+        """
+        now = time.monotonic()
+        healthy = [engine for engine in self.engines if self.ejected_until[engine] <= now]
+        if not healthy:
+            return None
+
+        if self.strategy == 'least_latency':
+            return min(healthy, key=self.latency.__getitem__)
+
+        with self._lock:
+            self._turn += 1
+            return healthy[self._turn % len(healthy)]
+
+    def eject(self, engine: Engine) -> None:
+        """
+        Stop reading from engine for eject_for seconds
+        """
+        self.ejected_until[engine] = time.monotonic() + self.eject_for
+        engine.dispose()
+
+    def before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany) -> None:
+        conn.info['replica_started_at'] = time.perf_counter()
+
+    def after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany) -> None:
+        elapsed = time.perf_counter() - conn.info.pop('replica_started_at', time.perf_counter())
+        engine = conn.engine
+        self.latency[engine] += LATENCY_WEIGHT * (elapsed - self.latency[engine])
+
+    def handle_error(self, context: Any) -> None:
+        if context.is_disconnect or isinstance(context.sqlalchemy_exception, OperationalError):
+            self.eject(context.engine)
+
+    def stats(self) -> List[Dict]:
+        now = time.monotonic()
+        return [
+            {
+                'url': engine.url.render_as_string(hide_password=True),
+                'ejected': self.ejected_until[engine] > now,
+                'latency_ms': round(self.latency[engine] * 1000, 3)
+            }
+            for engine in self.engines
+        ]
+
+
+class RoutingSession(Session):
+    """
+    Session sending plain SELECTs to a replica and everything else to the
+    primary. Once the session writes, it reads from the primary too, so a
+    request sees its own writes. A read failing on a replica, which ejects
+    it, is run again on the primary.
+    """
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs) -> Any:
+        if bind is None and not self.info.get('use_primary'):
+            if self._flushing or getattr(clause, 'is_dml', False):
+                self.info['use_primary'] = True
+            elif getattr(clause, 'is_select', False):
+                replicas = self._db.replicas
+                engine = replicas and replicas.choose()
+                if engine is not None:
+                    self.info['read_replica'] = True
+                    return engine
+
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def execute(self, statement, *args, **kwargs) -> Any:
+        self.info.pop('read_replica', None)
+        try:
+            return super().execute(statement, *args, **kwargs)
+        except OperationalError:
+            if not self.info.pop('read_replica', None):
+                raise
+
+        self.rollback()
+        self.info['use_primary'] = True
+        return super().execute(statement, *args, **kwargs)
@@ -0,0 +1,163 @@
+"""
+Module for full-text search over the portfolio
+"""
+import re
+from storage import db
+from collections import Counter
+from sqlalchemy import (
+    desc,
+    func,
+    event,
+    inspect,
+    select,
+    distinct
+)
+from typing import (
+    Dict,
+    List,
+    Tuple
+)
+
+TOKEN = re.compile(r'\w+')
+MAX_TERM_LENGTH = 64
+STOP_WORDS = frozenset((
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 'in',
+    'is', 'it', 'of', 'on', 'or', 'that', 'the', 'to', 'with'
+))
+
+indexed_models: Dict[str, Tuple[type, Dict[str, int]]] = {}
+
+
+class SearchTerm(db.Model):
+    """
+    Inverted index entry: one row per term per indexed document
+    """
+    __tablename__ = 'search_terms'
+    __table_args__ = (
+        db.Index('ix_search_terms_term', 'term', 'doc_type', 'doc_id'),
+        db.Index('ix_search_terms_doc', 'doc_type', 'doc_id')
+    )
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    term = db.Column(db.String(MAX_TERM_LENGTH), nullable=False)
+    doc_type = db.Column(db.String(30), nullable=False)
+    doc_id = db.Column(db.String(60), nullable=False)
+    weight = db.Column(db.Integer, nullable=False)
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Split text into lowercase index terms
+    """
+    return [
+        token[:MAX_TERM_LENGTH] for token in TOKEN.findall((text or '').lower())
+        if len(token) > 1 and token not in STOP_WORDS
+    ]
+
+
+def document_terms(target: object, weights: Dict[str, int]) -> List[Dict]:
+    """
+    Return the index rows of a document, weighting each term by field
+    """
+    scores = Counter()
+    for field, weight in weights.items():
+        for term in tokenize(getattr(target, field)):
+            scores[term] += weight
+
+    doc_type = type(target).__tablename__
+    return [
+        {'term': term, 'doc_type': doc_type, 'doc_id': target.id, 'weight': weight}
+        for term, weight in scores.items()
+    ]
+
+
+def index_model(model_type: type, **weights: int) -> None:
+    """
+    Keep the search index of model_type up to date as rows are written
+    """
+    table = SearchTerm.__table__
+    indexed_models[model_type.__tablename__] = (model_type, weights)
+
+    def remove_document(connection, target) -> None:
+        connection.execute(table.delete().where(
+            table.c.doc_type == model_type.__tablename__,
+            table.c.doc_id == target.id
+        ))
+
+    def add_document(mapper, connection, target) -> None:
+        rows = document_terms(target, weights)
+        if rows:
+            connection.execute(table.insert(), rows)
+
+    def update_document(mapper, connection, target) -> None:
+        state = inspect(target)
+        if any(state.attrs[field].history.has_changes() for field in weights):
+            remove_document(connection, target)
+            add_document(mapper, connection, target)
+
+    def delete_document(mapper, connection, target) -> None:
+        remove_document(connection, target)
+
+    event.listen(model_type, 'after_insert', add_document)
+    event.listen(model_type, 'after_update', update_document)
+    event.listen(model_type, 'after_delete', delete_document)
+
+
+def search(query: str, limit: int) -> List[Dict]:
+    """
+    Rank the indexed documents matching the terms of query
+    """
+    terms = list(dict.fromkeys(tokenize(query)))
+    if not terms:
+        return []
+
+    matched = func.count(distinct(SearchTerm.term)).label('matched')
+    score = func.sum(SearchTerm.weight).label('score')
+    statement = select(
+        SearchTerm.doc_type,
+        SearchTerm.doc_id,
+        matched,
+        score
+    ).where(
+        SearchTerm.term.in_(terms)
+    ).group_by(
+        SearchTerm.doc_type,
+        SearchTerm.doc_id
+    ).order_by(
+        desc(matched),
+        desc(score),
+        SearchTerm.doc_id
+    ).limit(limit)
+    hits = db.session.execute(statement).all()
+
+    documents = {}
+    for doc_type in {hit.doc_type for hit in hits}:
+        model_type, _ = indexed_models[doc_type]
+        ids = [hit.doc_id for hit in hits if hit.doc_type == doc_type]
+        for model in db.session.query(model_type).filter(model_type.id.in_(ids)):
+            documents[(doc_type, model.id)] = model
+
+    return [
+        {
+            'type': hit.doc_type,
+            'score': int(hit.score),
+            'data': documents[(hit.doc_type, hit.doc_id)].to_dict()
+        }
+        for hit in hits if (hit.doc_type, hit.doc_id) in documents
+    ]
+
+
+def rebuild_index() -> int:
+    """
+    Rebuild the whole search index from the indexed tables
+    """
+    db.session.execute(SearchTerm.__table__.delete())
+    count = 0
+    for model_type, weights in indexed_models.values():
+        for model in db.session.query(model_type).yield_per(500):
+            rows = document_terms(model, weights)
+            if rows:
+                db.session.execute(SearchTerm.__table__.insert(), rows)
+            count += 1
+
+    db.session.commit()
+    return count
@@ -1,26 +1,329 @@
-from sqlalchemy import desc
+import os
+import json
+import time
+import base64
+import threading
+from weakref import WeakKeyDictionary
+from flask import (
+    g,
+    Flask,
+    current_app
+)
+from sqlalchemy.orm import (
+    Session,
+    load_only
+)
+from contextlib import contextmanager
+from cache import (
+    LRUCache,
+    SharedCache
+)
+from datetime import datetime
 from exc import AbortException
+from collections import defaultdict
+from sqlalchemy import (
+    and_,
+    or_,
+    desc,
+    text,
+    select,
+    inspect
+)
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy.exc import IntegrityError
+from replicas import (
+    ReplicaSet,
+    RoutingSession
+)
+from sqlalchemy.exc import (
+    SQLAlchemyError,
+    IntegrityError
+)
 from typing import (
+    Any,
     Type,
     Dict,
     List,
-    TypeVar
+    Tuple,
+    TypeVar,
+    Iterator,
+    Callable,
+    Hashable,
+    Optional,
+    Sequence
 )
 
 Model = TypeVar('Model')
 
+
+def now() -> datetime:
+    """
+    The current time at the precision of a DATETIME column, so a model
+    kept in memory after its commit holds what a later read returns
+    """
+    return datetime.now().replace(microsecond=0)
+
+
 class DBStorage(SQLAlchemy):
+    def __init__(self, *args, **kwargs) -> None:
+        kwargs.setdefault('session_options', {}).setdefault('class_', RoutingSession)
+        super().__init__(*args, **kwargs)
+        self.cache = LRUCache()
+        self.shared_cache: Optional[SharedCache] = None
+        self.versions = defaultdict(int)
+        self._versions_lock = threading.Lock()
+        self._versions_seen = {}
+        self._replicas = WeakKeyDictionary()
+
+    def init_app(self, app: Flask) -> None:
+        """
+        Set up the app's engines, registering each of its replica URIs as
+        a bind that reads can be routed to
+        """
+        replica_keys = [f'replica_{index}' for index in range(len(app.config['SQLALCHEMY_REPLICA_URIS']))]
+        app.config['SQLALCHEMY_BINDS'] = {
+            **(app.config.get('SQLALCHEMY_BINDS') or {}),
+            **dict(zip(replica_keys, app.config['SQLALCHEMY_REPLICA_URIS']))
+        }
+
+        super().init_app(app)
+        self.cache.configure(app.config['CACHE_MAX_SIZE'], app.config['CACHE_TTL'])
+        self.shared_cache = None
+        if app.config['CACHE_BACKEND'] == 'shared':
+            path = app.config['CACHE_SHARED_PATH'] or os.path.join(app.instance_path, 'cache.sqlite')
+            self.shared_cache = SharedCache(path, app.config['CACHE_SHARED_MAX_SIZE'], app.config['CACHE_TTL'])
+        if replica_keys:
+            engines = self._app_engines[app]
+            self._replicas[app] = ReplicaSet(
+                [engines[key] for key in replica_keys],
+                app.config['REPLICA_STRATEGY'],
+                app.config['REPLICA_EJECT_SECONDS']
+            )
+
+    @property
+    def replicas(self) -> Optional[ReplicaSet]:
+        """
+        The replica set of the current app, if it has replicas
+        """
+        return self._replicas.get(current_app._get_current_object())
+
+    def warm_up(self, size: int) -> None:
+        """
+        Open size connections up front so the first requests do not pay
+        for the connection handshake
+        """
+        connections = [self.engine.connect() for _ in range(size)]
+        for connection in connections:
+            connection.close()
+
+    def dispose_engines(self) -> None:
+        """
+        Drop the connections inherited from a parent process without
+        closing them, so a forked worker opens its own
+        """
+        for engine in self.engines.values():
+            engine.dispose(close=False)
+
+    def upgrade_schema(self) -> List[str]:
+        """
+        Add the columns and indexes of the models that are missing from
+        tables which already exist, since create_all skips those tables,
+        and return their names. Added columns are always nullable.
+        """
+        applied = []
+        with self.engine.begin() as connection:
+            inspector = inspect(connection)
+            preparer = connection.dialect.identifier_preparer
+            for table in self.metadata.sorted_tables:
+                if not inspector.has_table(table.name):
+                    continue
+
+                existing = {column['name'] for column in inspector.get_columns(table.name)}
+                for column in table.columns:
+                    if column.name in existing:
+                        continue
+
+                    connection.execute(text(
+                        f'ALTER TABLE {preparer.format_table(table)} '
+                        f'ADD COLUMN {preparer.format_column(column)} '
+                        f'{column.type.compile(dialect=connection.dialect)}'
+                    ))
+                    applied.append(f'{table.name}.{column.name}')
+
+                existing = {index['name'] for index in inspector.get_indexes(table.name)}
+                for index in table.indexes:
+                    if index.name not in existing:
+                        index.create(connection)
+                        applied.append(index.name)
+
+        return applied
+
+    def health(self) -> Dict:
+        """
+        Ping the database and report the state of the connection pool
+        """
+        pool = self.engine.pool
+        stats = {
+            name: getattr(pool, method)()
+            for name, method in (
+                ('size', 'size'),
+                ('checked_in', 'checkedin'),
+                ('checked_out', 'checkedout'),
+                ('overflow', 'overflow')
+            )
+            if hasattr(pool, method)
+        }
+
+        try:
+            start = time.perf_counter()
+            self.session.execute(text('SELECT 1'))
+            stats['ping_ms'] = round((time.perf_counter() - start) * 1000, 3)
+        except SQLAlchemyError as err:
+            self.session.rollback()
+            stats['error'] = str(err).split('\n')[0]
+
+        if self.replicas:
+            stats['replicas'] = self.replicas.stats()
+
+        return stats
+
+    def bump_version(self, model_type: Type[Model]) -> None:
+        """
+        Invalidate every cached read of model_type, in every process when
+        the cache is shared
+        """
+        with self._versions_lock:
+            self.versions[model_type.__name__] += 1
+
+        if self.shared_cache:
+            self.shared_cache.bump(model_type.__name__)
+
+    def version(self, model_type: Type[Model]) -> Optional[int]:
+        """
+        Return the version of model_type the cached reads are keyed on
+        """
+        if self.shared_cache:
+            return self.shared_cache.generation(model_type.__name__)
+
+        return self.versions[model_type.__name__]
+
+    def cache_key(self, model_type: Type[Model], key: Hashable) -> Optional[Tuple]:
+        """
+        Return the cache key of key for the current version of model_type,
+        or None when reads of model_type cannot be cached right now
+        """
+        version = self.version(model_type)
+        return None if version is None else (model_type.__name__, version, key)
+
+    def recently_changed(self, model_type: Type[Model], version: int) -> bool:
+        """
+        Tell whether this process first saw version of model_type less than
+        REPLICA_LAG_SECONDS ago, so replicas may not have its writes yet
+        """
+        now = time.monotonic()
+        with self._versions_lock:
+            seen = self._versions_seen.get(model_type.__name__)
+            if seen is None or seen[0] != version:
+                seen = self._versions_seen[model_type.__name__] = (version, now)
+
+        return now - seen[1] < current_app.config['REPLICA_LAG_SECONDS']
+
+    def cache_get(self, cache_key: Tuple) -> Tuple[bool, Any]:
+        """
+        Look cache_key up in the process cache, then in the shared cache
+        """
+        hit, value = self.cache.get(cache_key)
+        if hit or not self.shared_cache:
+            return hit, value
+
+        hit, value = self.shared_cache.get(repr(cache_key))
+        if hit:
+            self.cache.set(cache_key, value)
+
+        return hit, value
+
+    def cache_set(self, cache_key: Tuple, value: Any) -> None:
+        self.cache.set(cache_key, value)
+        if self.shared_cache:
+            self.shared_cache.set(repr(cache_key), value)
+
+    def cached(self, model_type: Type[Model], key: Hashable, loader: Callable[[], Any]) -> Any:
+        """
+        Return the cached result of loader for the current version of
+        model_type, calling loader only on a miss. Right after a write,
+        loader reads from the primary so no replica lag gets cached.
+        """
+        cache_key = self.cache_key(model_type, key)
+        if cache_key is None:
+            return loader()
+
+        hit, value = self.cache_get(cache_key)
+        if hit:
+            return value
+
+        if self.replicas and self.recently_changed(model_type, cache_key[1]):
+            self.use_primary()
+
+        value = loader()
+        self.cache_set(cache_key, value)
+        return value
+
+    def commit(self, *model_types: Type[Model]) -> None:
+        """
+        Commit the session and invalidate the cached reads of model_types,
+        or defer both to the end of the enclosing unit of work
+        """
+        pending = g.get('unit_of_work')
+        if pending is not None:
+            pending.update(model_types)
+            return
+
+        self.session.commit()
+        for model_type in model_types:
+            self.bump_version(model_type)
+
+    def use_primary(self) -> None:
+        """
+        Send every later statement of the session to the primary, so the
+        rows a write is about to change are not read from a lagging replica
+        """
+        self.session.info['use_primary'] = True
+
+    @contextmanager
+    def unit_of_work(self) -> Iterator[Session]:
+        """
+        Group every write made in the block into one flush and one commit,
+        rolling all of them back if any fails
+        """
+        if g.get('unit_of_work') is not None:
+            yield self.session
+            return
+
+        g.unit_of_work = pending = set()
+        self.use_primary()
+        try:
+            yield self.session
+            self.session.commit()
+        except IntegrityError as err:
+            self.session.rollback()
+            raise AbortException({'error': str(err).split('\n')[0]})
+        except BaseException:
+            self.session.rollback()
+            raise
+        finally:
+            g.pop('unit_of_work', None)
+
+        for model_type in pending:
+            self.bump_version(model_type)
+
     def new(self, model_type: Type[Model], **fields: Dict) -> Model:
         return model_type(**fields)
 
     def save(self, model_type: Type[Model], model: Model) -> Model:
         try:
             self.session.add(model)
-            self.session.commit()
+            self.commit(model_type)
 
-            return self.session.get(model_type, model.id)
+            return model
         except IntegrityError as err:
             self.session.rollback()
             raise AbortException({'error': str(err).split('\n')[0]})
@@ -29,41 +332,179 @@ class DBStorage(SQLAlchemy):
         model = self.new(model_type, **fields)
         return self.save(model_type, model)
 
+    def save_many(self, model_type: Type[Model], models: List[Model]) -> List[Model]:
+        """
+        Insert many models in one transaction
+        """
+        try:
+            self.session.add_all(models)
+            self.commit(model_type)
+
+            return models
+        except IntegrityError as err:
+            self.session.rollback()
+            raise AbortException({'error': str(err).split('\n')[0]})
+
+    def delete_many(self, model_type: Type[Model], ids: List[str]) -> List[str]:
+        """
+        Delete the models with the given ids in one transaction and return
+        the ids that existed
+        """
+        self.use_primary()
+        try:
+            models = self.session.query(model_type).filter(model_type.id.in_(ids)).all()
+            for model in models:
+                self.session.delete(model)
+
+            self.commit(model_type)
+
+            return [model.id for model in models]
+        except IntegrityError as err:
+            self.session.rollback()
+            raise AbortException({'error': str(err).split('\n')[0]})
+
     def delete(self, model_type: Type[Model], id: str) -> None:
+        self.use_primary()
         try:
             model = self.session.get(model_type, id)
             if not model:
                 raise AbortException({'error':'object does not exist' }, 'Not Found', 404)
 
             self.session.delete(model)
-            self.session.commit()
+            self.commit(model_type)
         except IntegrityError as err:
             self.session.rollback()
             raise AbortException({'error': str(err).split('\n')[0]})
 
     def update(self, model_type: Type[Model], id: str, **fields: Dict) -> Model:
-        from app import bcrypt
+        from app import hasher
 
+        self.use_primary()
         model = self.session.get(model_type, id)
         if not model:
             raise AbortException({'error':'object does not exist' }, 'Not Found', 404)
 
         for field, value in fields.items():
             if field == 'password':
-                value = bcrypt.generate_password_hash(value).decode('utf-8')
+                value = hasher.generate_password_hash(value)
 
             setattr(model, field, value)
 
         return self.save(model_type, model)
 
-    def get(self, model_type: Type[Model], **fields: Dict) -> List[Model]:
-        return self.session.query(model_type).filter_by(**fields).first()
+    @staticmethod
+    def load_only(query: Any, model_type: Type[Model], columns: Optional[Sequence[str]]) -> Any:
+        """
+        Restrict the columns fetched by query to columns, when given
+        """
+        if not columns:
+            return query
+
+        return query.options(load_only(*(getattr(model_type, column) for column in columns)))
+
+    def get(
+        self,
+        model_type: Type[Model],
+        columns: Optional[Sequence[str]] = None,
+        **fields: Dict
+    ) -> List[Model]:
+        query = self.load_only(self.session.query(model_type), model_type, columns)
+        return query.filter_by(**fields).first()
 
     def get_some(self, model_type: Type[Model], **fields: Dict) -> List[Model]:
         return self.session.query(model_type).filter_by(**fields).order_by(desc(model_type.created_at)).all()
 
-    def get_all(self, model_type: Type[Model]) -> List[Model]:
-        return self.session.query(model_type).order_by(desc(model_type.created_at)).all()
+    def get_all(self, model_type: Type[Model], columns: Optional[Sequence[str]] = None) -> List[Model]:
+        query = self.load_only(self.session.query(model_type), model_type, columns)
+        return query.order_by(desc(model_type.created_at)).all()
+
+    def iter_all(
+        self,
+        model_type: Type[Model],
+        batch_size: int,
+        columns: Optional[Sequence[str]] = None
+    ) -> Iterator[Model]:
+        """
+        Iterate over all models through a server-side cursor, holding at
+        most batch_size rows in memory at a time
+        """
+        statement = self.load_only(select(model_type), model_type, columns).order_by(
+            desc(model_type.created_at)
+        ).execution_options(yield_per=batch_size)
+
+        return iter(self.session.execute(statement).scalars())
+
+    def get_page(
+        self,
+        model_type: Type[Model],
+        limit: int,
+        cursor: Optional[str] = None,
+        columns: Optional[Sequence[str]] = None,
+        **fields: Dict
+    ) -> Tuple[List[Model], Optional[str]]:
+        """
+        Fetch one page of models ordered by (created_at, id) descending.
+
+        The cursor is the opaque position of the last row of the previous
+        page, so every page is an index range scan instead of an OFFSET.
+        """
+        statement = self.page_statement(model_type, limit, cursor, columns, **fields)
+        return self.split_page(self.session.execute(statement).scalars().all(), limit)
+
+    @classmethod
+    def page_statement(
+        cls,
+        model_type: Type[Model],
+        limit: int,
+        cursor: Optional[str] = None,
+        columns: Optional[Sequence[str]] = None,
+        **fields: Dict
+    ) -> Any:
+        """
+        Build the query of get_page, fetching one extra row to tell
+        whether another page follows
+        """
+        if columns:
+            columns = {*columns, 'created_at'}
+
+        statement = cls.load_only(select(model_type), model_type, columns).filter_by(**fields)
+        if cursor:
+            created_at, id = cls.decode_cursor(cursor)
+            statement = statement.where(or_(
+                model_type.created_at < created_at,
+                and_(model_type.created_at == created_at, model_type.id < id)
+            ))
+
+        return statement.order_by(
+            desc(model_type.created_at),
+            desc(model_type.id)
+        ).limit(limit + 1)
+
+    @classmethod
+    def split_page(cls, models: List[Model], limit: int) -> Tuple[List[Model], Optional[str]]:
+        """
+        Trim the extra row fetched by page_statement into a next cursor
+        """
+        next_cursor = None
+        if len(models) > limit:
+            models = models[:limit]
+            next_cursor = cls.encode_cursor(models[-1])
+
+        return models, next_cursor
+
+    @staticmethod
+    def encode_cursor(model: Model) -> str:
+        position = json.dumps([model.created_at.isoformat(), model.id])
+        return base64.urlsafe_b64encode(position.encode()).decode().rstrip('=')
+
+    @staticmethod
+    def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+        try:
+            padding = '=' * (-len(cursor) % 4)
+            created_at, id = json.loads(base64.urlsafe_b64decode(cursor + padding))
+            return datetime.fromisoformat(created_at), str(id)
+        except (ValueError, TypeError):
+            raise AbortException({'error': 'invalid cursor'}, 'Unprocessable Entity', 422)
 
 
-db = DBStorage()
+db = DBStorage(session_options={'expire_on_commit': False})
@@ -3,8 +3,16 @@ os.environ['CONFIG'] = 'testing'
 
 import unittest
 from storage import db
+from sqlalchemy import event
+from contextlib import contextmanager
+from auth import throttle
+from portfolio import portfolio
 from app_main import app
-from typing import TypeVar
+from typing import (
+    List,
+    TypeVar,
+    Iterator
+)
 
 Model = TypeVar('Model')
 
@@ -66,8 +74,27 @@ class BaseTestCase(unittest.TestCase):
         """
         self.db.session.remove()
         self.db.drop_all()
+        self.db.cache.clear()
+        throttle.clear()
+        portfolio.reset()
         self.app_context.pop()
 
+    @contextmanager
+    def record_statements(self) -> Iterator[List[str]]:
+        """
+        Collect the SQL statements run on the primary engine within the block
+        """
+        statements = []
+
+        def record(conn, cursor, statement, *args) -> None:
+            statements.append(statement)
+
+        event.listen(self.db.engine, 'before_cursor_execute', record)
+        try:
+            yield statements
+        finally:
+            event.remove(self.db.engine, 'before_cursor_execute', record)
+
     def login_user(self) -> dict:
         """
         Login the user
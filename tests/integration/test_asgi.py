@@ -0,0 +1,158 @@
+import os
+import shutil
+import asyncio
+import tempfile
+import unittest
+from datetime import datetime
+from tests.integration.base_test import BaseTestCase
+
+try:
+    import aiosqlite
+    from asgi import AsyncApp
+    from async_storage import AsyncDBStorage
+except ImportError:
+    aiosqlite = None
+
+
+def call(application, method: str, path: str, query: str = '', headers: dict = None) -> tuple:
+    """
+    Send one request to an ASGI application and return (status, headers, body)
+    """
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {
+        'type': 'http',
+        'http_version': '1.1',
+        'method': method,
+        'path': path,
+        'root_path': '',
+        'query_string': query.encode(),
+        'headers': [(name.lower().encode(), value.encode()) for name, value in (headers or {}).items()]
+    }
+    asyncio.run(application(scope, receive, send))
+
+    start = messages[0]
+    body = b''.join(message.get('body', b'') for message in messages[1:])
+    return start['status'], {name.decode(): value.decode() for name, value in start['headers']}, body
+
+
+@unittest.skipUnless(aiosqlite, 'aiosqlite and asgiref are not installed')
+class TestAsgi(BaseTestCase):
+    """
+    Test the ASGI entry point against a SQLite file through aiosqlite
+    """
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.directory = tempfile.mkdtemp()
+        self.storage = AsyncDBStorage(self.db)
+        self.app.config['ASYNC_DATABASE_URI'] = f"sqlite+aiosqlite:///{os.path.join(self.directory, 'async.sqlite')}"
+        self.storage.init_app(self.app)
+        self.application = AsyncApp(self.app, self.storage)
+
+        async def create_all():
+            async with self.storage.engine.begin() as connection:
+                await connection.run_sync(self.db.metadata.create_all)
+
+        asyncio.run(create_all())
+
+    def tearDown(self) -> None:
+        self.app.config['ASYNC_DATABASE_URI'] = None
+        asyncio.run(self.storage.dispose())
+        shutil.rmtree(self.directory)
+        super().tearDown()
+
+    def save_project(self, name: str, **fields):
+        from models import Project
+
+        return asyncio.run(self.storage.save_new(Project, name=name, description='served natively', **fields))
+
+    def test_get_projects(self) -> None:
+        self.save_project('first')
+        self.save_project('second')
+
+        status, headers, body = call(self.application, 'GET', '/projects')
+
+        self.assertEqual(status, 200)
+        self.assertEqual(headers['cache-control'], 'no-cache')
+        data = self.app.json.loads(body)['data']
+        self.assertEqual({project['name'] for project in data}, {'first', 'second'})
+
+        status, _, body = call(self.application, 'GET', '/projects', '', {'If-None-Match': headers['etag']})
+
+        self.assertEqual(status, 304)
+        self.assertEqual(body, b'')
+
+    def test_get_projects_page(self) -> None:
+        for second, name in enumerate(('first', 'second', 'third')):
+            self.save_project(name, created_at=datetime(2024, 1, 1, 0, 0, second))
+
+        status, _, body = call(self.application, 'GET', '/projects', 'limit=2&fields=name')
+        page = self.app.json.loads(body)
+
+        self.assertEqual(status, 200)
+        self.assertEqual(page['data'], [{'name': 'third'}, {'name': 'second'}])
+
+        _, _, body = call(self.application, 'GET', '/projects', f"limit=2&fields=name&cursor={page['next_cursor']}")
+
+        self.assertEqual(self.app.json.loads(body)['data'], [{'name': 'first'}])
+        self.assertEqual(call(self.application, 'GET', '/projects', 'limit=0')[0], 422)
+
+    def test_get_a_project(self) -> None:
+        project = self.save_project('first')
+
+        status, _, body = call(self.application, 'GET', f'/projects/{project.id}')
+
+        self.assertEqual(status, 200)
+        self.assertEqual(self.app.json.loads(body)['data']['name'], 'first')
+        self.assertEqual(call(self.application, 'GET', '/projects/missing')[0], 404)
+
+    def test_write_invalidates_native_reads(self) -> None:
+        from models import Project
+
+        project = self.save_project('first')
+        call(self.application, 'GET', '/projects')
+        asyncio.run(self.storage.delete(Project, project.id))
+
+        _, _, body = call(self.application, 'GET', '/projects')
+
+        self.assertEqual(self.app.json.loads(body)['data'], [])
+
+    def test_shared_cache_is_read_off_the_event_loop(self) -> None:
+        import threading
+        from cache import SharedCache
+        from unittest.mock import patch
+
+        threads = []
+        shared_cache = SharedCache(os.path.join(self.directory, 'cache.sqlite'))
+        generation = shared_cache.generation
+
+        def record_generation(name):
+            threads.append(threading.current_thread())
+            return generation(name)
+
+        self.save_project('first')
+        with patch.object(self.db, 'shared_cache', shared_cache), \
+                patch.object(shared_cache, 'generation', side_effect=record_generation):
+            status, _, _ = call(self.application, 'GET', '/projects')
+
+        self.assertEqual(status, 200)
+        self.assertTrue(threads)
+        self.assertNotIn(threading.main_thread(), threads)
+
+    def test_other_routes_go_through_flask(self) -> None:
+        status, _, body = call(self.application, 'GET', '/status')
+
+        self.assertEqual(status, 200)
+        self.assertEqual(self.app.json.loads(body)['data']['app_status'], 'your app is active')
+
+        status, _, body = call(self.application, 'GET', '/projects', 'stream=true')
+
+        self.assertEqual(status, 200)
+        self.assertEqual(self.app.json.loads(body)['data'], [])
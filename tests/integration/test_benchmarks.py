@@ -0,0 +1,58 @@
+import os
+import sys
+import json
+import unittest
+import subprocess
+from benchmarks.routes import (
+    compare,
+    SCENARIOS
+)
+
+
+class TestRouteBenchmark(unittest.TestCase):
+    """
+    Test that the route benchmark runs every scenario without errors
+    """
+
+    def test_run(self) -> None:
+        env = {
+            name: value for name, value in os.environ.items()
+            if name not in ('CONFIG', 'UPLOAD_DIR')
+        }
+        output = subprocess.run(
+            [
+                sys.executable, '-m', 'benchmarks.routes',
+                '--iterations', '2',
+                '--warmup', '1',
+                '--projects', '5',
+                '--companies', '5',
+                '--tokens', '5'
+            ],
+            env=env,
+            capture_output=True,
+            text=True,
+            check=True
+        ).stdout
+        report = json.loads(output)
+
+        self.assertEqual(set(report['results']), {'test_client', 'wsgi_server'})
+        for driver, results in report['results'].items():
+            self.assertEqual(set(results), {scenario.name for scenario in SCENARIOS})
+            for name, result in results.items():
+                with self.subTest(driver=driver, scenario=name):
+                    self.assertEqual(result['errors'], 0)
+                    self.assertEqual(result['requests'], 2)
+
+    def test_compare(self) -> None:
+        result = {'p95_ms': 1.0, 'queries_per_request': 2.0}
+        baseline = {'results': {'test_client': {'login': result, 'search': result}}}
+        report = {'results': {'test_client': {
+            'login': {'p95_ms': 1.1, 'queries_per_request': 2.5},
+            'search': {'p95_ms': 1.5, 'queries_per_request': 3.0},
+            'status': {'p95_ms': 9.0, 'queries_per_request': 9.0}
+        }}}
+
+        regressions = compare(report, baseline, 0.2)
+
+        self.assertEqual(len(regressions), 2)
+        self.assertTrue(all(regression.startswith('test_client/search') for regression in regressions))
@@ -0,0 +1,129 @@
+import os
+os.environ['CONFIG'] = 'testing'
+
+import shutil
+import tempfile
+import unittest
+from flask import Flask
+from datetime import datetime
+from config import config
+from storage import DBStorage
+from sqlalchemy import create_engine
+from unittest.mock import patch
+from models import Company
+
+
+class TestReplicas(unittest.TestCase):
+    """
+    Test read routing against a primary and a replica SQLite file
+    """
+
+    def setUp(self) -> None:
+        self.directory = tempfile.mkdtemp()
+        self.primary_uri = f"sqlite:///{os.path.join(self.directory, 'primary.sqlite')}"
+        self.replica_uri = f"sqlite:///{os.path.join(self.directory, 'replica.sqlite')}"
+        for uri in (self.primary_uri, self.replica_uri):
+            engine = create_engine(uri)
+            Company.metadata.create_all(engine)
+            engine.dispose()
+
+        self.app = Flask(__name__)
+        self.app.config.from_object(config['testing'])
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = self.primary_uri
+        self.app.config['SQLALCHEMY_REPLICA_URIS'] = [self.replica_uri]
+        self.storage = DBStorage(session_options={'expire_on_commit': False})
+        self.storage.init_app(self.app)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+
+    def tearDown(self) -> None:
+        self.storage.session.remove()
+        for engine in self.storage.engines.values():
+            engine.dispose()
+
+        self.app_context.pop()
+        shutil.rmtree(self.directory)
+
+    def add_to_replica(self, name: str) -> None:
+        engine = self.storage.engines['replica_0']
+        with engine.begin() as connection:
+            connection.execute(Company.__table__.insert(), {
+                'id': name,
+                'name': name,
+                'description': 'replicated',
+                'created_at': datetime(2024, 1, 1),
+                'updated_at': datetime(2024, 1, 1)
+            })
+
+    def test_reads_go_to_replica(self) -> None:
+        self.add_to_replica('on-replica')
+
+        self.assertEqual([company.name for company in self.storage.get_all(Company)], ['on-replica'])
+        self.assertEqual(self.storage.get(Company, id='on-replica').name, 'on-replica')
+
+    def test_reads_after_write_go_to_primary(self) -> None:
+        self.add_to_replica('on-replica')
+        company = self.storage.save_new(Company, name='on-primary', description='written')
+
+        self.assertEqual([model.id for model in self.storage.get_all(Company)], [company.id])
+
+        self.storage.session.remove()
+
+        self.assertEqual([model.name for model in self.storage.get_all(Company)], ['on-replica'])
+
+    def test_writes_read_rows_from_primary(self) -> None:
+        ids = [self.storage.save_new(Company, name=name, description='written').id for name in ('a', 'b', 'c')]
+        self.storage.session.remove()
+
+        self.assertEqual(self.storage.update(Company, ids[0], name='renamed').name, 'renamed')
+        self.storage.session.remove()
+        self.storage.delete(Company, ids[1])
+        self.storage.session.remove()
+
+        self.assertEqual(self.storage.delete_many(Company, [ids[2]]), [ids[2]])
+
+    def test_cache_misses_after_write_read_primary(self) -> None:
+        def load():
+            return [model.name for model in self.storage.get_all(Company)]
+
+        self.add_to_replica('on-replica')
+        self.storage.save_new(Company, name='on-primary', description='written')
+        self.storage.session.remove()
+
+        self.assertEqual(self.storage.cached(Company, 'all', load), ['on-primary'])
+
+        self.storage.session.remove()
+        self.storage.cache.clear()
+        with patch('storage.time.monotonic', return_value=10 ** 9):
+            self.assertEqual(self.storage.cached(Company, 'all', load), ['on-replica'])
+
+    def test_failed_replica_read_is_retried_on_primary(self) -> None:
+        self.storage.save_new(Company, name='on-primary', description='written')
+        self.storage.session.remove()
+        with self.storage.engines['replica_0'].begin() as connection:
+            connection.exec_driver_sql('DROP TABLE companies')
+
+        self.assertEqual([model.name for model in self.storage.get_all(Company)], ['on-primary'])
+        self.assertTrue(self.storage.health()['replicas'][0]['ejected'])
+
+        self.storage.session.remove()
+
+        self.assertEqual([model.name for model in self.storage.get_all(Company)], ['on-primary'])
+
+        with patch('replicas.time.monotonic', return_value=10 ** 9):
+            self.assertIs(self.storage.replicas.choose(), self.storage.engines['replica_0'])
+
+    def test_least_latency_strategy(self) -> None:
+        replicas = self.storage.replicas
+        fast = object()
+        replicas.engines.append(fast)
+        replicas.latency[fast] = 0.0
+        replicas.latency[replicas.engines[0]] = 0.5
+        replicas.ejected_until[fast] = 0.0
+        replicas.strategy = 'least_latency'
+
+        self.assertIs(replicas.choose(), fast)
+
+        replicas.strategy = 'round_robin'
+
+        self.assertEqual({replicas.choose(), replicas.choose()}, {fast, replicas.engines[0]})
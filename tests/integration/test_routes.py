@@ -1,4 +1,10 @@
+import io
+import os
+import hashlib
+import tempfile
 from exc import AbortException
+from cleanup import file_reaper
+from datetime import datetime, timedelta, timezone
 from unittest.mock import patch, MagicMock
 from tests.integration.base_test import BaseTestCase
 
@@ -250,3 +256,902 @@ class TestRoutes(BaseTestCase):
 
         self.assertEqual(resp.status_code, 400)
         self.assertEqual(resp.get_json()['data'], {'error':'error'})
+
+    def test_get_projects_paginated(self) -> None:
+        projects = [self.create_project() for _ in range(5)]
+        seen = []
+        cursor = None
+
+        for size in (2, 2, 1):
+            query = '/projects?limit=2' + (f'&cursor={cursor}' if cursor else '')
+            resp = self.test_client.get(query)
+
+            self.assertEqual(resp.status_code, 200)
+            self.assertEqual(len(resp.get_json()['data']), size)
+            seen.extend(project['id'] for project in resp.get_json()['data'])
+            cursor = resp.get_json()['next_cursor']
+
+        self.assertIsNone(cursor)
+        self.assertEqual(sorted(seen), sorted(project.id for project in projects))
+
+    def test_get_companies_paginated_invalid_input(self) -> None:
+        for query in ('limit=0', 'limit=abc', 'limit=1000', 'cursor=notacursor'):
+            with self.subTest(query=query):
+                resp = self.test_client.get(f'/companies?{query}')
+
+                self.assertEqual(resp.status_code, 422)
+
+    def test_get_companies_streamed(self) -> None:
+        companies = [self.create_company() for _ in range(3)]
+        resp = self.test_client.get('/companies?stream=true')
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(resp.is_streamed)
+        self.assertEqual(resp.get_json()['status'], 'success')
+        self.assertEqual(
+            [company['id'] for company in resp.get_json()['data']],
+            [company['id'] for company in self.test_client.get('/companies').get_json()['data']]
+        )
+        self.assertEqual(len(resp.get_json()['data']), len(companies))
+
+    def test_get_projects_streamed_empty(self) -> None:
+        resp = self.test_client.get('/projects?stream=true')
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.get_json(), {'status': 'success', 'data': []})
+
+    def test_get_a_project_cached_until_write(self) -> None:
+        project = self.create_project()
+        self.test_client.get(f'/projects/{project.id}')
+
+        with patch('storage.db.get') as get_mock:
+            resp = self.test_client.get(f'/projects/{project.id}')
+
+            get_mock.assert_not_called()
+            self.assertEqual(resp.get_json()['data']['name'], self.project_name)
+
+        self.db.update(type(project), project.id, name='newname')
+        resp = self.test_client.get(f'/projects/{project.id}')
+
+        self.assertEqual(resp.get_json()['data']['name'], 'newname')
+
+    def test_shared_cache_across_workers(self) -> None:
+        from cache import SharedCache
+        from models import Project
+
+        project = self.create_project()
+        with tempfile.TemporaryDirectory() as cache_dir, \
+                patch.object(self.db, 'shared_cache', SharedCache(os.path.join(cache_dir, 'cache.sqlite'))):
+            other_worker = SharedCache(self.db.shared_cache.path)
+            self.test_client.get(f'/projects/{project.id}')
+            self.db.cache.clear()
+
+            with patch('storage.db.get') as get_mock:
+                resp = self.test_client.get(f'/projects/{project.id}')
+
+                get_mock.assert_not_called()
+                self.assertEqual(resp.get_json()['data']['name'], self.project_name)
+
+            self.db.session.execute(Project.__table__.update().values(name='newname'))
+            self.db.session.commit()
+            self.db.session.expire_all()
+            other_worker.bump('Project')
+            resp = self.test_client.get(f'/projects/{project.id}')
+
+            self.assertEqual(resp.get_json()['data']['name'], 'newname')
+
+            self.db.update(Project, project.id, name='othername')
+
+            self.assertEqual(other_worker.generation('Project'), 2)
+
+    def test_get_companies_cache_invalidated_on_delete(self) -> None:
+        auth_header = self.login_user()
+        company = self.create_company()
+        self.assertEqual(len(self.test_client.get('/companies').get_json()['data']), 1)
+
+        self.test_client.delete(f'/companies/{company.id}', headers=auth_header)
+
+        self.assertEqual(len(self.test_client.get('/companies').get_json()['data']), 0)
+
+    def test_get_a_company_not_modified(self) -> None:
+        company = self.create_company()
+        resp = self.test_client.get(f'/companies/{company.id}')
+        etag = resp.headers['ETag']
+
+        self.assertEqual(resp.headers['Cache-Control'], 'no-cache')
+        self.assertIn('Last-Modified', resp.headers)
+
+        resp = self.test_client.get(f'/companies/{company.id}', headers={'If-None-Match': etag})
+
+        self.assertEqual(resp.status_code, 304)
+        self.assertEqual(resp.data, b'')
+
+        self.db.update(type(company), company.id, name='newname')
+        resp = self.test_client.get(f'/companies/{company.id}', headers={'If-None-Match': etag})
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertNotEqual(resp.headers['ETag'], etag)
+
+    def test_last_modified_is_utc_on_a_non_utc_host(self) -> None:
+        import time
+
+        self.addCleanup(time.tzset)
+        with patch.dict(os.environ, {'TZ': 'Asia/Tokyo'}):
+            time.tzset()
+            company = self.create_company()
+            resp = self.test_client.get(f'/companies/{company.id}')
+
+        self.assertLess(abs(resp.last_modified - datetime.now(timezone.utc)), timedelta(minutes=1))
+
+    def test_get_projects_not_modified_without_loading_rows(self) -> None:
+        self.create_project()
+        etag = self.test_client.get('/projects').headers['ETag']
+
+        with patch('storage.db.get_all') as get_all_mock:
+            resp = self.test_client.get('/projects', headers={'If-None-Match': etag})
+
+            get_all_mock.assert_not_called()
+            self.assertEqual(resp.status_code, 304)
+
+        self.assertNotEqual(self.test_client.get('/projects?limit=1').headers['ETag'], etag)
+        self.create_project()
+        resp = self.test_client.get('/projects', headers={'If-None-Match': etag})
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(len(resp.get_json()['data']), 2)
+
+    def test_get_projects_modified_after_delete(self) -> None:
+        auth_header = self.login_user()
+        older = self.create_project()
+        self.create_project()
+        resp = self.test_client.get('/projects')
+
+        self.assertNotIn('Last-Modified', resp.headers)
+
+        self.test_client.delete(f'/projects/{older.id}', headers=auth_header)
+        resp = self.test_client.get(
+            '/projects',
+            headers={'If-None-Match': resp.headers['ETag'], 'If-Modified-Since': 'Fri, 01 Jan 2100 00:00:00 GMT'}
+        )
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(len(resp.get_json()['data']), 1)
+
+    def test_etag_changes_within_the_same_second(self) -> None:
+        from models import Company
+
+        company = self.create_company()
+        updated_at = datetime(2024, 1, 1, 12, 0, 0)
+        self.db.update(Company, company.id, name='first', updated_at=updated_at)
+        first = self.test_client.get(f'/companies/{company.id}').headers['ETag']
+        first_list = self.test_client.get('/companies').headers['ETag']
+        self.db.update(Company, company.id, name='second', updated_at=updated_at)
+
+        self.assertNotEqual(self.test_client.get(f'/companies/{company.id}').headers['ETag'], first)
+        self.assertNotEqual(self.test_client.get('/companies').headers['ETag'], first_list)
+
+    def test_login_throttle_keys_on_forwarded_address(self) -> None:
+        from werkzeug.middleware.proxy_fix import ProxyFix
+
+        def login(address: str, password: str):
+            return self.test_client.post(
+                '/login',
+                data={'email': f'{address}@example.com', 'password': password},
+                headers={'X-Forwarded-For': address},
+                environ_base={'REMOTE_ADDR': '127.0.0.1'}
+            )
+
+        with patch.object(self.app, 'wsgi_app', ProxyFix(self.app.wsgi_app, x_for=1)), \
+                patch.dict(self.app.config, {'LOGIN_MAX_FAILURES_PER_IP': 2}):
+            login('10.0.0.1', 'wrong')
+            login('10.0.0.1', 'wrong')
+
+            self.assertEqual(login('10.0.0.1', 'wrong').status_code, 429)
+            self.assertEqual(login('10.0.0.2', 'wrong').status_code, 400)
+
+    def test_logout_records_token_expiry(self) -> None:
+        from models import InvalidToken
+
+        self.test_client.get('/logout', headers=self.login_user())
+        token = self.db.session.query(InvalidToken).one()
+
+        self.assertGreater(token.expires_at, datetime.now())
+
+    def test_purge_tokens_command(self) -> None:
+        from models import InvalidToken
+
+        now = datetime.now()
+        self.db.save_new(InvalidToken, jti='expired', expires_at=now - timedelta(minutes=1))
+        self.db.save_new(InvalidToken, jti='active', expires_at=now + timedelta(minutes=1))
+
+        result = self.app.test_cli_runner().invoke(args=['purge-tokens'])
+
+        self.assertIn('purged 1 expired tokens', result.output)
+        self.assertIsNone(self.db.get(InvalidToken, jti='expired'))
+        self.assertIsNotNone(self.db.get(InvalidToken, jti='active'))
+
+    def use_baseline_invalid_tokens(self) -> None:
+        from sqlalchemy import text
+
+        self.db.session.execute(text('DROP TABLE invalid_tokens'))
+        self.db.session.execute(text(
+            'CREATE TABLE invalid_tokens (id VARCHAR(60) PRIMARY KEY, created_at DATETIME, '
+            'updated_at DATETIME, jti VARCHAR(36) NOT NULL)'
+        ))
+        self.db.session.commit()
+
+    def test_init_db_upgrades_existing_tables(self) -> None:
+        from sqlalchemy import text, inspect
+
+        self.use_baseline_invalid_tokens()
+        self.db.session.execute(text('DROP INDEX ix_projects_created_at_id'))
+        self.db.session.commit()
+
+        result = self.app.test_cli_runner().invoke(args=['init-db'])
+        inspector = inspect(self.db.engine)
+
+        self.assertIn('added invalid_tokens.expires_at', result.output)
+        self.assertIn('added ix_projects_created_at_id', result.output)
+        self.assertIn('added ix_invalid_tokens_created_at', result.output)
+        self.assertIn('expires_at', {column['name'] for column in inspector.get_columns('invalid_tokens')})
+        self.assertIn(
+            'ix_invalid_tokens_expires_at',
+            {index['name'] for index in inspector.get_indexes('invalid_tokens')}
+        )
+        self.assertNotIn('added', self.app.test_cli_runner().invoke(args=['init-db']).output)
+
+    def test_blocklist_fails_closed_until_loaded(self) -> None:
+        from auth import blocklist
+
+        auth_header = self.login_user()
+        blocklist.clear()
+        self.use_baseline_invalid_tokens()
+
+        resp = self.test_client.post(
+            '/companies',
+            headers=auth_header,
+            data={'name': self.company_name, 'description': self.company_description}
+        )
+
+        self.assertEqual(resp.status_code, 503)
+
+    def test_blocklist_survives_unreadable_table_once_loaded(self) -> None:
+        from auth import blocklist
+
+        auth_header = self.login_user()
+        blocklist.clear()
+        blocklist.refresh()
+        self.use_baseline_invalid_tokens()
+
+        with patch.dict(self.app.config, {'JWT_BLOCKLIST_REFRESH': 0}):
+            resp = self.test_client.post(
+                '/companies',
+                headers=auth_header,
+                data={'name': self.company_name, 'description': self.company_description}
+            )
+
+        self.assertEqual(resp.status_code, 201)
+
+    def upload_project(self, auth_header: dict, content: bytes) -> dict:
+        resp = self.test_client.post(
+            '/projects',
+            headers=auth_header,
+            content_type='multipart/form-data',
+            data={
+                'name': self.project_name,
+                'description': self.project_description,
+                'image': (io.BytesIO(content), 'image.PNG')
+            }
+        )
+
+        self.assertEqual(resp.status_code, 201)
+        return resp.get_json()['data']
+
+    def test_create_project_with_image_content_addressed(self) -> None:
+        auth_header = self.login_user()
+        with tempfile.TemporaryDirectory() as upload_dir, \
+                patch.dict(self.app.config, {'UPLOAD_DIR': upload_dir, 'UPLOAD_REAP_GRACE': 0}):
+            first = self.upload_project(auth_header, b'imagebytes')
+            second = self.upload_project(auth_header, b'imagebytes')
+
+            self.assertEqual(first['image'], hashlib.sha256(b'imagebytes').hexdigest() + '.png')
+            self.assertEqual(second['image'], first['image'])
+            self.assertEqual(os.listdir(upload_dir), [first['image']])
+
+            self.test_client.delete(f"/projects/{first['id']}", headers=auth_header)
+            file_reaper.join()
+            self.assertEqual(os.listdir(upload_dir), [first['image']])
+
+            self.test_client.delete(f"/projects/{second['id']}", headers=auth_header)
+            file_reaper.join()
+            self.assertEqual(os.listdir(upload_dir), [])
+
+    def test_update_project_image_removes_replaced_file(self) -> None:
+        auth_header = self.login_user()
+        with tempfile.TemporaryDirectory() as upload_dir, \
+                patch.dict(self.app.config, {'UPLOAD_DIR': upload_dir, 'UPLOAD_REAP_GRACE': 0}):
+            project = self.upload_project(auth_header, b'oldimage')
+            resp = self.test_client.patch(
+                f"/projects/{project['id']}",
+                headers=auth_header,
+                content_type='multipart/form-data',
+                data={'image': (io.BytesIO(b'newimage'), 'image.png')}
+            )
+            file_reaper.join()
+
+            self.assertEqual(resp.status_code, 200)
+            self.assertEqual(os.listdir(upload_dir), [resp.get_json()['data']['image']])
+
+    def test_reused_image_kept_until_grace_passes(self) -> None:
+        from models import Project
+
+        auth_header = self.login_user()
+        with tempfile.TemporaryDirectory() as upload_dir, \
+                patch.dict(self.app.config, {'UPLOAD_DIR': upload_dir}):
+            first = self.upload_project(auth_header, b'imagebytes')
+            path = os.path.join(upload_dir, first['image'])
+            os.utime(path, (0, 0))
+
+            second = self.upload_project(auth_header, b'imagebytes')
+            self.db.session.execute(Project.__table__.delete())
+            self.db.session.commit()
+            file_reaper.enqueue([(upload_dir, second['image'])])
+            file_reaper.join()
+
+            self.assertGreater(os.stat(path).st_mtime, 0)
+            self.assertTrue(os.path.exists(path))
+
+            with patch.dict(self.app.config, {'UPLOAD_REAP_GRACE': 0}):
+                file_reaper.enqueue([(upload_dir, second['image'])])
+                file_reaper.join()
+
+            self.assertFalse(os.path.exists(path))
+
+    def test_rolled_back_delete_keeps_image(self) -> None:
+        from models import Project
+
+        auth_header = self.login_user()
+        with tempfile.TemporaryDirectory() as upload_dir, \
+                patch.dict(self.app.config, {'UPLOAD_DIR': upload_dir}):
+            project = self.upload_project(auth_header, b'imagebytes')
+            with self.assertRaises(RuntimeError), self.db.unit_of_work() as session:
+                session.delete(self.db.get(Project, id=project['id']))
+                session.flush()
+                raise RuntimeError('rolled back')
+
+            file_reaper.join()
+            self.assertEqual(os.listdir(upload_dir), [project['image']])
+
+    def test_sweep_uploads(self) -> None:
+        auth_header = self.login_user()
+        with tempfile.TemporaryDirectory() as upload_dir, \
+                patch.dict(self.app.config, {'UPLOAD_DIR': upload_dir}):
+            project = self.upload_project(auth_header, b'imagebytes')
+            for name in ('orphan.png', 'recent.png', 'abandoned.part'):
+                with open(os.path.join(upload_dir, name), 'wb') as file:
+                    file.write(b'bytes')
+
+            hour_ago = datetime.now().timestamp() - 3600
+            for name in (project['image'], 'orphan.png', 'abandoned.part'):
+                os.utime(os.path.join(upload_dir, name), (hour_ago, hour_ago))
+
+            result = self.app.test_cli_runner().invoke(
+                args=['sweep-uploads', '--grace', '60', '--batch-size', '2']
+            )
+
+            self.assertIn('removed 2 orphaned files', result.output)
+            self.assertEqual(sorted(os.listdir(upload_dir)), sorted([project['image'], 'recent.png']))
+
+    def test_create_project_image_too_large(self) -> None:
+        auth_header = self.login_user()
+        with tempfile.TemporaryDirectory() as upload_dir, \
+                patch.dict(self.app.config, {'UPLOAD_DIR': upload_dir, 'MAX_IMAGE_SIZE': 4}):
+            resp = self.test_client.post(
+                '/projects',
+                headers=auth_header,
+                content_type='multipart/form-data',
+                data={
+                    'name': self.project_name,
+                    'description': self.project_description,
+                    'image': (io.BytesIO(b'imagebytes'), 'image.png')
+                }
+            )
+
+            self.assertEqual(resp.status_code, 413)
+            self.assertEqual(os.listdir(upload_dir), [])
+            self.assertEqual(len(self.test_client.get('/projects').get_json()['data']), 0)
+
+    def test_serve_image(self) -> None:
+        auth_header = self.login_user()
+        with tempfile.TemporaryDirectory() as upload_dir, \
+                patch.dict(self.app.config, {'UPLOAD_DIR': upload_dir}):
+            image = self.upload_project(auth_header, b'0123456789')['image']
+            resp = self.test_client.get(f'/serve-image/{image}')
+
+            self.assertEqual(resp.status_code, 200)
+            self.assertEqual(resp.data, b'0123456789')
+            self.assertEqual(resp.mimetype, 'image/png')
+            self.assertIn('immutable', resp.headers['Cache-Control'])
+            etag = resp.headers['ETag']
+            resp.close()
+
+            resp = self.test_client.get(f'/serve-image/{image}', headers={'If-None-Match': etag})
+            self.assertEqual(resp.status_code, 304)
+
+            resp = self.test_client.get(f'/serve-image/{image}', headers={'Range': 'bytes=2-5'})
+            self.assertEqual(resp.status_code, 206)
+            self.assertEqual(resp.data, b'2345')
+            resp.close()
+
+    def test_serve_image_offloaded(self) -> None:
+        auth_header = self.login_user()
+        with tempfile.TemporaryDirectory() as upload_dir, \
+                patch.dict(self.app.config, {'UPLOAD_DIR': upload_dir}):
+            image = self.upload_project(auth_header, b'0123456789')['image']
+
+            with patch.dict(self.app.config, {'IMAGE_ACCEL_REDIRECT': '/protected/'}):
+                resp = self.test_client.get(f'/serve-image/{image}')
+
+            self.assertEqual(resp.headers['X-Accel-Redirect'], f'/protected/{image}')
+            self.assertEqual(resp.data, b'')
+
+    def test_serve_image_not_found(self) -> None:
+        with tempfile.TemporaryDirectory() as upload_dir, \
+                patch.dict(self.app.config, {'UPLOAD_DIR': upload_dir}):
+            for filename in ('missing.png', '..%2Fconfig.py'):
+                with self.subTest(filename=filename):
+                    resp = self.test_client.get(f'/serve-image/{filename}')
+
+                    self.assertEqual(resp.status_code, 404)
+
+    def test_create_projects_batch(self) -> None:
+        auth_header = self.login_user()
+        items = [
+            {'name': f'project{i}', 'description': self.project_description}
+            for i in range(3)
+        ]
+
+        with patch.object(self.db.session, 'commit', wraps=self.db.session.commit) as commit_mock:
+            resp = self.test_client.post('/projects/batch', headers=auth_header, json=items)
+
+            commit_mock.assert_called_once()
+
+        self.assertEqual(resp.status_code, 201)
+        self.assertEqual([project['name'] for project in resp.get_json()['data']], ['project0', 'project1', 'project2'])
+        self.assertEqual(len(self.test_client.get('/projects').get_json()['data']), 3)
+
+    def test_create_companies_batch_invalid_item(self) -> None:
+        auth_header = self.login_user()
+        items = [
+            {'name': self.company_name, 'description': self.company_description},
+            {'name': self.company_name},
+            {'name': self.company_name, 'description': self.company_description, 'extra': 'field'}
+        ]
+
+        resp = self.test_client.post('/companies/batch', headers=auth_header, json=items)
+
+        self.assertEqual(resp.status_code, 422)
+        self.assertEqual(resp.get_json()['data'], [
+            {'index': 1, 'error': 'missing fields: description'},
+            {'index': 2, 'error': 'invalid input'}
+        ])
+        self.assertEqual(len(self.test_client.get('/companies').get_json()['data']), 0)
+
+    def test_delete_companies_batch(self) -> None:
+        auth_header = self.login_user()
+        companies = [self.create_company() for _ in range(2)]
+        ids = [company.id for company in companies] + ['missing']
+
+        resp = self.test_client.delete('/companies/batch', headers=auth_header, json=ids)
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.get_json()['data'], [
+            {'id': ids[0], 'deleted': True},
+            {'id': ids[1], 'deleted': True},
+            {'id': 'missing', 'deleted': False}
+        ])
+        self.assertEqual(len(self.test_client.get('/companies').get_json()['data']), 0)
+
+    def test_batch_invalid_body(self) -> None:
+        auth_header = self.login_user()
+        for body in ([], {'name': 'x'}, None):
+            with self.subTest(body=body):
+                resp = self.test_client.post('/projects/batch', headers=auth_header, json=body)
+
+                self.assertEqual(resp.status_code, 422)
+
+    def test_create_and_update_company_with_json(self) -> None:
+        auth_header = self.login_user()
+
+        resp = self.test_client.post(
+            '/companies',
+            headers=auth_header,
+            json={'name': 'json name', 'description': 'json description'}
+        )
+        company = resp.get_json()['data']
+
+        self.assertEqual(resp.status_code, 201)
+        self.assertEqual(company['name'], 'json name')
+
+        resp = self.test_client.patch(
+            f"/companies/{company['id']}",
+            headers=auth_header,
+            json={'name': None, 'description': 'new description'}
+        )
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.get_json()['data']['name'], 'json name')
+        self.assertEqual(resp.get_json()['data']['description'], 'new description')
+
+        for body in ([], {'name': 1}, {'unknown': 'field'}):
+            with self.subTest(body=body):
+                resp = self.test_client.patch(f"/companies/{company['id']}", headers=auth_header, json=body)
+
+                self.assertEqual(resp.status_code, 422)
+
+    def test_login_with_json(self) -> None:
+        resp = self.test_client.post('/login', json=self.login)
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn('access_token', resp.get_json())
+
+    def test_create_company_does_not_reload_row(self) -> None:
+        auth_header = self.login_user()
+
+        with self.record_statements() as statements:
+            resp = self.test_client.post(
+                '/companies',
+                headers=auth_header,
+                data={'name': self.company_name, 'description': self.company_description}
+            )
+
+        self.assertEqual(resp.status_code, 201)
+        self.assertEqual(resp.get_json()['data']['name'], self.company_name)
+        self.assertFalse([
+            statement for statement in statements
+            if statement.startswith('SELECT') and 'companies' in statement
+        ])
+
+    def test_status_deep(self) -> None:
+        resp = self.test_client.get('/status?deep=true')
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn('ping_ms', resp.get_json()['data']['database'])
+        self.assertNotIn('database', self.test_client.get('/status').get_json()['data'])
+
+    def test_status_deep_database_down(self) -> None:
+        from sqlalchemy.exc import OperationalError
+
+        with patch.object(self.db.session, 'execute', side_effect=OperationalError('SELECT 1', {}, 'down')):
+            resp = self.test_client.get('/status?deep=true')
+
+        self.assertEqual(resp.status_code, 503)
+        self.assertIn('error', resp.get_json()['data']['database'])
+
+    def test_metrics(self) -> None:
+        from app import metrics
+
+        metrics.reset()
+        self.create_project()
+        self.test_client.get('/projects')
+        self.test_client.get('/projects/missing')
+        resp = self.test_client.get('/metrics')
+        text = resp.get_data(as_text=True)
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(resp.content_type.startswith('text/plain'))
+        self.assertIn('http_requests_total{endpoint="get_projects",method="GET",status="200"} 1', text)
+        self.assertIn('http_requests_total{endpoint="get_a_project",method="GET",status="404"} 1', text)
+        self.assertIn('http_request_duration_seconds_count{endpoint="get_projects"} 1', text)
+        self.assertIn('cache_misses{pid=', text)
+        self.assertGreater(metrics.queries[('get_projects',)][0], 0)
+        self.assertGreater(metrics.response_bytes[('get_projects',)], 0)
+
+    def test_created_timestamps_match_column_precision(self) -> None:
+        auth_header = self.login_user()
+        created = self.test_client.post(
+            '/companies',
+            headers=auth_header,
+            data={'name': self.company_name, 'description': self.company_description}
+        ).get_json()['data']
+
+        self.assertEqual(datetime.fromisoformat(created['created_at']).microsecond, 0)
+        self.assertEqual(datetime.fromisoformat(created['updated_at']).microsecond, 0)
+
+    def test_get_projects_sparse_fields(self) -> None:
+        self.create_project()
+
+        with self.record_statements() as statements:
+            resp = self.test_client.get('/projects?fields=id,name,image')
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(set(resp.get_json()['data'][0]), {'id', 'name', 'image'})
+        self.assertFalse([statement for statement in statements if 'description' in statement])
+
+        for query in ('stream=true&fields=name', 'limit=1&fields=name'):
+            with self.subTest(query=query):
+                resp = self.test_client.get(f'/projects?{query}')
+
+                self.assertEqual(resp.get_json()['data'], [{'name': self.project_name}])
+
+    def test_sparse_fields_order_is_normalized(self) -> None:
+        from models import Company
+
+        company = self.create_company()
+        first = self.test_client.get(f'/companies/{company.id}?fields=name,id')
+        second = self.test_client.get(f'/companies/{company.id}?fields=id,name')
+
+        self.assertEqual(list(first.get_json()['data']), list(second.get_json()['data']))
+        self.assertEqual(first.headers['ETag'], second.headers['ETag'])
+        self.assertEqual(len({('id', 'name'), ('name', 'id')} & set(Company._serializers)), 1)
+
+    def test_get_a_company_sparse_fields(self) -> None:
+        company = self.create_company()
+        self.db.session.expunge_all()
+
+        resp = self.test_client.get(f'/companies/{company.id}?fields=name')
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.get_json()['data'], {'name': self.company_name})
+        self.assertIn('ETag', resp.headers)
+
+    def test_get_sparse_fields_invalid(self) -> None:
+        company = self.create_company()
+        for query in ('fields=password', 'fields=unknown', 'fields=,'):
+            with self.subTest(query=query):
+                resp = self.test_client.get(f'/companies/{company.id}?{query}')
+
+                self.assertEqual(resp.status_code, 422)
+
+    def test_search(self) -> None:
+        from models import Company, Project
+
+        auth_header = self.login_user()
+        project = self.db.save_new(Project, name='Flask portfolio', description='An API built with python')
+        self.db.save_new(Project, name='Rust game', description='A game engine, not python')
+        company = self.db.save_new(Company, name='Acme', description='We write flask services')
+
+        resp = self.test_client.get('/search?q=Flask python')
+        results = resp.get_json()['data']
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(results[0]['data']['id'], project.id)
+        self.assertEqual(len(results), 3)
+        self.assertEqual(sorted(result['type'] for result in results[1:]), ['companies', 'projects'])
+
+        self.db.update(Company, company.id, description='We write go services')
+        self.test_client.delete(f'/projects/{project.id}', headers=auth_header)
+        resp = self.test_client.get('/search?q=flask')
+
+        self.assertEqual(resp.get_json()['data'], [])
+
+    def test_search_invalid_query(self) -> None:
+        for query in ('', '?q=', '?q=%20'):
+            with self.subTest(query=query):
+                self.assertEqual(self.test_client.get(f'/search{query}').status_code, 422)
+
+    def test_reindex_search_command(self) -> None:
+        from search import SearchTerm
+
+        self.create_project()
+        self.db.session.query(SearchTerm).delete()
+        self.db.session.commit()
+
+        result = self.app.test_cli_runner().invoke(args=['reindex-search'])
+
+        self.assertIn('indexed 1 documents', result.output)
+        self.assertEqual(len(self.test_client.get('/search?q=projectname').get_json()['data']), 1)
+
+    def test_portfolio(self) -> None:
+        resp = self.test_client.get('/portfolio')
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.get_json()['data'], {'companies': [], 'projects': []})
+
+        auth_header = self.login_user()
+        company = self.test_client.post(
+            '/companies',
+            headers=auth_header,
+            data={'name': self.company_name, 'description': self.company_description}
+        ).get_json()['data']
+        project = self.create_project()
+        self.test_client.patch(f"/companies/{company['id']}", headers=auth_header, data={'name': 'renamed'})
+
+        with self.record_statements() as statements:
+            resp = self.test_client.get('/portfolio')
+
+        data = resp.get_json()['data']
+        self.assertEqual(statements, [])
+        self.assertEqual([item['name'] for item in data['companies']], ['renamed'])
+        self.assertEqual(data['projects'], [project.to_dict()])
+
+        self.test_client.delete(f'/projects/{project.id}', headers=auth_header)
+
+        self.assertEqual(self.test_client.get('/portfolio').get_json()['data']['projects'], [])
+
+    def test_portfolio_gzip_and_not_modified(self) -> None:
+        import gzip
+
+        self.create_company()
+        plain = self.test_client.get('/portfolio')
+        compressed = self.test_client.get('/portfolio', headers={'Accept-Encoding': 'gzip'})
+
+        self.assertEqual(compressed.headers['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', compressed.headers['Vary'])
+        self.assertEqual(gzip.decompress(compressed.get_data()), plain.get_data())
+        self.assertNotEqual(compressed.headers['ETag'], plain.headers['ETag'])
+
+        resp = self.test_client.get('/portfolio', headers={'If-None-Match': plain.headers['ETag']})
+
+        self.assertEqual(resp.status_code, 304)
+
+        refused = self.test_client.get('/portfolio', headers={'Accept-Encoding': 'gzip;q=0, identity'})
+
+        self.assertNotIn('Content-Encoding', refused.headers)
+        self.assertEqual(refused.get_data(), plain.get_data())
+
+    def test_portfolio_kept_across_app_init(self) -> None:
+        from portfolio import portfolio
+
+        self.test_client.get('/portfolio')
+        portfolio.init_app(self.app)
+
+        self.assertTrue(os.path.exists(portfolio.path))
+        self.assertIsNone(portfolio.body)
+
+        self.app.test_cli_runner().invoke(args=['init-db'])
+
+        self.assertFalse(os.path.exists(portfolio.path))
+
+    def test_portfolio_ignores_rolled_back_writes(self) -> None:
+        from models import Company
+
+        self.test_client.get('/portfolio')
+        with self.assertRaises(RuntimeError):
+            with self.db.unit_of_work():
+                self.db.save_new(Company, name='rolled back', description='never committed')
+                self.db.session.flush()
+                raise RuntimeError()
+
+        self.assertEqual(self.test_client.get('/portfolio').get_json()['data']['companies'], [])
+
+    def test_portfolio_reloads_document_published_by_another_process(self) -> None:
+        from models import Company
+        from portfolio import Portfolio
+
+        company = self.create_company()
+        self.test_client.get('/portfolio')
+        self.db.session.execute(
+            Company.__table__.update().where(Company.id == company.id).values(name='from another worker')
+        )
+        self.db.session.commit()
+        other = Portfolio()
+        other.path = self.app.config['PORTFOLIO_PATH']
+        other.apply([('companies', company.id)])
+
+        companies = self.test_client.get('/portfolio').get_json()['data']['companies']
+
+        self.assertEqual([company['name'] for company in companies], ['from another worker'])
+
+
+    def test_compressed_list(self) -> None:
+        import gzip
+        import zlib
+        from app import compressor
+        from models import Company
+
+        for index in range(20):
+            self.db.save_new(Company, name=f'company {index}', description=self.company_description * 5)
+
+        plain = self.test_client.get('/companies')
+        etag = plain.headers['ETag'].strip('"')
+
+        self.assertNotIn('Content-Encoding', plain.headers)
+        self.assertIn('Accept-Encoding', plain.headers['Vary'])
+
+        for encoding, decompress in (('gzip', gzip.decompress), ('deflate', zlib.decompress)):
+            with self.subTest(encoding=encoding):
+                resp = self.test_client.get('/companies', headers={'Accept-Encoding': encoding})
+
+                self.assertEqual(resp.headers['Content-Encoding'], encoding)
+                self.assertEqual(resp.headers['ETag'], f'"{etag}-{encoding}"')
+                self.assertEqual(decompress(resp.get_data()), plain.get_data())
+                self.assertLess(int(resp.headers['Content-Length']), len(plain.get_data()))
+
+        hits = compressor.cache.stats()['hits']
+        resp = self.test_client.get('/companies', headers={'Accept-Encoding': 'gzip'})
+
+        self.assertEqual(compressor.cache.stats()['hits'], hits + 1)
+
+        resp = self.test_client.get(
+            '/companies',
+            headers={'Accept-Encoding': 'gzip', 'If-None-Match': resp.headers['ETag']}
+        )
+
+        self.assertEqual(resp.status_code, 304)
+        self.assertEqual(resp.headers['ETag'], f'"{etag}-gzip"')
+        self.assertIn('Accept-Encoding', resp.headers['Vary'])
+
+    def test_compressed_body_follows_content(self) -> None:
+        import gzip
+        from models import Company
+
+        company = self.db.save_new(Company, name='first', description=self.company_description * 50)
+        with patch('app_main.content_etag', return_value='same'):
+            self.test_client.get(f'/companies/{company.id}', headers={'Accept-Encoding': 'gzip'})
+            self.db.update(Company, company.id, name='second')
+            resp = self.test_client.get(f'/companies/{company.id}', headers={'Accept-Encoding': 'gzip'})
+
+        self.assertEqual(resp.headers['Content-Encoding'], 'gzip')
+        self.assertIn(b'"second"', gzip.decompress(resp.get_data()))
+
+    def test_small_response_not_compressed(self) -> None:
+        resp = self.test_client.get('/companies', headers={'Accept-Encoding': 'gzip'})
+
+        self.assertNotIn('Content-Encoding', resp.headers)
+
+    def test_changes_feed(self) -> None:
+        from models import Company
+
+        company = self.db.save_new(Company, name=self.company_name, description=self.company_description)
+        self.db.update(Company, company.id, description='updated')
+        self.db.update(Company, company.id, description='updated')
+        self.db.delete(Company, id=company.id)
+
+        resp = self.test_client.get('/changes')
+        changes = resp.get_json()['data']
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual([change['action'] for change in changes], ['create', 'update', 'delete'])
+        self.assertEqual({change['id'] for change in changes}, {company.id})
+        self.assertEqual(changes[1]['data']['description'], 'updated')
+        self.assertIsNone(changes[2]['data'])
+        self.assertEqual(resp.get_json()['next_since'], changes[-1]['seq'])
+
+        resp = self.test_client.get(f"/changes?since={changes[0]['seq']}&limit=1")
+
+        self.assertEqual([change['seq'] for change in resp.get_json()['data']], [changes[1]['seq']])
+        self.assertEqual(resp.get_json()['next_since'], changes[1]['seq'])
+
+        resp = self.test_client.get(f"/changes?since={changes[-1]['seq']}")
+
+        self.assertEqual(resp.get_json()['data'], [])
+        self.assertEqual(resp.get_json()['next_since'], changes[-1]['seq'])
+
+    def test_changes_numbered_through_counter(self) -> None:
+        from models import Company
+        from changes import ChangeCounter
+
+        self.db.save_new(Company, name=self.company_name, description=self.company_description)
+        self.db.session.execute(ChangeCounter.__table__.delete())
+        self.db.session.commit()
+
+        with self.assertRaises(AbortException):
+            self.db.save_new(Company, name=self.company_name, description=self.company_description)
+
+        self.db.session.rollback()
+        self.app.test_cli_runner().invoke(args=['init-db'])
+        self.db.save_new(Company, name=self.company_name, description=self.company_description)
+
+        seqs = [change['seq'] for change in self.test_client.get('/changes').get_json()['data']]
+
+        self.assertEqual(seqs, [1, 2])
+        self.assertEqual(self.db.session.get(ChangeCounter, 1).value, 2)
+
+    def test_batch_numbers_changes_in_one_block(self) -> None:
+        auth_header = self.login_user()
+        items = [{'name': f'company {index}', 'description': 'batch'} for index in range(10)]
+
+        with self.record_statements() as statements:
+            resp = self.test_client.post('/companies/batch', headers=auth_header, json=items)
+
+        seqs = [change['seq'] for change in self.test_client.get('/changes').get_json()['data']]
+
+        self.assertEqual(resp.status_code, 201)
+        self.assertEqual(seqs, list(range(1, 11)))
+        self.assertEqual(len([statement for statement in statements if 'change' in statement]), 3)
+
+    def test_changes_invalid_since(self) -> None:
+        resp = self.test_client.get('/changes?since=-1')
+
+        self.assertEqual(resp.status_code, 422)
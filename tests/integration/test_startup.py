@@ -0,0 +1,42 @@
+import unittest
+from benchmarks.startup import measure
+from tests.integration.base_test import BaseTestCase
+
+
+class TestStartup(unittest.TestCase):
+    """
+    Test that starting the app does no database or hashing work
+    """
+
+    def test_import_does_no_io(self) -> None:
+        result = measure(1, 'testing')
+
+        self.assertEqual(result['statements'], 0)
+        self.assertEqual(result['hashes'], 0)
+
+
+class TestCommands(BaseTestCase):
+    """
+    Test the setup commands that replaced the work done at import
+    """
+
+    def test_init_db(self) -> None:
+        self.db.drop_all()
+
+        result = self.app.test_cli_runner().invoke(args=['init-db'])
+
+        self.assertIn('database initialized', result.output)
+        self.assertIn('projects', self.db.inspect(self.db.engine).get_table_names())
+
+    def test_seed_admin(self) -> None:
+        from models import User
+
+        runner = self.app.test_cli_runner()
+        self.assertIn('admin already exists', runner.invoke(args=['seed-admin']).output)
+
+        self.db.session.delete(self.admin)
+        self.db.session.commit()
+
+        self.assertIn('admin created', runner.invoke(args=['seed-admin']).output)
+        self.assertEqual(self.test_client.post('/login', data=self.login).status_code, 200)
+        self.assertEqual(self.db.session.query(User).count(), 1)
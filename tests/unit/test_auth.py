@@ -2,11 +2,17 @@ import os
 os.environ['CONFIG'] = 'testing'
 
 import unittest
-from auth import Auth
+from auth import (
+    Auth,
+    LoginThrottle,
+    TokenBlocklist,
+    throttle
+)
 from models import User
 from app import create_app
 from exc import AbortException
 from unittest.mock import patch, MagicMock
+from datetime import datetime, timedelta
 
 
 class TestAuth(unittest.TestCase):
@@ -18,6 +24,7 @@ class TestAuth(unittest.TestCase):
         self.user = MagicMock(spec=User)
         self.user.email = self.user_data['email']
         self.user.password = self.user_data['password']
+        throttle.clear()
 
     @patch('storage.db.get')
     @patch('app.bcrypt.check_password_hash')
@@ -55,5 +62,101 @@ class TestAuth(unittest.TestCase):
         mock_db_get.assert_called_once_with(User, email='nonexistent@example.com')
 
 
+    @patch('storage.db.get')
+    @patch('app.bcrypt.check_password_hash')
+    def test_authenticate_user_throttled(self, mock_check_password_hash, mock_db_get):
+        mock_db_get.return_value = self.user
+        mock_check_password_hash.return_value = False
+
+        for _ in range(self.app.config['LOGIN_MAX_FAILURES']):
+            with self.assertRaises(AbortException):
+                self.auth.authenticate_user('test@example.com', 'wrongpassword', '127.0.0.1')
+
+        mock_check_password_hash.reset_mock()
+        with self.assertRaises(AbortException) as context:
+            self.auth.authenticate_user('test@example.com', 'password', '127.0.0.1')
+
+        self.assertEqual(context.exception.code, 429)
+        mock_check_password_hash.assert_not_called()
+
+
+class TestLoginThrottle(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.app_context().push()
+        self.throttle = LoginThrottle()
+
+    def test_reset_clears_email_failures(self):
+        for _ in range(self.app.config['LOGIN_MAX_FAILURES']):
+            self.throttle.record_failure('test@example.com')
+
+        self.throttle.reset('test@example.com')
+        self.throttle.check('test@example.com')
+
+    def test_address_limit_applies_across_emails(self):
+        for i in range(self.app.config['LOGIN_MAX_FAILURES_PER_IP']):
+            self.throttle.record_failure(f'user{i}@example.com', '10.0.0.1')
+
+        with self.assertRaises(AbortException):
+            self.throttle.check('new@example.com', '10.0.0.1')
+
+        self.throttle.check('new@example.com', '10.0.0.2')
+
+    @patch('auth.time.monotonic')
+    def test_failures_expire_after_window(self, mock_monotonic):
+        mock_monotonic.return_value = 0
+        for _ in range(self.app.config['LOGIN_MAX_FAILURES']):
+            self.throttle.record_failure('test@example.com')
+
+        mock_monotonic.return_value = self.app.config['LOGIN_FAILURE_WINDOW'] + 1
+        self.throttle.check('test@example.com')
+
+    @patch('auth.time.monotonic')
+    def test_expired_keys_are_swept(self, mock_monotonic):
+        mock_monotonic.return_value = 0
+        for i in range(LoginThrottle.SWEEP_EVERY - 1):
+            self.throttle.record_failure(f'user{i}@example.com')
+
+        mock_monotonic.return_value = self.app.config['LOGIN_FAILURE_WINDOW'] + 1
+        self.throttle.record_failure('last@example.com')
+
+        self.assertEqual(list(self.throttle._failures), ['email:last@example.com'])
+
+
+class TestTokenBlocklist(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.app_context().push()
+        self.blocklist = TokenBlocklist()
+
+    @patch('models.InvalidToken.revoked_since')
+    def test_contains_loads_revoked_tokens_once(self, mock_revoked_since):
+        now = datetime.now()
+        mock_revoked_since.return_value = [('jti', now + timedelta(minutes=5), now)]
+
+        self.assertTrue(self.blocklist.contains('jti'))
+        self.assertFalse(self.blocklist.contains('other'))
+        mock_revoked_since.assert_called_once_with(None)
+
+    @patch('models.InvalidToken.revoked_since')
+    def test_add_is_visible_without_refresh(self, mock_revoked_since):
+        mock_revoked_since.return_value = []
+        self.blocklist.refresh()
+        self.blocklist.add('jti', None)
+
+        self.assertTrue(self.blocklist.contains('jti'))
+        mock_revoked_since.assert_called_once()
+
+    @patch('models.InvalidToken.revoked_since')
+    def test_refresh_drops_expired_tokens(self, mock_revoked_since):
+        self.app.config['JWT_BLOCKLIST_REFRESH'] = 0
+        now = datetime.now()
+        mock_revoked_since.return_value = [('jti', now - timedelta(minutes=5), now)]
+
+        self.assertFalse(self.blocklist.contains('jti'))
+        self.blocklist.contains('jti')
+        self.assertEqual(mock_revoked_since.call_args.args[0], now)
+
+
 if __name__ == '__main__':
     unittest.main()
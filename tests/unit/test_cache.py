@@ -0,0 +1,125 @@
+import os
+import json
+import tempfile
+import unittest
+from cache import LRUCache, SharedCache, MISSING
+from unittest.mock import patch
+
+
+class TestLRUCache(unittest.TestCase):
+    def setUp(self):
+        self.cache = LRUCache(max_size=2, ttl=10)
+
+    def test_get_miss(self):
+        self.assertEqual(self.cache.get('key'), (False, MISSING))
+        self.assertEqual(self.cache.stats()['misses'], 1)
+
+    def test_set_and_get_hit(self):
+        self.cache.set('key', 'value')
+
+        self.assertEqual(self.cache.get('key'), (True, 'value'))
+        self.assertEqual(self.cache.stats()['hits'], 1)
+
+    def test_cached_none_is_a_hit(self):
+        self.cache.set('key', None)
+
+        self.assertEqual(self.cache.get('key'), (True, None))
+
+    def test_evicts_least_recently_used(self):
+        self.cache.set('a', 1)
+        self.cache.set('b', 2)
+        self.cache.get('a')
+        self.cache.set('c', 3)
+
+        self.assertEqual(self.cache.get('b'), (False, MISSING))
+        self.assertEqual(self.cache.get('a'), (True, 1))
+        self.assertEqual(self.cache.stats()['evictions'], 1)
+        self.assertEqual(self.cache.stats()['size'], 2)
+
+    @patch('cache.time.monotonic')
+    def test_expired_entry_is_a_miss(self, mock_monotonic):
+        mock_monotonic.return_value = 100
+        self.cache.set('key', 'value')
+        mock_monotonic.return_value = 111
+
+        self.assertEqual(self.cache.get('key'), (False, MISSING))
+        self.assertEqual(self.cache.stats()['size'], 0)
+
+    def test_zero_size_disables_cache(self):
+        self.cache.configure(0, 10)
+        self.cache.set('key', 'value')
+
+        self.assertEqual(self.cache.get('key'), (False, MISSING))
+
+
+class TestSharedCache(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, 'cache.sqlite')
+        self.cache = SharedCache(self.path, max_size=2, ttl=10)
+        self.other = SharedCache(self.path, max_size=2, ttl=10)
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_entries_are_shared(self):
+        self.cache.set('key', {'value': [1, None]})
+
+        self.assertEqual(self.other.get('key'), (True, {'value': [1, None]}))
+        self.assertEqual(self.other.get('missing'), (False, MISSING))
+        self.assertEqual(self.other.stats()['hits'], 1)
+        self.assertEqual(self.other.stats()['misses'], 1)
+
+    def test_values_round_trip_as_json(self):
+        from datetime import datetime
+
+        value = ({'name': 'a'}, datetime(2024, 1, 1, 12, 30, 15, 123456), 'etag')
+        self.cache.set('key', value)
+
+        self.assertEqual(self.other.get('key'), (True, [{'name': 'a'}, value[1], 'etag']))
+        stored = self.cache.connect().execute("SELECT value FROM entries WHERE key = 'key'").fetchone()[0]
+        self.assertEqual(json.loads(stored)[1], {'__datetime__': '2024-01-01T12:30:15.123456'})
+
+    def test_unreadable_value_is_a_miss(self):
+        self.cache.connect().execute(
+            "INSERT INTO entries (key, value, expires_at) VALUES ('key', 'not json', 1e12)"
+        )
+
+        self.assertEqual(self.cache.get('key'), (False, MISSING))
+
+    def test_generations_are_shared(self):
+        self.assertEqual(self.cache.generation('Project'), 0)
+
+        self.other.bump('Project')
+        self.other.bump('Project')
+
+        self.assertEqual(self.cache.generation('Project'), 2)
+        self.assertEqual(self.cache.generation('Company'), 0)
+
+    @patch('cache.time.time')
+    def test_expired_entry_is_a_miss(self, mock_time):
+        mock_time.return_value = 100
+        self.cache.set('key', 'value')
+        mock_time.return_value = 111
+
+        self.assertEqual(self.other.get('key'), (False, MISSING))
+
+    @patch('cache.PRUNE_EVERY', 1)
+    def test_prune_keeps_max_size(self):
+        for key in ('a', 'b', 'c'):
+            self.cache.set(key, key)
+
+        self.assertEqual(self.cache.get('a'), (False, MISSING))
+        self.assertEqual(self.cache.get('c'), (True, 'c'))
+
+    def test_clear_keeps_generations(self):
+        self.cache.bump('Project')
+        self.cache.set('key', 'value')
+        self.other.clear()
+
+        self.assertEqual(self.cache.get('key'), (False, MISSING))
+        self.assertEqual(self.cache.generation('Project'), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import os
+os.environ['CONFIG'] = 'testing'
+
+import uuid
+import decimal
+import unittest
+from app import create_app
+from datetime import datetime, date
+from flask.json.provider import DefaultJSONProvider
+from app.json_provider import orjson, ORJSONProvider
+
+
+@unittest.skipUnless(orjson, 'orjson is not installed')
+class TestORJSONProvider(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.provider = ORJSONProvider(self.app)
+        self.default = DefaultJSONProvider(self.app)
+
+    def assertSameOutput(self, obj, **kwargs):
+        self.assertEqual(self.provider.dumps(obj, **kwargs), self.default.dumps(obj, **kwargs))
+
+    def test_registered_by_create_app(self):
+        self.assertIsInstance(self.app.json, ORJSONProvider)
+
+    def test_compact_output_matches_default(self):
+        payloads = [
+            {'status': 'success', 'data': [{'name': 'b', 'id': '1', 'url': None}]},
+            {'z': 1, 'a': [True, False, None, 1.5, -3]},
+            {'created': datetime(2024, 11, 22, 10, 30), 'day': date(2024, 11, 22)},
+            {'id': uuid.UUID(int=1), 'amount': decimal.Decimal('1.10')},
+            {'text': 'quote " slash / back \\ tab \t control \x01'},
+            {'text': 'naïve – café'},
+            {'big': 2 ** 70},
+            []
+        ]
+
+        for payload in payloads:
+            with self.subTest(payload=payload):
+                self.assertSameOutput(payload, separators=(',', ':'))
+
+    def test_float_differences(self):
+        compact = {'separators': (',', ':')}
+
+        self.assertEqual(self.provider.dumps([1e16, 1e-7, 0.5], **compact), '[1e16,1e-7,0.5]')
+        self.assertEqual(self.provider.dumps([float('inf')], **compact), '[null]')
+
+    def test_other_arguments_use_default(self):
+        self.assertSameOutput({'b': 1, 'a': 2})
+        self.assertSameOutput({'b': 1, 'a': 2}, indent=2)
+
+    def test_response_matches_default(self):
+        with self.app.app_context():
+            payload = {'status': 'success', 'data': [{'name': 'name', 'id': '1'}]}
+
+            self.assertEqual(
+                self.provider.response(payload).get_data(),
+                self.default.response(payload).get_data()
+            )
+
+
+if __name__ == '__main__':
+    unittest.main()
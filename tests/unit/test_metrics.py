@@ -0,0 +1,104 @@
+import os
+import shutil
+import tempfile
+import unittest
+import threading
+from metrics import (
+    Metrics,
+    instrument
+)
+from sqlalchemy import (
+    text,
+    create_engine
+)
+from sqlalchemy.exc import OperationalError
+from unittest.mock import patch
+
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        self.metrics = Metrics()
+
+    def test_observe_fills_histogram_buckets(self):
+        self.metrics.observe('get_projects', 'GET', 200, 0.02, 100, 3, 0.001)
+        self.metrics.observe('get_projects', 'GET', 200, 3.0, 50, 1, 0.002)
+
+        histogram = self.metrics.latency[('get_projects',)]
+        self.assertEqual(histogram[0], 0)
+        self.assertEqual(histogram[2], 1)
+        self.assertEqual(histogram[-4], 2)
+        self.assertEqual(histogram[-1], 2)
+        self.assertEqual(self.metrics.response_bytes[('get_projects',)], 150)
+        self.assertEqual(self.metrics.queries[('get_projects',)][0], 4)
+
+    def test_render(self):
+        self.metrics.observe('get_projects', 'GET', 200, 0.02, 100, 3, 0.001)
+        self.metrics.observe('get_projects', 'GET', 304, 0.01, 0, 1, 0.001)
+
+        text = self.metrics.render({'cache_hits': 7})
+
+        self.assertIn('http_requests_total{endpoint="get_projects",method="GET",status="304"} 1', text)
+        self.assertIn('http_request_duration_seconds_bucket{endpoint="get_projects",le="+Inf"} 2', text)
+        self.assertIn('http_request_duration_seconds_count{endpoint="get_projects"} 2', text)
+        self.assertIn('db_queries_total{endpoint="get_projects"} 4', text)
+        self.assertIn('cache_hits{pid=', text)
+
+    def test_collect_merges_worker_snapshots(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        other = Metrics()
+        self.metrics.directory = other.directory = directory
+
+        with patch('metrics.os.getpid', return_value=1):
+            other.observe('get_projects', 'GET', 200, 0.02, 100, 3, 0.001)
+            other.flush()
+
+        with patch('metrics.os.getpid', return_value=2):
+            self.metrics.observe('get_projects', 'GET', 200, 0.03, 10, 2, 0.001)
+            merged = self.metrics.collect()
+
+        self.assertEqual(merged['requests'][('get_projects', 'GET', '200')], 2)
+        self.assertEqual(merged['latency'][('get_projects',)][-1], 2)
+        self.assertEqual(merged['response_bytes'][('get_projects',)], 110)
+        self.assertEqual(merged['queries'][('get_projects',)][0], 5)
+
+    def test_failed_statement_drops_its_start_time(self):
+        engine = create_engine('sqlite://')
+        instrument(engine)
+
+        with engine.connect() as connection:
+            with self.assertRaises(OperationalError):
+                connection.execute(text('SELECT * FROM missing'))
+            self.assertNotIn('query_started_at', connection.info)
+
+            connection.execute(text('SELECT 1'))
+            self.assertNotIn('query_started_at', connection.info)
+
+    def test_concurrent_flushes_do_not_raise(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.metrics.directory = directory
+        errors = []
+
+        def observe():
+            try:
+                for _ in range(50):
+                    self.metrics.observe('get_projects', 'GET', 200, 0.01, 10, 1, 0.001)
+                    self.metrics.flush()
+            except Exception as err:
+                errors.append(err)
+
+        threads = [threading.Thread(target=observe) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(os.listdir(directory), [f'metrics-{os.getpid()}.json'])
+
+    def test_failed_flush_is_logged(self):
+        self.metrics.directory = os.path.join(tempfile.gettempdir(), 'missing-metrics-dir', 'nested')
+
+        with self.assertLogs('metrics', 'ERROR'):
+            self.metrics.flush()
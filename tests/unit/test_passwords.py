@@ -0,0 +1,62 @@
+import os
+os.environ['CONFIG'] = 'testing'
+
+import unittest
+import threading
+from app import create_app
+from exc import AbortException
+from passwords import PasswordHasher
+from unittest.mock import patch
+
+
+class TestPasswordHasher(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config['PASSWORD_HASH_WORKERS'] = 1
+        self.app.config['PASSWORD_HASH_QUEUE'] = 0
+        self.hasher = PasswordHasher()
+        self.hasher.init_app(self.app)
+
+    def test_hash_and_check(self):
+        pw_hash = self.hasher.generate_password_hash('password')
+
+        self.assertTrue(self.hasher.check_password_hash(pw_hash, 'password'))
+        self.assertFalse(self.hasher.check_password_hash(pw_hash, 'wrongpassword'))
+
+    def test_rejects_when_saturated(self):
+        self.assert_second_call_rejected()
+
+    def test_admits_fewer_calls_than_request_threads(self):
+        self.app.config['PASSWORD_HASH_WORKERS'] = 2
+        self.app.config['PASSWORD_HASH_QUEUE'] = 8
+        self.app.config['REQUEST_THREADS'] = 2
+        self.hasher.init_app(self.app)
+
+        self.assert_second_call_rejected()
+
+    @patch('app.bcrypt.check_password_hash')
+    def assert_second_call_rejected(self, mock_check_password_hash):
+        started = threading.Event()
+        release = threading.Event()
+
+        def slow_check(*_):
+            started.set()
+            release.wait()
+            return True
+
+        mock_check_password_hash.side_effect = slow_check
+        worker = threading.Thread(target=self.hasher.check_password_hash, args=('hash', 'pwd'))
+        worker.start()
+        started.wait()
+
+        with self.assertRaises(AbortException) as context:
+            self.hasher.check_password_hash('hash', 'pwd')
+
+        release.set()
+        worker.join()
+        self.assertEqual(context.exception.code, 503)
+        self.assertTrue(self.hasher.check_password_hash('hash', 'pwd'))
+
+
+if __name__ == '__main__':
+    unittest.main()
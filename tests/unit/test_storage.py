@@ -3,7 +3,7 @@ from app import create_app
 from storage import DBStorage
 from exc import AbortException
 from sqlalchemy.exc import IntegrityError
-from unittest.mock import MagicMock, patch
+from unittest.mock import MagicMock, PropertyMock, patch
 
 
 class TestModel:
@@ -40,6 +40,42 @@ class TestDBStorage(unittest.TestCase):
         self.storage.session.commit.assert_called_once()
         self.assertEqual(saved_instance, instance)
 
+    def test_save_does_not_reload_instance(self):
+        instance = TestModel(id=1)
+        saved_instance = self.storage.save(self.model, instance)
+
+        self.storage.session.get.assert_not_called()
+        self.assertIs(saved_instance, instance)
+
+    def test_unit_of_work_commits_once(self):
+        version = self.storage.versions['TestModel']
+        with self.storage.unit_of_work():
+            self.storage.save(self.model, TestModel(id=1))
+            self.storage.save(self.model, TestModel(id=2))
+
+            self.storage.session.commit.assert_not_called()
+            self.assertEqual(self.storage.versions['TestModel'], version)
+
+        self.storage.session.commit.assert_called_once()
+        self.assertEqual(self.storage.versions['TestModel'], version + 1)
+
+    def test_unit_of_work_rolls_back_on_error(self):
+        with self.assertRaises(AbortException):
+            with self.storage.unit_of_work():
+                self.storage.save(self.model, TestModel(id=1))
+                raise AbortException({'error': 'error'})
+
+        self.storage.session.commit.assert_not_called()
+        self.storage.session.rollback.assert_called_once()
+
+    def test_unit_of_work_raises_exception_on_integrity_error(self):
+        self.storage.session.commit.side_effect = IntegrityError(None, None, None)
+
+        with self.assertRaises(AbortException):
+            with self.storage.unit_of_work():
+                self.storage.save(self.model, TestModel(id=1))
+        self.storage.session.rollback.assert_called_once()
+
     def test_save_raises_exception_on_integrity_error(self):
         self.storage.session.commit.side_effect = IntegrityError(None, None, None)
         instance = TestModel(id=1)
@@ -56,6 +92,32 @@ class TestDBStorage(unittest.TestCase):
         self.assertIsInstance(instance, TestModel)
         self.assertEqual(instance.name, 'NewSample')
 
+    def test_save_many_commits_once(self):
+        instances = [TestModel(id=1), TestModel(id=2)]
+        saved_instances = self.storage.save_many(self.model, instances)
+
+        self.storage.session.add_all.assert_called_once_with(instances)
+        self.storage.session.commit.assert_called_once()
+        self.assertEqual(saved_instances, instances)
+
+    def test_save_many_raises_exception_on_integrity_error(self):
+        self.storage.session.commit.side_effect = IntegrityError(None, None, None)
+
+        with self.assertRaises(AbortException):
+            self.storage.save_many(self.model, [TestModel(id=1)])
+        self.storage.session.rollback.assert_called_once()
+
+    def test_delete_many_returns_deleted_ids(self):
+        self.model = MagicMock(__name__='TestModel')
+        instances = [TestModel(id=1), TestModel(id=2)]
+        self.storage.session.query.return_value.filter.return_value.all.return_value = instances
+
+        deleted = self.storage.delete_many(self.model, [1, 2, 3])
+
+        self.assertEqual(deleted, [1, 2])
+        self.assertEqual(self.storage.session.delete.call_count, 2)
+        self.storage.session.commit.assert_called_once()
+
     def test_delete_removes_instance(self):
         instance = TestModel(id=1)
         self.storage.session.get.return_value = instance
@@ -89,6 +151,13 @@ class TestDBStorage(unittest.TestCase):
         self.storage.update(self.model, 1, password='new_password')
         self.assertEqual(instance.password, 'hashed_password')
 
+    def test_warm_up_opens_and_returns_connections(self):
+        with patch.object(DBStorage, 'engine', new_callable=PropertyMock) as engine_mock:
+            self.storage.warm_up(3)
+
+            self.assertEqual(engine_mock.return_value.connect.call_count, 3)
+            self.assertEqual(engine_mock.return_value.connect.return_value.close.call_count, 3)
+
     def test_get_retrieves_instance(self):
         instance = TestModel(id=1)
         self.storage.session.query(self.model).filter_by.return_value.first.return_value = instance
@@ -0,0 +1,33 @@
+import unittest
+from validations import (
+    adapter,
+    validate,
+    CompanySchema,
+    validate_items
+)
+
+
+class TestValidations(unittest.TestCase):
+    def test_validate_returns_schema(self):
+        schema = validate(CompanySchema, {'name': 'name'})
+
+        self.assertEqual(schema.model_dump(exclude_unset=True), {'name': 'name'})
+
+    def test_validate_rejects_unknown_fields(self):
+        self.assertIsNone(validate(CompanySchema, {'name': 'name', 'extra': 'field'}))
+        self.assertIsNone(validate(CompanySchema, 'not an object'))
+
+    def test_adapters_are_cached(self):
+        self.assertIs(adapter(CompanySchema), adapter(CompanySchema))
+
+    def test_validate_items(self):
+        schemas, errors = validate_items(CompanySchema, [{'name': 'a'}, {'name': 'b'}])
+
+        self.assertEqual([schema.name for schema in schemas], ['a', 'b'])
+        self.assertEqual(errors, {})
+
+    def test_validate_items_reports_every_invalid_index(self):
+        schemas, errors = validate_items(CompanySchema, [{'name': 'a'}, 'b', {'name': 1}, {'extra': 'c'}])
+
+        self.assertEqual(schemas, [])
+        self.assertEqual(errors, {1: 'invalid input', 2: 'invalid input', 3: 'invalid input'})
@@ -0,0 +1,155 @@
+"""
+Module for storing and serving uploaded images
+"""
+import os
+import re
+import hashlib
+import tempfile
+import mimetypes
+from cache import LRUCache
+from exc import AbortException
+from werkzeug.wsgi import wrap_file
+from werkzeug.security import safe_join
+from werkzeug.utils import secure_filename
+from werkzeug.datastructures import FileStorage
+from typing import (
+    Tuple,
+    Optional
+)
+from flask import (
+    abort,
+    request,
+    Response,
+    current_app
+)
+
+HASHED_NAME = re.compile(r'^[0-9a-f]{64}(\.[a-z0-9]+)?$')
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+_created_dirs = set()
+stat_cache = LRUCache()
+
+
+def upload_dir() -> str:
+    """
+    Return the absolute upload directory, creating it on first use
+    """
+    directory = os.path.join(current_app.root_path, current_app.config['UPLOAD_DIR'])
+    if directory not in _created_dirs:
+        os.makedirs(directory, exist_ok=True)
+        _created_dirs.add(directory)
+
+    return directory
+
+
+def store_upload(file: FileStorage) -> str:
+    """
+    Stream an uploaded file to disk and return its content-addressed name.
+
+    The file is copied in chunks to a temporary file while it is hashed,
+    then moved to <sha256><ext>; an identical upload reuses the stored copy
+    and refreshes its mtime, so cleanup leaves it alone until it commits.
+    """
+    directory = upload_dir()
+    max_size = current_app.config['MAX_IMAGE_SIZE']
+    chunk_size = current_app.config['UPLOAD_CHUNK_SIZE']
+    extension = os.path.splitext(secure_filename(file.filename or ''))[1].lower()
+
+    digest = hashlib.sha256()
+    size = 0
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as temp_file:
+            while chunk := file.stream.read(chunk_size):
+                size += len(chunk)
+                if size > max_size:
+                    raise AbortException({'error': 'image is too large'}, 'Payload Too Large', 413)
+
+                digest.update(chunk)
+                temp_file.write(chunk)
+
+        filename = digest.hexdigest() + extension
+        path = os.path.join(directory, filename)
+        if os.path.exists(path):
+            os.remove(temp_path)
+            os.utime(path)
+        else:
+            os.replace(temp_path, path)
+
+        return filename
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def stat_upload(path: str) -> Optional[Tuple[int, float, str]]:
+    """
+    Return (size, mtime, mimetype) of an upload, cached in memory
+    """
+    hit, meta = stat_cache.get(path)
+    if hit:
+        return meta
+
+    try:
+        stat = os.stat(path)
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+
+    mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+    meta = (stat.st_size, stat.st_mtime, mimetype)
+    stat_cache.set(path, meta)
+    return meta
+
+
+def serve_upload(filename: str) -> Response:
+    """
+    Send an uploaded image with validators, byte range support and, when
+    configured, hand the transfer off to the front server
+    """
+    path = safe_join(upload_dir(), filename)
+    meta = path and stat_upload(path)
+    if not meta:
+        abort(404)
+
+    size, mtime, mimetype = meta
+    hashed = HASHED_NAME.match(filename)
+    accel_prefix = current_app.config['IMAGE_ACCEL_REDIRECT']
+
+    if accel_prefix:
+        response = Response(mimetype=mimetype)
+        response.headers['X-Accel-Redirect'] = accel_prefix.rstrip('/') + '/' + filename
+    elif current_app.config['USE_X_SENDFILE']:
+        response = Response(mimetype=mimetype)
+        response.headers['X-Sendfile'] = path
+    else:
+        try:
+            file = open(path, 'rb')
+        except FileNotFoundError:
+            stat_cache.delete(path)
+            abort(404)
+
+        response = Response(
+            wrap_file(request.environ, file),
+            mimetype=mimetype,
+            direct_passthrough=True
+        )
+        response.content_length = size
+
+    response.last_modified = mtime
+    response.set_etag(hashed.group(0).split('.')[0] if hashed else f'{int(mtime)}-{size}')
+    response.headers['Cache-Control'] = (
+        IMMUTABLE_CACHE_CONTROL if hashed else current_app.config['IMAGE_CACHE_CONTROL']
+    )
+
+    offloaded = not response.direct_passthrough
+    response = response.make_conditional(
+        request.environ,
+        accept_ranges=not offloaded,
+        complete_length=None if offloaded else size
+    )
+    if response.status_code == 304:
+        response.headers.pop('X-Sendfile', None)
+        response.headers.pop('X-Accel-Redirect', None)
+
+    return response
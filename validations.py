@@ -1,9 +1,25 @@
-from pydantic import BaseModel
+from functools import lru_cache
+from flask import (
+    abort,
+    request
+)
+from pydantic import (
+    BaseModel,
+    TypeAdapter,
+    ValidationError
+)
 from typing import (
+    Any,
     Dict,
-    Type
+    List,
+    Type,
+    Tuple,
+    TypeVar,
+    Optional
 )
 
+Schema = TypeVar('Schema', bound=BaseModel)
+
 
 class LoginSchema(BaseModel):
     email: str
@@ -14,17 +30,17 @@ class LoginSchema(BaseModel):
 
 
 class ProjectSchema(BaseModel):
-    url: str = None
-    name: str = None
-    description: str = None
+    url: Optional[str] = None
+    name: Optional[str] = None
+    description: Optional[str] = None
 
     class Config:
         extra = "forbid"
 
 
 class CompanySchema(BaseModel):
-    name: str = None
-    description: str = None
+    name: Optional[str] = None
+    description: Optional[str] = None
 
     class Config:
         extra = "forbid"
@@ -33,14 +49,71 @@ class CompanySchema(BaseModel):
 class PasswordSchema(BaseModel):
     new_password: str
     current_password: str
-    repeat_password: str = None
+    repeat_password: Optional[str] = None
 
     class Config:
         extra = "forbid"
 
 
-def validate_input(schema_type: Type[BaseModel], **input: Dict) -> bool:
+@lru_cache(maxsize=None)
+def adapter(schema_type: Type[Schema]) -> TypeAdapter:
+    return TypeAdapter(schema_type)
+
+
+@lru_cache(maxsize=None)
+def list_adapter(schema_type: Type[Schema]) -> TypeAdapter:
+    return TypeAdapter(List[schema_type])
+
+
+def validate(schema_type: Type[Schema], data: Any) -> Optional[Schema]:
+    """
+    Return data parsed into schema_type, or None when it does not fit
+    """
+    try:
+        return adapter(schema_type).validate_python(data)
+    except ValidationError:
+        return None
+
+
+def validate_items(schema_type: Type[Schema], items: List[Any]) -> Tuple[List[Schema], Dict[int, str]]:
+    """
+    Parse a list of items in one call. Return the parsed items, or the
+    error of every invalid item keyed by its index
+    """
     try:
-        return bool(schema_type(**input))
-    except ValueError as _:
-        return False
+        return list_adapter(schema_type).validate_python(items), {}
+    except ValidationError as err:
+        return [], {error['loc'][0]: 'invalid input' for error in err.errors()}
+
+
+def request_data() -> Dict:
+    """
+    Return the JSON object or the form fields sent in the request body
+    """
+    if not request.is_json:
+        return request.form.to_dict()
+
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        abort(422)
+
+    return data
+
+
+def bind(schema_type: Type[Schema]) -> Schema:
+    """
+    Parse the request body into schema_type, aborting with 422 when it
+    does not fit
+    """
+    schema = validate(schema_type, request_data())
+    if schema is None:
+        abort(422)
+
+    return schema
+
+
+def bind_fields(schema_type: Type[Schema]) -> Dict:
+    """
+    Return the fields the request body sets, parsed with schema_type
+    """
+    return bind(schema_type).model_dump(exclude_unset=True, exclude_none=True)